@@ -1,23 +1,400 @@
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, has_app_context, jsonify, request, render_template, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func, literal, or_, select
+from sqlalchemy.exc import SQLAlchemyError
 from configdb import Config
-from models_auto import Base, Customers, Services, Supplies, Record, ServicesSupplies
+from replicas import ReplicaRouter, RoutingSession
+from dbpool import MonitoredPoolMixin, install_statement_timeout
+from models_auto import Customers, Services, Supplies, Record, ServicesSupplies, SupplyLedger
+from schema import inspect_schema, upgrade_schema
+from cache import Snapshot, create_cache
+from metrics import Instrumentation
+from jsonprovider import create_json_provider
+from compression import Compressor
+from static_assets import StaticFingerprints
+from finance import ROLLUP_PERIODS, build_finance_report, build_period_expenses, chart_data, get_period_bounds
+from bulk import BULK_ENTITIES, apply_bulk
+from exports import EXPENSE_EXPORT_COLUMNS, RECORD_EXPORT_COLUMNS, csv_stream, iter_record_rows, ndjson_stream
+from report_cache import ReportCache
+from pagination import DEFAULT_PAGE_SIZE, PaginationError, keyset_page, parse_date, parse_limit, parse_sort
+from importer import IMPORT_CHUNK_SIZE, IMPORT_FORMATS, DataImportError, import_data
+from events import create_event_broker, event_stream, parse_last_event_id
+from schedule import (ScheduleConflict, ScheduleError, check_schedule, free_slots, parse_duration, refresh_schedule,
+                      sync_record_schedule)
+from customer_search import (SearchError, apply_search_columns, parse_search_limit, refresh_search_columns,
+                             search_customers)
+from inventory import (InventoryError, adjust_stock, backfill_ledger, check_inventory, period_usage, rebuild_inventory,
+                       set_min_level, stock_levels, sync_record_consumption)
+from rollup import (check_rollup, rebuild_rollup, record_rollup_key, refresh_rollup, reprice_rollup,
+                    service_material_costs, service_prices, services_using_supply)
+from customer_analytics import AnalyticsError, customer_analytics, parse_analytics_params
+from snapshots import (SnapshotWorker, invalidate_snapshots, is_snapshot_window, read_snapshot, refresh_snapshots,
+                       store_snapshot)
+import click
 import datetime
+import logging
+import time
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.json = create_json_provider(app, app.config['JSON_PROVIDER'])
+# Сжатие регистрируется первым: обработчики after_request вызываются в обратном порядке, и оно выполняется последним
+if app.config['COMPRESS_MIN_SIZE']:
+    Compressor(app.config['COMPRESS_MIN_SIZE'], app.config['COMPRESS_GZIP_LEVEL'],
+               app.config['COMPRESS_BROTLI_QUALITY']).init_app(app)
+StaticFingerprints(app.config['STATIC_MAX_AGE']).init_app(app)
 CORS(app)
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+with app.app_context():
+    MonitoredPoolMixin.slow_checkout = app.config['DB_POOL_SLOW_CHECKOUT_MS'] / 1000
+    if app.config['DB_PGBOUNCER'] and app.config['DB_STATEMENT_TIMEOUT'] and db.engine.dialect.name == 'postgresql':
+        for engine in db.engines.values():
+            install_statement_timeout(engine, app.config['DB_STATEMENT_TIMEOUT'])
+# Отчеты, списки и выгрузки читают с реплик (DB_REPLICA_URLS), запись и все остальное - с основной базы
+replica_router = ReplicaRouter(app.config['DB_REPLICA_LAG'])
+replica_router.init_app(app, db)
+
+instrumentation = None
+if app.config['METRICS_ENABLED']:
+    instrumentation = Instrumentation(app.config['SLOW_QUERY_MS'])
+    with app.app_context():
+        instrumentation.init_app(app, db.engine)
+catalog_cache = create_cache(app.config)
+report_cache = ReportCache(app.config['FINANCE_CACHE_SIZE'], backend=catalog_cache.backend,
+                           ttl=app.config['FINANCE_CACHE_TTL'])
+event_broker = create_event_broker(app.config, lambda obj: app.json.dumps(obj)) if app.config['EVENTS_ENABLED'] else None
+logger = logging.getLogger(__name__)
+
+
+schema_status = {'ready': False, 'mode': None}
+
+
+# Инициализация базы данных (один раз при старте, а не на каждый запрос)
+def init_schema(mode=None):
+    mode = mode or app.config['SCHEMA_BOOTSTRAP']
+    schema_status['mode'] = mode
+
+    if mode == 'off':
+        schema_status.update({'ready': True})
+        return schema_status
+
+    with app.app_context():
+        try:
+            if mode == 'upgrade':
+                schema_status.update(upgrade_schema(db.engine))
+                # Свертка только что создана - заполняем ее по существующим записям
+                if 'daily_service_rollup' in schema_status['created_tables']:
+                    rebuild_rollup(db.session)
+                    db.session.commit()
+                # Складской журнал только что создан - проводим списание по уже существующим записям
+                if 'supply_ledger' in schema_status['created_tables']:
+                    backfill_ledger(db.session)
+                    db.session.commit()
+                # Ключи поиска клиентов только что добавлены - заполняем их для существующих клиентов
+                if 'customers' in schema_status['created_tables'] or \
+                        'customers.search_name' in schema_status['added_columns']:
+                    refresh_search_columns(db.session)
+                    db.session.commit()
+                # Конец интервала записи только что добавлен - считаем его по длительности услуг
+                if 'record' in schema_status['created_tables'] or \
+                        'record.end_date' in schema_status['added_columns']:
+                    refresh_schedule(db.session, app.config['SCHEDULE_DEFAULT_DURATION'])
+                    db.session.commit()
+            else:
+                schema_status.update(inspect_schema(db.engine))
+            schema_status.pop('error', None)
+        except SQLAlchemyError as e:
+            schema_status.update({'ready': False, 'error': str(e)})
+
+    return schema_status
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Создает или обновляет таблицы и индексы."""
+    status = init_schema('upgrade')
+    print('Схема готова' if status['ready'] else f'Схема не готова: {status}')
+    if not status['ready']:
+        return
+    # Колонки, добавленные вручную SQL-миграциями (migrations/), заполняются здесь
+    customers = refresh_search_columns(db.session)
+    ends = refresh_schedule(db.session, app.config['SCHEDULE_DEFAULT_DURATION'])
+    db.session.commit()
+    print(f'Заполнены ключи поиска клиентов: {customers}')
+    print(f'Рассчитан конец записей: {ends}')
+
+
+@app.cli.command('rollup-rebuild')
+def rollup_rebuild_command():
+    """Перестраивает дневную свертку выручки и расходов."""
+    rows = rebuild_rollup(db.session)
+    db.session.commit()
+    print(f'Свертка перестроена: {rows} строк')
+
+
+@app.cli.command('rollup-check')
+def rollup_check_command():
+    """Сверяет дневную свертку с исходными записями."""
+    mismatches = check_rollup(db.session)
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f'Расхождений: {len(mismatches)}')
+    if mismatches:
+        raise SystemExit(1)
+
+
+@app.cli.command('import-data')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), help='Формат источника (по умолчанию - по расширению)')
+@click.option('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Строк в одной транзакции')
+@click.option('--source', help='Ключ источника для продолжения импорта (по умолчанию - путь к файлу)')
+@click.option('--restart', is_flag=True, help='Начать импорт заново, забыв сохраненный прогресс')
+def import_data_command(path, fmt, chunk_size, source, restart):
+    """Загружает клиентов, услуги, материалы, нормы расхода и записи из дампа pg_dump, CSV или XLSX."""
+    started = time.monotonic()
+    try:
+        stats = import_data(db.session, path, fmt=fmt, source=source, chunk_size=chunk_size,
+                            restart=restart, log=print)
+    except DataImportError as e:
+        print(f'Импорт прерван: {e}')
+        print('Повторный запуск продолжит с последней сохраненной пачки')
+        raise SystemExit(1)
+
+    rows = rebuild_rollup(db.session)
+    posted = backfill_ledger(db.session)
+    refresh_search_columns(db.session)
+    refresh_schedule(db.session, app.config['SCHEDULE_DEFAULT_DURATION'])
+    invalidate_snapshots(db.session)
+    db.session.commit()
+    for table_name, table_stats in stats.items():
+        print(f'{table_name}: {table_stats}')
+    print(f'Свертка перестроена: {rows} строк')
+    print(f'Списание материалов по загруженным записям: {posted} проводок')
+    seconds = time.monotonic() - started
+    records = stats.get('record', {}).get('read', 0)
+    print(f'Импорт занял {seconds:.1f} с' + (f', записей в секунду: {records / seconds:.0f}' if records else ''))
+
+
+@app.cli.command('inventory-rebuild')
+def inventory_rebuild_command():
+    """Пересчитывает остатки и дневной расход материалов по складскому журналу."""
+    posted = backfill_ledger(db.session)
+    stats = rebuild_inventory(db.session)
+    db.session.commit()
+    print(f'Проведено списаний по записям без журнала: {posted}')
+    print(f"Остатки пересчитаны: {stats['supplies']} материалов, {stats['usage_rows']} строк расхода по дням")
+
+
+@app.cli.command('inventory-check')
+def inventory_check_command():
+    """Сверяет остатки и дневной расход материалов со складским журналом."""
+    mismatches = check_inventory(db.session)
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f'Расхождений: {len(mismatches)}')
+    if mismatches:
+        raise SystemExit(1)
+
+
+@app.cli.command('schedule-check')
+@click.option('--start', 'start', required=True, help='Первый день, YYYY-MM-DD')
+@click.option('--days', type=int, default=31, show_default=True)
+def schedule_check_command(start, days):
+    """Находит записи, которые пересекаются по времени (например, в загруженной истории)."""
+    start = datetime.datetime.strptime(start, '%Y-%m-%d')
+    overlaps = check_schedule(db.session, start, start + datetime.timedelta(days=days),
+                              app.config['SCHEDULE_DEFAULT_DURATION'])
+    for first_id, second_id in overlaps:
+        print(f'Запись {second_id} пересекается с записью {first_id}')
+    print(f'Пересечений: {len(overlaps)}')
+    if overlaps:
+        raise SystemExit(1)
+
+
+@app.cli.command('finance-snapshots')
+@click.option('--loop', is_flag=True, help='Перестраивать постоянно, раз в FINANCE_SNAPSHOT_INTERVAL секунд')
+@click.option('--force', is_flag=True, help='Перестроить все снимки, даже свежие')
+def finance_snapshots_command(loop, force):
+    """Строит снимки финансовых отчетов за текущие и прошлые день, месяц и год."""
+    while True:
+        print(f'Снимков перестроено: {refresh_finance_snapshots(force)}')
+        if not loop:
+            break
+        time.sleep(app.config['FINANCE_SNAPSHOT_INTERVAL'])
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    # Схему могли обновить командой "flask init-db" уже после старта воркера
+    if not schema_status['ready'] and schema_status['mode'] == 'check':
+        init_schema('check')
+    return jsonify({'schema': schema_status}), 200 if schema_status['ready'] else 503
+
+
+# Метрики текущего воркера в текстовом формате Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if instrumentation is None:
+        return jsonify({'error': 'Метрики выключены (METRICS_ENABLED=1)'}), 404
+    if not app.config['METRICS_ALLOW_REMOTE'] and request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({'error': 'Метрики доступны только локально'}), 403
+    return Response(instrumentation.render(), mimetype='text/plain; version=0.0.4')
+
+
+# Состояние пула соединений текущего воркера
+@app.route('/health/pool', methods=['GET'])
+def pool_stats():
+    # Через сессию, а не db.engine: в ASGI-режиме (asgi.py) запросы идут через асинхронный движок
+    pool = db.session.get_bind().pool
+    if not isinstance(pool, MonitoredPoolMixin):
+        return jsonify({'pool': type(pool).__name__, 'status': pool.status()})
+    return jsonify(pool.stats())
+
+
+@app.route('/health/replicas', methods=['GET'])
+def replicas_stats():
+    return jsonify(dict(replica_router.stats(), enabled=replica_router.enabled))
+
+
+@app.route('/health/cache', methods=['GET'])
+def cache_stats():
+    return jsonify({'catalog': catalog_cache.stats(), 'finance_report': report_cache.stats(),
+                    'finance_snapshots': snapshot_worker.stats if snapshot_worker else None})
+
+
+# Поток изменений записей (Server-Sent Events). Соединение держится открытым, поэтому под gunicorn
+# нужны потоковые воркеры (gthread/gevent) или ASGI-вход (asgi.py обслуживает /events без потока на клиента)
+@app.route('/events', methods=['GET'])
+def events():
+    if event_broker is None:
+        return jsonify({'error': 'Поток событий выключен (EVENTS_ENABLED=1)'}), 404
+    last_event_id = parse_last_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    response = Response(event_stream(event_broker, last_event_id, app.config['EVENTS_HEARTBEAT']),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # nginx не должен буферизовать поток
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/health/events', methods=['GET'])
+def events_stats():
+    if event_broker is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(event_broker.stats(), enabled=True))
+
+
+# Справочники услуг, материалов и норм расхода: маленькие и редко меняются, читаем через кэш
+class CachedCatalog:
+    # Справочник попадает в общий кэш, поэтому загружается с основной базы, даже если запрос читает с реплики
+    def snapshot(self, key):
+        return catalog_cache.get(key, lambda: self._load(key))
+
+    def _load(self, key):
+        with replica_router.primary():
+            return Snapshot(getattr(self, f'_load_{key}')())
+
+    def services(self):
+        return self.snapshot('services').items
+
+    def supplies(self):
+        return self.snapshot('supplies').items
+
+    def services_supplies(self):
+        return self.snapshot('services_supplies').items
+
+    @staticmethod
+    def _load_services():
+        return [{
+            'ID': s.ID,
+            'name': s.name,
+            'price': s.price,
+            'duration': s.duration
+        } for s in db.session.query(Services).order_by(Services.ID)]
+
+    @staticmethod
+    def _load_supplies():
+        return [{
+            'ID': s.ID,
+            'name': s.name,
+            'price': s.price
+        } for s in db.session.query(Supplies).order_by(Supplies.ID)]
+
+    @staticmethod
+    def _load_services_supplies():
+        return [{
+            'ID': ss.ID,
+            'id_services': ss.id_services,
+            'id_supplies': ss.id_supplies,
+            'material_consumption': ss.material_consumption,
+            'units_measurement': ss.units_measurement
+        } for ss in db.session.query(ServicesSupplies).order_by(ServicesSupplies.ID)]
+
+
+catalog = CachedCatalog()
 
 
-# Инициализация базы данных
-@app.before_request
-def create_tables():
-    Base.metadata.create_all(db.engine)
+# Снимки финансовых отчетов (snapshots.py): перестраиваются отдельным процессом
+# "flask finance-snapshots --loop" или, при FINANCE_SNAPSHOT_WORKER=1, фоновым потоком веб-процесса
+def build_snapshot_payload(period, base_date):
+    payload = build_finance_report(db.session, base_date, period, 'revenue',
+                                   use_rollup=app.config['FINANCE_USE_ROLLUP'], catalog=catalog)
+    payload.pop('chartData')
+    return app.json.dumps(payload)
+
+
+def refresh_finance_snapshots(force=False):
+    with app.app_context():
+        return refresh_snapshots(db.session, build_snapshot_payload, app.config['FINANCE_SNAPSHOT_MAX_AGE'],
+                                 datetime.datetime.now(), force=force)
+
+
+snapshot_worker = None
+if app.config['FINANCE_SNAPSHOTS'] and app.config['FINANCE_SNAPSHOT_WORKER']:
+    snapshot_worker = SnapshotWorker(refresh_finance_snapshots, app.config['FINANCE_SNAPSHOT_INTERVAL'])
+
+
+# Вызывается кэшем отчетов после сохраненных изменений; без дат сбрасываются все снимки.
+# Кэш сбрасывают и вне запросов (команды, бенчмарки) - тогда нужен свой контекст приложения.
+def invalidate_finance_snapshots(dates):
+    if not has_app_context():
+        with app.app_context():
+            return invalidate_finance_snapshots(dates)
+    try:
+        with replica_router.primary():
+            invalidate_snapshots(db.session, dates)
+            db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        # Снимок без сброса устареет сам не позже чем через FINANCE_SNAPSHOT_MAX_AGE
+        logger.exception('Не удалось сбросить снимки финансовых отчетов')
+        return
+    if snapshot_worker:
+        snapshot_worker.wake()
+
+
+if app.config['FINANCE_SNAPSHOTS']:
+    report_cache.add_listener(invalidate_finance_snapshots)
+
+
+# Справочник с ETag и Last-Modified: если данные не менялись, клиент получает 304 без тела
+def catalog_response(key):
+    snapshot = catalog.snapshot(key)
+    response = jsonify(snapshot.items)
+    response.set_etag(snapshot.etag)
+    response.last_modified = snapshot.last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 # Страницы
+@app.context_processor
+def page_settings():
+    return {'events_enabled': event_broker is not None}
+
+
 @app.route('/')
 @app.route('/records-page')
 def records_page():
@@ -44,18 +421,74 @@ def finance_page():
     return render_template('finance.html')
 
 
+# Постраничная выдача: без limit/cursor возвращается весь список (как раньше), иначе страница и курсор
+def list_response(query, sort_columns, default_sort, to_dict, datetime_sorts=()):
+    args = request.args
+    try:
+        sort_name, sort_column, descending = parse_sort(args.get('sort'), sort_columns, default_sort)
+        limit = parse_limit(args.get('limit'))
+        cursor = args.get('cursor')
+
+        if limit is None and not cursor:
+            if args.get('sort'):
+                query = query.order_by(sort_column.desc() if descending else sort_column.asc())
+            return jsonify([to_dict(row) for row in query.all()])
+
+        id_column = sort_columns['ID']
+        rows, next_cursor = keyset_page(
+            query, sort_column, id_column, descending, limit or DEFAULT_PAGE_SIZE, cursor,
+            row_key=lambda row: [getattr(row, sort_column.key), row.ID],
+            is_datetime=sort_name in datetime_sorts
+        )
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'items': [to_dict(row) for row in rows], 'next_cursor': next_cursor})
+
+
+# Списки выбирают только нужные колонки (без сборки ORM-объектов): строка сразу превращается в dict,
+# даты сериализует JSON-провайдер
+def row_to_dict(row):
+    return row._asdict()
+
+
 # Клиенты
+CUSTOMER_SORT_COLUMNS = {'ID': Customers.ID, 'surname': Customers.surname}
+CUSTOMER_COLUMNS = (Customers.ID, Customers.surname, Customers.name, Customers.patronymic, Customers.phone)
+
+
 @app.route('/customers', methods=['GET', 'POST'])
+@replica_router.read_replica
 def handle_customers():
     if request.method == 'GET':
-        customers = db.session.query(Customers).all()
-        return jsonify([{
-            'ID': c.ID,
-            'surname': c.surname,
-            'name': c.name,
-            'patronymic': c.patronymic,
-            'phone': c.phone
-        } for c in customers])
+        query = db.session.query(*CUSTOMER_COLUMNS)
+
+        search = request.args.get('q')
+        if search:
+            pattern = f'%{search}%'
+            query = query.filter(or_(
+                Customers.surname.ilike(pattern),
+                Customers.name.ilike(pattern),
+                Customers.patronymic.ilike(pattern),
+                Customers.phone.ilike(pattern)
+            ))
+
+        # Клиенты, у которых есть записи в указанном периоде
+        try:
+            date_from = parse_date(request.args.get('date_from'))
+            date_to = parse_date(request.args.get('date_to'), end_of_day=True)
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if date_from or date_to:
+            visits = db.session.query(Record.ID).filter(Record.id_customers == Customers.ID)
+            if date_from:
+                visits = visits.filter(Record.date >= date_from)
+            if date_to:
+                visits = visits.filter(Record.date <= date_to)
+            query = query.filter(visits.exists())
+
+        return list_response(query, CUSTOMER_SORT_COLUMNS, 'ID', row_to_dict)
 
     elif request.method == 'POST':
         data = request.json
@@ -65,11 +498,106 @@ def handle_customers():
             patronymic=data.get('patronymic'),
             phone=data.get('phone')
         )
+        apply_search_columns(new_customer)
         db.session.add(new_customer)
         db.session.commit()
         return jsonify({'message': 'Клиент добавлен', 'ID': new_customer.ID}), 201
 
 
+# Быстрый поиск клиента на ресепшене: по началу ФИО или по цифрам телефона, лучшие совпадения первыми
+@app.route('/customers/search', methods=['GET'])
+@replica_router.read_replica
+def search_customers_route():
+    try:
+        limit = parse_search_limit(request.args.get('limit'))
+    except SearchError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(search_customers(db.session, request.args.get('q', ''), limit))
+
+
+# Клиенты с количеством визитов и датой последнего визита (один сгруппированный запрос)
+NO_VISITS_DATE = datetime.datetime(1900, 1, 1)
+
+
+def customer_summary_to_dict(c):
+    return {
+        'ID': c.ID,
+        'surname': c.surname,
+        'name': c.name,
+        'patronymic': c.patronymic,
+        'phone': c.phone,
+        'visits_count': c.visits_count or 0,
+        'last_visit': c.last_visit
+    }
+
+
+@app.route('/customers/summary', methods=['GET'])
+@replica_router.read_replica
+def get_customers_summary():
+    try:
+        date_from = parse_date(request.args.get('date_from'))
+        date_to = parse_date(request.args.get('date_to'), end_of_day=True)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    visits = select(
+        Record.id_customers,
+        func.count(Record.ID).label('visits_count'),
+        func.max(Record.date).label('last_visit')
+    ).group_by(Record.id_customers).subquery()
+
+    # Клиенты без визитов сортируются как самые давние
+    last_visit_sort = func.coalesce(visits.c.last_visit, literal(NO_VISITS_DATE, Record.date.type)).label('last_visit_sort')
+
+    query = db.session.query(
+        Customers.ID,
+        Customers.surname,
+        Customers.name,
+        Customers.patronymic,
+        Customers.phone,
+        visits.c.visits_count,
+        visits.c.last_visit,
+        last_visit_sort
+    ).outerjoin(visits, visits.c.id_customers == Customers.ID)
+
+    search = request.args.get('q')
+    if search:
+        pattern = f'%{search}%'
+        query = query.filter(or_(
+            Customers.surname.ilike(pattern),
+            Customers.name.ilike(pattern),
+            Customers.patronymic.ilike(pattern),
+            Customers.phone.ilike(pattern)
+        ))
+
+    # Клиенты, у которых есть записи в указанном периоде
+    if date_from or date_to:
+        period_visits = select(Record.ID).where(Record.id_customers == Customers.ID)
+        if date_from:
+            period_visits = period_visits.where(Record.date >= date_from)
+        if date_to:
+            period_visits = period_visits.where(Record.date <= date_to)
+        query = query.filter(period_visits.exists())
+
+    sort_columns = dict(CUSTOMER_SORT_COLUMNS, last_visit=last_visit_sort)
+    return list_response(query, sort_columns, '-last_visit', customer_summary_to_dict, datetime_sorts=('last_visit',))
+
+
+# Аналитика клиентов: траты, частота и давность визитов, любимые услуги, структура выручки по услугам
+@app.route('/analytics/customers', methods=['GET'])
+@replica_router.read_replica
+def get_customer_analytics():
+    try:
+        date_from = parse_date(request.args.get('date_from'))
+        date_to = parse_date(request.args.get('date_to'), end_of_day=True)
+        params = parse_analytics_params(request.args)
+    except (PaginationError, AnalyticsError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(customer_analytics(db.session, params, date_from, date_to))
+
+
 @app.route('/customers/<int:customer_id>', methods=['GET', 'PUT', 'DELETE'])
 def handle_customer(customer_id):
     customer = db.session.query(Customers).filter(Customers.ID == customer_id).first()
@@ -92,8 +620,11 @@ def handle_customer(customer_id):
         customer.name = data.get('name', customer.name)
         customer.patronymic = data.get('patronymic', customer.patronymic)
         customer.phone = data.get('phone', customer.phone)
+        apply_search_columns(customer)
 
         db.session.commit()
+        # Имя клиента есть в деталях отчетов; правка клиента - редкая операция, сбрасываем все отчеты
+        report_cache.clear()
         return jsonify({'message': 'Клиент обновлен'})
 
     elif request.method == 'DELETE':
@@ -111,21 +642,22 @@ def handle_customer(customer_id):
 @app.route('/services', methods=['GET', 'POST'])
 def handle_services():
     if request.method == 'GET':
-        services = db.session.query(Services).all()
-        return jsonify([{
-            'ID': s.ID,
-            'name': s.name,
-            'price': s.price
-        } for s in services])
+        return catalog_response('services')
 
     elif request.method == 'POST':
         data = request.json
+        try:
+            duration = parse_duration(data.get('duration'))
+        except ScheduleError as e:
+            return jsonify({'error': str(e)}), 400
         new_service = Services(
             name=data.get('name'),
-            price=data.get('price')
+            price=data.get('price'),
+            duration=duration
         )
         db.session.add(new_service)
         db.session.commit()
+        catalog_cache.invalidate('services')
         return jsonify({'message': 'Услуга добавлена', 'ID': new_service.ID}), 201
 
 
@@ -140,15 +672,28 @@ def handle_service(service_id):
         return jsonify({
             'ID': service.ID,
             'name': service.name,
-            'price': service.price
+            'price': service.price,
+            'duration': service.duration
         })
 
     elif request.method == 'PUT':
         data = request.json
+        old_duration = service.duration
+        try:
+            if 'duration' in data:
+                service.duration = parse_duration(data['duration'])
+        except ScheduleError as e:
+            return jsonify({'error': str(e)}), 400
         service.name = data.get('name', service.name)
         service.price = data.get('price', service.price)
 
+        reprice_rollup(db.session, [service.ID])
+        if service.duration != old_duration:
+            db.session.flush()
+            refresh_schedule(db.session, app.config['SCHEDULE_DEFAULT_DURATION'], [service.ID])
         db.session.commit()
+        catalog_cache.invalidate('services')
+        report_cache.invalidate_services([service_id])
         return jsonify({'message': 'Услуга обновлена'})
 
     elif request.method == 'DELETE':
@@ -161,6 +706,7 @@ def handle_service(service_id):
 
         db.session.delete(service)
         db.session.commit()
+        catalog_cache.invalidate('services')
         return jsonify({'message': 'Услуга удалена'})
 
 
@@ -168,12 +714,7 @@ def handle_service(service_id):
 @app.route('/supplies', methods=['GET', 'POST'])
 def handle_supplies():
     if request.method == 'GET':
-        supplies = db.session.query(Supplies).all()
-        return jsonify([{
-            'ID': s.ID,
-            'name': s.name,
-            'price': s.price
-        } for s in supplies])
+        return catalog_response('supplies')
 
     elif request.method == 'POST':
         data = request.json
@@ -183,6 +724,7 @@ def handle_supplies():
         )
         db.session.add(new_supply)
         db.session.commit()
+        catalog_cache.invalidate('supplies')
         return jsonify({'message': 'Материал добавлен', 'ID': new_supply.ID}), 201
 
 
@@ -205,7 +747,11 @@ def handle_supply(supply_id):
         supply.name = data.get('name', supply.name)
         supply.price = data.get('price', supply.price)
 
+        affected_services = services_using_supply(db.session, supply.ID)
+        reprice_rollup(db.session, affected_services)
         db.session.commit()
+        catalog_cache.invalidate('supplies')
+        report_cache.invalidate_services(affected_services)
         return jsonify({'message': 'Материал обновлен'})
 
     elif request.method == 'DELETE':
@@ -217,21 +763,133 @@ def handle_supply(supply_id):
 
         db.session.delete(supply)
         db.session.commit()
+        catalog_cache.invalidate('supplies')
         return jsonify({'message': 'Материал удален'})
 
 
+# Склад: остатки материалов (low=1 - только дошедшие до порога), движение остатка, журнал и расход за период
+@app.route('/supplies/stock', methods=['GET'])
+def get_supplies_stock():
+    return jsonify(stock_levels(db.session, low_only=request.args.get('low') == '1'))
+
+
+def parse_quantity(data, field):
+    value = data.get(field)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise InventoryError(f'Поле {field} должно быть числом')
+
+
+# POST: quantity - поступление (> 0) или списание (< 0), on_hand - фактический остаток после
+# инвентаризации, min_level - порог заканчивающегося материала (null - без порога)
+@app.route('/supplies/<int:supply_id>/stock', methods=['GET', 'POST'])
+def handle_supply_stock(supply_id):
+    supply = db.session.query(Supplies.ID).filter(Supplies.ID == supply_id).first()
+
+    if not supply:
+        return jsonify({'error': 'Материал не найден'}), 404
+
+    if request.method == 'POST':
+        data = request.json
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Ожидается объект с полями quantity, on_hand или min_level'}), 400
+        try:
+            quantity = parse_quantity(data, 'quantity')
+            on_hand = parse_quantity(data, 'on_hand')
+            if quantity is None and on_hand is None and 'min_level' not in data:
+                raise InventoryError('Укажите quantity, on_hand или min_level')
+            if 'min_level' in data:
+                set_min_level(db.session, supply_id, parse_quantity(data, 'min_level'))
+            if quantity is not None or on_hand is not None:
+                adjust_stock(db.session, supply_id, quantity=quantity, on_hand=on_hand, comment=data.get('comment'))
+        except InventoryError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        db.session.commit()
+
+    return jsonify(stock_levels(db.session, supply_ids=[supply_id])[0])
+
+
+@app.route('/supplies/<int:supply_id>/ledger', methods=['GET'])
+@replica_router.read_replica
+def get_supply_ledger(supply_id):
+    query = db.session.query(
+        SupplyLedger.ID,
+        SupplyLedger.id_record,
+        SupplyLedger.day,
+        SupplyLedger.quantity,
+        SupplyLedger.cost,
+        SupplyLedger.kind,
+        SupplyLedger.comment,
+        SupplyLedger.created_at
+    ).filter(SupplyLedger.id_supplies == supply_id)
+    return list_response(query, {'ID': SupplyLedger.ID}, '-ID', row_to_dict)
+
+
+# Расход материалов за период (по цене на момент списания) из дневных итогов склада
+@app.route('/supplies/usage', methods=['GET'])
+@replica_router.read_replica
+def get_supplies_usage():
+    base_date, error = parse_report_date()
+    if error:
+        return error
+
+    period = request.args.get('period', 'day')
+    start_date, end_date = get_period_bounds(base_date, period)
+    return jsonify({
+        'period': {'start': start_date, 'end': end_date},
+        'items': period_usage(db.session, start_date, end_date)
+    })
+
+
 # Записи
+RECORD_SORT_COLUMNS = {'ID': Record.ID, 'date': Record.date}
+RECORD_COLUMNS = (Record.ID, Record.id_customers, Record.id_services, Record.date, Record.name)
+
+
+# Фильтры списка записей: период, клиент, услуга, поиск по названию и клиенту
+def filter_records(query, args):
+    date_from = parse_date(args.get('date_from'))
+    date_to = parse_date(args.get('date_to'), end_of_day=True)
+    if date_from:
+        query = query.filter(Record.date >= date_from)
+    if date_to:
+        query = query.filter(Record.date <= date_to)
+
+    customer_id = args.get('customer_id', type=int)
+    if customer_id is not None:
+        query = query.filter(Record.id_customers == customer_id)
+
+    service_id = args.get('service_id', type=int)
+    if service_id is not None:
+        query = query.filter(Record.id_services == service_id)
+
+    search = args.get('q')
+    if search:
+        pattern = f'%{search}%'
+        matching_customers = select(Customers.ID).where(or_(
+            Customers.surname.ilike(pattern),
+            Customers.name.ilike(pattern),
+            Customers.phone.ilike(pattern)
+        ))
+        query = query.filter(or_(Record.name.ilike(pattern), Record.id_customers.in_(matching_customers)))
+
+    return query
+
+
 @app.route('/records', methods=['GET', 'POST'])
+@replica_router.read_replica
 def handle_records():
     if request.method == 'GET':
-        records = db.session.query(Record).all()
-        return jsonify([{
-            'ID': r.ID,
-            'id_customers': r.id_customers,
-            'id_services': r.id_services,
-            'date': r.date.isoformat() if r.date else None,
-            'name': r.name
-        } for r in records])
+        try:
+            query = filter_records(db.session.query(*RECORD_COLUMNS), request.args)
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return list_response(query, RECORD_SORT_COLUMNS, 'ID', row_to_dict, datetime_sorts=('date',))
 
     elif request.method == 'POST':
         data = request.json
@@ -242,10 +900,152 @@ def handle_records():
             name=data.get('name')
         )
         db.session.add(new_record)
+        db.session.flush()
+        try:
+            sync_record_schedule(db.session, [new_record.ID], app.config['SCHEDULE_DEFAULT_DURATION'])
+        except ScheduleConflict as e:
+            db.session.rollback()
+            return schedule_conflict_response(e)
+        db.session.refresh(new_record)
+        refresh_rollup(db.session, [record_rollup_key(new_record)])
+        sync_record_consumption(db.session, [new_record.ID])
         db.session.commit()
+        report_cache.invalidate_dates([new_record.date])
+        publish_record_changes(changed_ids=[new_record.ID])
         return jsonify({'message': 'Запись добавлена', 'ID': new_record.ID}), 201
 
 
+# Время занято: 409 со списком записей, с которыми пересекается новая
+def schedule_conflict_response(error):
+    return jsonify({'error': str(error), 'conflicts': error.conflicts}), 409
+
+
+# Ближайшие свободные окна для услуги (по умолчанию - на неделю вперед от текущего момента)
+@app.route('/schedule/free', methods=['GET'])
+def get_free_slots():
+    service_id = request.args.get('service_id', type=int)
+    if service_id is None:
+        return jsonify({'error': 'Не указана услуга (service_id)'}), 400
+
+    now = datetime.datetime.now().replace(second=0, microsecond=0)
+    from_time = now
+    if request.args.get('date'):
+        base_date, error = parse_report_date()
+        if error:
+            return error
+        from_time = max(base_date, now)
+
+    try:
+        slots = free_slots(db.session, service_id, from_time,
+                           days=request.args.get('days', 7, type=int),
+                           limit=request.args.get('limit', 5, type=int),
+                           open_hour=app.config['SCHEDULE_OPEN_HOUR'],
+                           close_hour=app.config['SCHEDULE_CLOSE_HOUR'],
+                           step=app.config['SCHEDULE_SLOT_STEP'],
+                           default_duration=app.config['SCHEDULE_DEFAULT_DURATION'])
+    except ScheduleError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(slots)
+
+
+# Записи вместе с клиентом и услугой одним запросом (вместо склейки трех списков на странице)
+def records_details_query():
+    return db.session.query(
+        *RECORD_COLUMNS,
+        Customers.surname.label('customer_surname'),
+        Customers.name.label('customer_name'),
+        Customers.phone.label('customer_phone'),
+        Services.name.label('service_name'),
+        Services.price.label('service_price')
+    ). \
+        outerjoin(Customers, Record.id_customers == Customers.ID). \
+        outerjoin(Services, Record.id_services == Services.ID)
+
+
+@app.route('/records/details', methods=['GET'])
+@replica_router.read_replica
+def get_records_details():
+    try:
+        query = filter_records(records_details_query(), request.args)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return list_response(query, RECORD_SORT_COLUMNS, 'ID', row_to_dict, datetime_sorts=('date',))
+
+
+# События об изменении записей: строка как в /records/details, состояние до изменения (before),
+# вклад записи в выручку и расходы отчета и новые число визитов и последний визит клиентов
+def record_state(record):
+    return {
+        'ID': record.ID,
+        'id_customers': record.id_customers,
+        'id_services': record.id_services,
+        'date': record.date,
+        'name': record.name
+    }
+
+
+# Вклад записи в финансовый отчет: отчет учитывает только записи с датой, услугой и клиентом
+def add_finance_contribution(rows):
+    service_ids = {row['id_services'] for row in rows if row['id_services'] is not None}
+    customer_ids = {row['id_customers'] for row in rows if row['id_customers'] is not None}
+    prices = service_prices(db.session, service_ids) if service_ids else {}
+    costs = service_material_costs(db.session, service_ids) if service_ids else {}
+    customers = set(db.session.scalars(select(Customers.ID).where(Customers.ID.in_(customer_ids)))) \
+        if customer_ids else set()
+
+    for row in rows:
+        row['in_report'] = bool(row['date']) and row['id_services'] in prices and row['id_customers'] in customers
+        row['revenue'] = prices[row['id_services']] if row['in_report'] else 0
+        row['material_cost'] = costs.get(row['id_services'], 0) if row['in_report'] else 0
+    return rows
+
+
+def customer_visits(customer_ids):
+    customer_ids = {customer_id for customer_id in customer_ids if customer_id is not None}
+    if not customer_ids:
+        return []
+    visits = {customer_id: (count, last_visit) for customer_id, count, last_visit in db.session.query(
+        Record.id_customers, func.count(Record.ID), func.max(Record.date)
+    ).filter(Record.id_customers.in_(customer_ids)).group_by(Record.id_customers)}
+    return [{'ID': customer_id, 'visits_count': visits.get(customer_id, (0, None))[0],
+             'last_visit': visits.get(customer_id, (0, None))[1]} for customer_id in sorted(customer_ids)]
+
+
+# Публикуется после commit: ошибка рассылки (например, недоступен Redis) не отменяет сохраненное изменение
+def publish_record_changes(before=None, changed_ids=(), deleted_ids=()):
+    if event_broker is None:
+        return
+    try:
+        before = before or {}
+        # Без подписчиков подробности не собираются: страница, переподключившись с Last-Event-ID,
+        # получит records.reload из истории и загрузит данные заново
+        if not event_broker.has_listeners() or \
+                len(set(before) | set(changed_ids)) > app.config['EVENTS_BULK_LIMIT']:
+            event_broker.publish({'type': 'records.reload'})
+            return
+
+        after = {}
+        if changed_ids:
+            rows = [row_to_dict(row) for row in records_details_query().filter(Record.ID.in_(changed_ids))]
+            after = {row['ID']: row for row in add_finance_contribution(rows)}
+        add_finance_contribution(list(before.values()))
+        visits = {c['ID']: c for c in customer_visits(
+            [row['id_customers'] for row in list(before.values()) + list(after.values())])}
+
+        for record_id in list(changed_ids) + list(deleted_ids):
+            record, old = after.get(record_id), before.get(record_id)
+            if record_id in deleted_ids:
+                event_type = 'record.deleted'
+            else:
+                event_type = 'record.updated' if old else 'record.created'
+            customer_ids = {row['id_customers'] for row in (record, old) if row and row['id_customers'] in visits}
+            event_broker.publish({'type': event_type, 'ID': record_id, 'record': record, 'before': old,
+                                  'customers': [visits[c] for c in sorted(customer_ids)]})
+    except Exception:
+        logger.exception('Не удалось разослать событие об изменении записей')
+
+
 @app.route('/records/<int:record_id>', methods=['GET', 'PUT', 'DELETE'])
 def handle_record(record_id):
     record = db.session.query(Record).filter(Record.ID == record_id).first()
@@ -264,17 +1064,39 @@ def handle_record(record_id):
 
     elif request.method == 'PUT':
         data = request.json
+        old_key = record_rollup_key(record)
+        old_date = record.date
+        before = {record.ID: record_state(record)}
         record.id_customers = data.get('id_customers', record.id_customers)
         record.id_services = data.get('id_services', record.id_services)
         record.date = data.get('date', record.date)
         record.name = data.get('name', record.name)
 
+        db.session.flush()
+        try:
+            sync_record_schedule(db.session, [record_id], app.config['SCHEDULE_DEFAULT_DURATION'], before)
+        except ScheduleConflict as e:
+            db.session.rollback()
+            return schedule_conflict_response(e)
+        db.session.refresh(record)
+        refresh_rollup(db.session, [old_key, record_rollup_key(record)])
+        sync_record_consumption(db.session, [record_id])
         db.session.commit()
+        report_cache.invalidate_dates([old_date, record.date])
+        publish_record_changes(before, changed_ids=[record_id])
         return jsonify({'message': 'Запись обновлена'})
 
     elif request.method == 'DELETE':
+        old_key = record_rollup_key(record)
+        old_date = record.date
+        before = {record.ID: record_state(record)}
         db.session.delete(record)
+        db.session.flush()
+        refresh_rollup(db.session, [old_key])
+        sync_record_consumption(db.session, [record_id])
         db.session.commit()
+        report_cache.invalidate_dates([old_date])
+        publish_record_changes(before, deleted_ids=[record_id])
         return jsonify({'message': 'Запись удалена'})
 
 
@@ -282,14 +1104,7 @@ def handle_record(record_id):
 @app.route('/services_supplies', methods=['GET', 'POST'])
 def handle_services_supplies():
     if request.method == 'GET':
-        services_supplies = db.session.query(ServicesSupplies).all()
-        return jsonify([{
-            'ID': ss.ID,
-            'id_services': ss.id_services,
-            'id_supplies': ss.id_supplies,
-            'material_consumption': ss.material_consumption,
-            'units_measurement': ss.units_measurement
-        } for ss in services_supplies])
+        return catalog_response('services_supplies')
 
     elif request.method == 'POST':
         data = request.json
@@ -300,7 +1115,11 @@ def handle_services_supplies():
             units_measurement=data.get('units_measurement')
         )
         db.session.add(new_service_supply)
+        db.session.flush()
+        reprice_rollup(db.session, [new_service_supply.id_services])
         db.session.commit()
+        catalog_cache.invalidate('services_supplies')
+        report_cache.invalidate_services([new_service_supply.id_services])
         return jsonify({'message': 'Расход материала добавлен', 'ID': new_service_supply.ID}), 201
 
 
@@ -322,234 +1141,212 @@ def handle_service_supply(service_supply_id):
 
     elif request.method == 'PUT':
         data = request.json
+        old_service_id = service_supply.id_services
         service_supply.id_services = data.get('id_services', service_supply.id_services)
         service_supply.id_supplies = data.get('id_supplies', service_supply.id_supplies)
         service_supply.material_consumption = data.get('material_consumption', service_supply.material_consumption)
         service_supply.units_measurement = data.get('units_measurement', service_supply.units_measurement)
 
+        db.session.flush()
+        reprice_rollup(db.session, [old_service_id, service_supply.id_services])
         db.session.commit()
+        catalog_cache.invalidate('services_supplies')
+        report_cache.invalidate_services([old_service_id, service_supply.id_services])
         return jsonify({'message': 'Расходный материал обновлен'})
 
     elif request.method == 'DELETE':
         db.session.delete(service_supply)
+        db.session.flush()
+        service_id = service_supply.id_services
+        reprice_rollup(db.session, [service_id])
         db.session.commit()
+        catalog_cache.invalidate('services_supplies')
+        report_cache.invalidate_services([service_id])
         return jsonify({'message': 'Расходный материал удален'})
 
 
-# Финансовые отчеты
-@app.route('/finance/report', methods=['GET'])
-def get_finance_report():
+# Дата отчета из параметров запроса: (дата, None) или (None, ответ с ошибкой)
+def parse_report_date():
     date_str = request.args.get('date')
-    period = request.args.get('period', 'day')
-    report_type = request.args.get('type', 'revenue')
 
     if not date_str:
-        return jsonify({'error': 'Дата не указана'}), 400
+        return None, (jsonify({'error': 'Дата не указана'}), 400)
 
     try:
-        base_date = datetime.datetime.strptime(date_str, '%Y-%m-%d')
+        return datetime.datetime.strptime(date_str, '%Y-%m-%d'), None
     except ValueError:
-        return jsonify({'error': 'Неверный формат даты'}), 400
-
-    # Определяем период для фильтрации
-    if period == 'day':
-        start_date = base_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_date = base_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-    elif period == 'month':
-        start_date = base_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        next_month = base_date.replace(day=28) + datetime.timedelta(days=4)
-        end_date = next_month - datetime.timedelta(days=next_month.day)
-        end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-    elif period == 'year':
-        start_date = base_date.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-        end_date = base_date.replace(month=12, day=31, hour=23, minute=59, second=59, microsecond=999999)
-    else:
-        start_date = base_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_date = base_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    response_data = {
-        'summary': {
-            'revenue': 0,
-            'expenses': 0,
-            'profit': 0
-        },
-        'records': [],
-        'expenses': [],
-        'chartData': {
-            'labels': [],
-            'values': []
-        }
-    }
-
-    # Получаем записи за период
-    records = db.session.query(Record, Services, Customers). \
-        join(Services, Record.id_services == Services.ID). \
-        join(Customers, Record.id_customers == Customers.ID). \
-        filter(Record.date >= start_date, Record.date <= end_date).all()
-
-    # Рассчитываем выручку и собираем статистику по услугам
-    total_revenue = 0
-    records_data = []
-    service_stats = {}  # Считаем сколько раз каждая услуга была выполнена
-
-    for record, service, customer in records:
-        service_price = service.price or 0
-        total_revenue += service_price
-
-        # Собираем статистику по услугам
-        if service.ID not in service_stats:
-            service_stats[service.ID] = {
-                'service': service,
-                'count': 0,
-                'total_revenue': 0
-            }
-        service_stats[service.ID]['count'] += 1
-        service_stats[service.ID]['total_revenue'] += service_price
-
-        records_data.append({
-            'date': record.date.isoformat() if record.date else None,
-            'service_name': service.name,
-            'service_id': service.ID,
-            'client_name': f"{customer.surname or ''} {customer.name or ''}".strip(),
-            'price': service_price
-        })
-
-    # Получаем ВСЕ расходные материалы для услуг
-    services_supplies = db.session.query(ServicesSupplies, Services, Supplies). \
-        join(Services, ServicesSupplies.id_services == Services.ID). \
-        join(Supplies, ServicesSupplies.id_supplies == Supplies.ID). \
-        all()
-
-    total_expenses = 0
-    expenses_data = []
-
-    # Рассчитываем расходы с учетом количества выполненных услуг
-    for service_supply, service, supply in services_supplies:
-        # Получаем количество выполненных услуг за период
-        service_count = service_stats.get(service.ID, {}).get('count', 0)
-
-        # Рассчитываем стоимость материалов для ВСЕХ выполненных услуг этого типа
-        material_cost_per_service = (supply.price or 0) * (service_supply.material_consumption or 0)
-        total_material_cost = material_cost_per_service * service_count
-
-        total_expenses += total_material_cost
-
-        if service_count > 0:  # Добавляем только если услуга была выполнена
-            expenses_data.append({
-                'service_name': service.name,
-                'material_name': supply.name,
-                'consumption_per_service': service_supply.material_consumption or 0,
-                'total_consumption': (service_supply.material_consumption or 0) * service_count,
-                'unit': service_supply.units_measurement or 'шт',
-                'cost_per_service': material_cost_per_service,
-                'total_cost': total_material_cost,
-                'services_count': service_count
-            })
-
-    # Заполняем ответ
-    response_data['summary']['revenue'] = total_revenue
-    response_data['summary']['expenses'] = total_expenses
-    response_data['summary']['profit'] = total_revenue - total_expenses
-    response_data['records'] = records_data
-    response_data['expenses'] = expenses_data
-
-    # Генерируем данные для графика
-    chart_labels = []
-    chart_values = []
-
-    if period == 'day':
-        # Для дня - разбиваем по часам
-        for hour in range(0, 24):
-            hour_start = start_date.replace(hour=hour, minute=0, second=0, microsecond=0)
-            hour_end = start_date.replace(hour=hour, minute=59, second=59, microsecond=999999)
-
-            # Выручка по часам
-            hour_records = [r for r in records_data if r['date'] and
-                            hour_start <= datetime.datetime.fromisoformat(r['date'].replace('Z', '+00:00')) <= hour_end]
-            hour_revenue = sum(r['price'] for r in hour_records)
-
-            # Расходы по часам (распределяем пропорционально выручке)
-            if total_revenue > 0:
-                hour_expenses = total_expenses * (hour_revenue / total_revenue)
-            else:
-                hour_expenses = 0
-
-            hour_profit = hour_revenue - hour_expenses
-
-            chart_labels.append(f"{hour:02d}:00")
-
-            if report_type == 'revenue':
-                chart_values.append(hour_revenue)
-            elif report_type == 'expenses':
-                chart_values.append(hour_expenses)
-            else:  # profit
-                chart_values.append(hour_profit)
-
-    elif period == 'month':
-        # Для месяца - разбиваем по дням
-        current_date = start_date
-        while current_date <= end_date:
-            day_records = [r for r in records_data if r['date'] and
-                           datetime.datetime.fromisoformat(
-                               r['date'].replace('Z', '+00:00')).date() == current_date.date()]
-            day_revenue = sum(r['price'] for r in day_records)
-
-            # Расходы по дням (распределяем пропорционально выручке)
-            if total_revenue > 0:
-                day_expenses = total_expenses * (day_revenue / total_revenue)
-            else:
-                day_expenses = 0
-
-            day_profit = day_revenue - day_expenses
-
-            chart_labels.append(current_date.strftime('%d.%m'))
-
-            if report_type == 'revenue':
-                chart_values.append(day_revenue)
-            elif report_type == 'expenses':
-                chart_values.append(day_expenses)
-            else:  # profit
-                chart_values.append(day_profit)
-
-            current_date += datetime.timedelta(days=1)
-
-    elif period == 'year':
-        # Для года - разбиваем по месяцам
-        for month in range(1, 13):
-            month_date = base_date.replace(month=month, day=1)
-            next_month = month_date.replace(day=28) + datetime.timedelta(days=4)
-            month_end = next_month - datetime.timedelta(days=next_month.day)
-            month_end = month_end.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-            month_records = [r for r in records_data if r['date'] and
-                             month_date <= datetime.datetime.fromisoformat(
-                r['date'].replace('Z', '+00:00')) <= month_end]
-            month_revenue = sum(r['price'] for r in month_records)
+        return None, (jsonify({'error': 'Неверный формат даты'}), 400)
+
+
+# Пакетные операции: create/update/delete списками в одной транзакции
+@app.route('/<any(customers, services, supplies, records, services_supplies):entity_name>/bulk', methods=['POST'])
+def handle_bulk(entity_name):
+    payload = request.json
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Ожидается объект с полями create, update, delete'}), 400
+
+    result = apply_bulk(db.session, BULK_ENTITIES[entity_name], payload)
+    if result.errors:
+        db.session.rollback()
+        return jsonify({'errors': result.errors}), 400
+
+    # Свертка пересчитывается в той же транзакции
+    changed_ids = result.created + result.updated
+    affected_services = set()
+    record_dates = [before['date'] for before in result.before.values()] if entity_name == 'records' else []
+
+    if entity_name == 'records':
+        try:
+            sync_record_schedule(db.session, changed_ids, app.config['SCHEDULE_DEFAULT_DURATION'], result.before)
+        except ScheduleConflict as e:
+            db.session.rollback()
+            positions = {record_id: ('create', index) for index, record_id in enumerate(result.created)}
+            positions.update({record_id: ('update', index) for index, record_id in enumerate(result.updated)})
+            return jsonify({'errors': [{
+                'operation': positions[conflict['ID']][0], 'index': positions[conflict['ID']][1],
+                'error': f"{e}: {', '.join(map(str, conflict['conflicts_with']))}"
+            } for conflict in e.conflicts]}), 409
+        keys = [(before['date'], before['id_services']) for before in result.before.values()]
+        if changed_ids:
+            rows = db.session.query(Record.date, Record.id_services).filter(Record.ID.in_(changed_ids)).all()
+            keys += rows
+            record_dates += [date for date, _ in rows]
+        refresh_rollup(db.session, [(date.date(), service_id) for date, service_id in keys if date])
+        sync_record_consumption(db.session, changed_ids + result.deleted)
+    elif entity_name == 'customers':
+        refresh_search_columns(db.session, changed_ids)
+    elif entity_name == 'services':
+        affected_services = set(result.updated)
+        # Длительность могла измениться - пересчитываем концы интервалов записей этих услуг
+        durations = db.session.execute(
+            select(Services.ID, Services.duration).where(Services.ID.in_(result.updated))
+        ).all() if result.updated else []
+        refresh_schedule(db.session, app.config['SCHEDULE_DEFAULT_DURATION'], [
+            service_id for service_id, duration in durations if duration != result.before[service_id]['duration']
+        ])
+    elif entity_name == 'supplies':
+        for supply_id in result.updated:
+            affected_services |= services_using_supply(db.session, supply_id)
+    elif entity_name == 'services_supplies':
+        affected_services = {before['id_services'] for before in result.before.values()}
+        if changed_ids:
+            affected_services |= set(db.session.scalars(
+                select(ServicesSupplies.id_services).where(ServicesSupplies.ID.in_(changed_ids))
+            ))
+
+    reprice_rollup(db.session, affected_services)
+    db.session.commit()
+
+    if entity_name in ('services', 'supplies', 'services_supplies'):
+        catalog_cache.invalidate(entity_name)
+    report_cache.invalidate_dates(record_dates)
+    report_cache.invalidate_services(affected_services)
+    if entity_name == 'customers' and result.updated:
+        report_cache.clear()
+    if entity_name == 'records':
+        before = {record_id: dict(values, ID=record_id) for record_id, values in result.before.items()}
+        publish_record_changes(before, changed_ids=result.created + result.updated, deleted_ids=result.deleted)
+
+    return jsonify(result.to_dict())
 
-            # Расходы по месяцам (распределяем пропорционально выручке)
-            if total_revenue > 0:
-                month_expenses = total_expenses * (month_revenue / total_revenue)
-            else:
-                month_expenses = 0
 
-            month_profit = month_revenue - month_expenses
+# Финансовые отчеты
+@app.route('/finance/report', methods=['GET'])
+@replica_router.read_replica
+def get_finance_report():
+    period = request.args.get('period', 'day')
+    report_type = request.args.get('type', 'revenue')
 
-            chart_labels.append(month_date.strftime('%B'))
+    base_date, error = parse_report_date()
+    if error:
+        return error
+
+    # Готовый отчет берем из кэша по окну периода; от типа отчета зависят только данные графика
+    start_date, end_date = get_period_bounds(base_date, period)
+    key = report_cache.key(period, start_date, end_date)
+    entry = report_cache.get(key)
+    if entry is None:
+        token = report_cache.begin()
+        # Текущие и прошлые день/месяц/год отдаются из снимка, если он свежий
+        payload, version = None, None
+        snapshot = app.config['FINANCE_SNAPSHOTS'] and is_snapshot_window(period, start_date, datetime.datetime.now())
+        if snapshot:
+            if snapshot_worker:
+                snapshot_worker.start()
+            with replica_router.primary():
+                payload, version = read_snapshot(db.session, period, start_date,
+                                                 app.config['FINANCE_SNAPSHOT_MAX_AGE'], datetime.datetime.now())
+        if payload is None:
+            # Отчет кладется в кэш: сразу после изменений реплика могла отстать, и отчет строится по основной базе
+            recent_changes = replica_router.on_replica() and report_cache.changed_within(replica_router.lag)
+            with replica_router.primary(recent_changes):
+                payload = build_finance_report(db.session, base_date, period, report_type,
+                                               use_rollup=app.config['FINANCE_USE_ROLLUP'], catalog=catalog)
+            payload.pop('chartData')
+            # Снимок устарел - сохраняем построенный отчет, если за это время его не сбросили
+            if snapshot and version is not None:
+                with replica_router.primary():
+                    store_snapshot(db.session, period, start_date, end_date, app.json.dumps(payload), version,
+                                   datetime.datetime.now())
+                    db.session.commit()
+        entry = report_cache.put(key, payload, start_date, end_date, token)
+
+    response = jsonify(dict(entry.payload, chartData=chart_data(entry.payload['chartSeries'], report_type)))
+    response.set_etag(f'{entry.etag}-{report_type}')
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+# Выгрузка для бухгалтерии: CSV или NDJSON потоком, без сборки всего списка в памяти
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def export_response(name, columns, rows):
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'Неверный формат выгрузки'}), 400
+
+    body = csv_stream(columns, rows) if export_format == 'csv' else ndjson_stream(rows)
+    response = Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{export_format}'
+    return response
+
+
+@app.route('/export/records', methods=['GET'])
+@replica_router.read_replica
+def export_records():
+    # Без даты выгружается вся история записей, с датой - период как в финансовом отчете
+    start_date = end_date = None
+    name = 'records'
+    if request.args.get('date'):
+        base_date, error = parse_report_date()
+        if error:
+            return error
+        period = request.args.get('period', 'day')
+        start_date, end_date = get_period_bounds(base_date, period)
+        name = f"records_{period}_{start_date.strftime('%Y-%m-%d')}"
+
+    return export_response(name, RECORD_EXPORT_COLUMNS, iter_record_rows(db.session, start_date, end_date))
+
+
+@app.route('/export/expenses', methods=['GET'])
+@replica_router.read_replica
+def export_expenses():
+    base_date, error = parse_report_date()
+    if error:
+        return error
 
-            if report_type == 'revenue':
-                chart_values.append(month_revenue)
-            elif report_type == 'expenses':
-                chart_values.append(month_expenses)
-            else:  # profit
-                chart_values.append(month_profit)
+    period = request.args.get('period', 'day')
+    start_date, end_date = get_period_bounds(base_date, period)
+    use_rollup = app.config['FINANCE_USE_ROLLUP'] and period in ROLLUP_PERIODS
+    _, expenses_data = build_period_expenses(db.session, start_date, end_date, use_rollup, catalog)
 
-    response_data['chartData'] = {
-        'labels': chart_labels,
-        'values': chart_values
-    }
+    name = f"expenses_{period}_{start_date.strftime('%Y-%m-%d')}"
+    return export_response(name, EXPENSE_EXPORT_COLUMNS, iter(expenses_data))
 
-    return jsonify(response_data)
 
+init_schema()
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,185 @@
+import asyncio
+import contextvars
+import io
+import sys
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.util import await_only
+
+from app import app, db, event_broker, instrumentation, replica_router
+from configdb import REPLICA_BIND_PREFIX, async_database_url, async_engine_options
+from dbpool import install_statement_timeout
+from events import PING_FRAME, parse_last_event_id
+from replicas import AsyncRoutingSession
+
+# ASGI-вход: uvicorn asgi:application
+# Маршруты и ответы те же, что у Flask-приложения: запрос проходит через app.wsgi_app целиком,
+# но db.session на время запроса подменяется сессией асинхронного движка (asyncpg / aiosqlite).
+# Код обработчиков выполняется в greenlet (AsyncSession.run_sync), и пока база отвечает,
+# цикл событий обслуживает другие запросы - медленный отчет не занимает поток воркера.
+
+async_engine = create_async_engine(app.config['ASYNC_DATABASE_URL'], **app.config['ASYNC_ENGINE_OPTIONS'])
+# Реплики (DB_REPLICA_URLS) - тоже через асинхронные драйверы; обработчики read_replica читают с них
+replica_engines = {}
+for key, bind in app.config['SQLALCHEMY_BINDS'].items():
+    if key.startswith(REPLICA_BIND_PREFIX):
+        url = async_database_url(bind['url'])
+        replica_engines[key] = create_async_engine(url, **async_engine_options(url))
+replica_router.use_async_engines(replica_engines)
+AsyncSessionLocal = async_sessionmaker(async_engine, sync_session_class=AsyncRoutingSession)
+
+for engine in [async_engine, *replica_engines.values()]:
+    if app.config['DB_PGBOUNCER'] and app.config['DB_STATEMENT_TIMEOUT'] and engine.dialect.name == 'postgresql':
+        install_statement_timeout(engine.sync_engine, app.config['DB_STATEMENT_TIMEOUT'])
+if instrumentation is not None:
+    instrumentation.instrument_engine(async_engine.sync_engine)
+
+_request_session = contextvars.ContextVar('request_session', default=None)
+_create_session = db.session.registry.createfunc
+
+
+# db.session внутри ASGI-запроса - синхронная обертка над AsyncSession этого запроса
+def _session_for_request():
+    session = _request_session.get()
+    return session if session is not None else _create_session()
+
+
+db.session.registry.createfunc = _session_for_request
+
+
+def _wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+# Выполняется в greenlet: синхронный код Flask, ожидание базы и отправка ответа через await_only
+def _serve(sync_session, environ, send):
+    token = _request_session.set(sync_session)
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    def send_start():
+        await_only(send({'type': 'http.response.start', 'status': response_start['status'],
+                         'headers': response_start['headers']}))
+
+    try:
+        result = app.wsgi_app(environ, start_response)
+        try:
+            started = False
+            # Потоковые ответы (выгрузки) отправляются по частям, не собираясь в памяти
+            for chunk in result:
+                if not started:
+                    send_start()
+                    started = True
+                if chunk:
+                    await_only(send({'type': 'http.response.body', 'body': chunk, 'more_body': True}))
+            if not started:
+                send_start()
+            await_only(send({'type': 'http.response.body', 'body': b''}))
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+    finally:
+        _request_session.reset(token)
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+# /events без greenlet и сессии: подключение ждет кадры в цикле событий, не занимая поток
+async def _serve_events(scope, receive, send):
+    headers = dict(scope['headers'])
+    query = dict(pair.split('=', 1) for pair in scope['query_string'].decode('latin-1').split('&') if '=' in pair)
+    last_event_id = parse_last_event_id(headers.get(b'last-event-id', b'').decode('latin-1')
+                                        or query.get('last_event_id'))
+    subscription = event_broker.subscribe(last_event_id)
+    disconnected = asyncio.ensure_future(receive())
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        while not subscription.finished:
+            frames = asyncio.ensure_future(subscription.get_async(app.config['EVENTS_HEARTBEAT']))
+            await asyncio.wait({frames, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                frames.cancel()
+                return
+            body = ''.join(frames.result()) or PING_FRAME
+            await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        event_broker.unsubscribe(subscription)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            for engine in [async_engine, *replica_engines.values()]:
+                await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    body = await _read_body(receive)
+    if body is None:
+        return
+    # После тела запроса следующее сообщение receive() - только http.disconnect
+    if event_broker is not None and scope['method'] == 'GET' and scope['path'] == '/events':
+        await _serve_events(scope, receive, send)
+        return
+
+    async with AsyncSessionLocal() as session:
+        await session.run_sync(_serve, _wsgi_environ(scope, body), send)
@@ -0,0 +1,146 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.run_suite import percentile
+
+WSGI_COMMAND = [sys.executable, '-c', 'import sys; from app import app; '
+                'app.run(host="127.0.0.1", port=int(sys.argv[1]), threaded=True)', '{port}']
+ASGI_COMMAND = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1', '--port', '{port}',
+                '--log-level', 'warning']
+
+
+def _wait_ready(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Сервер завершился с кодом {process.returncode}')
+        try:
+            with urllib.request.urlopen(base_url + '/health', timeout=1):
+                return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.3)
+    raise RuntimeError('Сервер не запустился')
+
+
+def _client_loop(base_url, path, stop_at, timings, errors, lock):
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base_url + path, timeout=120) as response:
+                response.read()
+                failed = response.status >= 400
+        except (urllib.error.URLError, ConnectionError, OSError):
+            failed = True
+        elapsed = time.perf_counter() - started
+        with lock:
+            timings.append(elapsed)
+            if failed:
+                errors.append(path)
+
+
+# Смешанная нагрузка: медленные клиенты строят годовой отчет, быстрые листают записи.
+# Важно, как быстрые запросы переносят соседство с медленными.
+def run_load(base_url, slow_clients, fast_clients, duration, report_date):
+    workloads = {
+        'slow_finance_year': (f'/finance/report?date={report_date}&period=year&type=revenue', slow_clients),
+        'fast_records_page': ('/records?limit=20', fast_clients),
+    }
+    stop_at = time.monotonic() + duration
+    lock = threading.Lock()
+    collected = {}
+    threads = []
+    for name, (path, clients) in workloads.items():
+        timings, errors = [], []
+        collected[name] = (timings, errors)
+        for _ in range(clients):
+            thread = threading.Thread(target=_client_loop, args=(base_url, path, stop_at, timings, errors, lock))
+            thread.start()
+            threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    results = {}
+    for name, (timings, errors) in collected.items():
+        if not timings:
+            results[name] = {'requests': 0}
+            continue
+        results[name] = {
+            'clients': workloads[name][1],
+            'requests': len(timings),
+            'errors': len(errors),
+            'throughput_rps': round(len(timings) / duration, 1),
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 1),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 1),
+            'max_ms': round(max(timings) * 1000, 1)
+        }
+    return results
+
+
+def serve_and_measure(name, command, port, env, args):
+    command = [part.replace('{port}', str(port)) for part in command]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        _wait_ready(base_url, process)
+        print(f'{name}: нагрузка {args.duration} с', file=sys.stderr)
+        return run_load(base_url, args.slow_clients, args.fast_clients, args.duration, args.date)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Конкурентная нагрузка: WSGI (app.run) против ASGI (asgi.py)')
+    parser.add_argument('--database-url', help='По умолчанию - DATABASE_URL (только с --no-seed)')
+    parser.add_argument('--no-seed', action='store_true', help='Использовать уже заполненную базу')
+    parser.add_argument('--force', action='store_true', help='Заполнить базу, даже если в ней уже есть данные')
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--date', default='2025-06-15')
+    parser.add_argument('--slow-clients', type=int, default=4)
+    parser.add_argument('--fast-clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--port', type=int, default=8760)
+    parser.add_argument('--wsgi-command', help='Своя команда запуска WSGI (например gunicorn), {port} - порт')
+    parser.add_argument('--asgi-command', help='Своя команда запуска ASGI, {port} - порт')
+    args = parser.parse_args()
+    # Заполнение удаляет все данные базы - ее адрес должен быть указан явно
+    if not args.no_seed and not args.database_url:
+        parser.error('для заполнения базы укажите --database-url (или --no-seed)')
+
+    env = dict(os.environ)
+    if args.database_url:
+        env['DATABASE_URL'] = args.database_url
+        os.environ['DATABASE_URL'] = args.database_url
+    # Отчет каждый раз строится заново - иначе медленная часть нагрузки попадает в кэш или снимок
+    env['FINANCE_CACHE_SIZE'] = '0'
+    env['FINANCE_SNAPSHOTS'] = '0'
+
+    if not args.no_seed:
+        from benchmarks.seed import SeedError, seed_database
+        from sqlalchemy import create_engine
+        try:
+            seed_database(create_engine(args.database_url), records=args.records, force=args.force)
+        except SeedError as e:
+            raise SystemExit(str(e))
+
+    servers = [
+        ('wsgi', args.wsgi_command.split() if args.wsgi_command else WSGI_COMMAND),
+        ('asgi', args.asgi_command.split() if args.asgi_command else ASGI_COMMAND),
+    ]
+    results = {}
+    for offset, (name, command) in enumerate(servers):
+        results[name] = serve_and_measure(name, command, args.port + offset, env, args)
+
+    print(json.dumps({'duration': args.duration, 'slow_clients': args.slow_clients,
+                      'fast_clients': args.fast_clients, 'results': results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
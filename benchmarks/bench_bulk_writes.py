@@ -0,0 +1,73 @@
+import argparse
+import datetime
+import json
+import os
+import time
+
+
+# Сравнение пропускной способности: N одиночных POST против одного пакетного запроса.
+# Добавляет тестовые строки - запускать на отдельной базе.
+def main():
+    parser = argparse.ArgumentParser(description='Одиночные и пакетные записи через HTTP-обработчики')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--items', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    from sqlalchemy import func, select
+    from app import app, db
+    from models_auto import Record
+
+    client = app.test_client()
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        service_id = client.post('/services', json={'name': 'bench', 'price': 1000}).json['ID']
+        # Пересекающиеся записи отклоняются: тестовые записи ставятся подряд после последней записи в расписании
+        last_booked = db.session.scalar(select(func.max(Record.end_date)))
+    schedule_start = max(last_booked or datetime.datetime(2030, 1, 1), datetime.datetime(2030, 1, 1))
+    schedule_start = datetime.datetime.combine(schedule_start.date() + datetime.timedelta(days=1), datetime.time())
+
+    run_id = int(time.time())
+    customers = [{'surname': 'Bench', 'name': str(i), 'phone': f'bench-{run_id}-{i}'} for i in range(args.items)]
+    results = []
+
+    started = time.perf_counter()
+    for customer in customers:
+        client.post('/customers', json=customer)
+    single = time.perf_counter() - started
+
+    bulk_customers = [dict(c, phone=c['phone'] + '-bulk') for c in customers]
+    started = time.perf_counter()
+    response = client.post('/customers/bulk', json={'create': bulk_customers})
+    bulk = time.perf_counter() - started
+    customer_ids = response.json['created']
+    results.append({'entity': 'customers', 'items': args.items,
+                    'single_rows_per_sec': round(args.items / single), 'bulk_rows_per_sec': round(args.items / bulk)})
+
+    records = [{'id_customers': customer_ids[i], 'id_services': service_id,
+                'date': (schedule_start + datetime.timedelta(hours=i)).isoformat()} for i in range(args.items)]
+    # Пакет - в другие часы, чем одиночные записи
+    bulk_records = [dict(record, date=(schedule_start + datetime.timedelta(hours=args.items + i)).isoformat())
+                    for i, record in enumerate(records)]
+
+    # Одиночный POST /records передает дату строкой; SQLite принимает только datetime, поэтому там только пакет
+    single = None
+    if dialect != 'sqlite':
+        started = time.perf_counter()
+        for record in records:
+            client.post('/records', json=record)
+        single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    client.post('/records/bulk', json={'create': bulk_records})
+    bulk = time.perf_counter() - started
+    results.append({'entity': 'records', 'items': args.items,
+                    'single_rows_per_sec': round(args.items / single) if single else None,
+                    'bulk_rows_per_sec': round(args.items / bulk)})
+
+    print(json.dumps({'dialect': dialect, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import datetime
+import json
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from finance import build_finance_report, get_period_bounds
+from models_auto import Customers, Services, Supplies, Record, ServicesSupplies
+from benchmarks.seed import SeedError, seed_database
+
+
+# Прежняя реализация: все записи периода грузятся ORM-объектами и суммируются в Python
+def legacy_report_totals(session, base_date, period):
+    start_date, end_date = get_period_bounds(base_date, period)
+
+    records = session.query(Record, Services, Customers). \
+        join(Services, Record.id_services == Services.ID). \
+        join(Customers, Record.id_customers == Customers.ID). \
+        filter(Record.date >= start_date, Record.date <= end_date).all()
+
+    total_revenue = 0
+    records_data = []
+    service_stats = {}
+    for record, service, customer in records:
+        service_price = service.price or 0
+        total_revenue += service_price
+        service_stats.setdefault(service.ID, {'count': 0})
+        service_stats[service.ID]['count'] += 1
+        records_data.append({
+            'date': record.date.isoformat() if record.date else None,
+            'service_name': service.name,
+            'service_id': service.ID,
+            'client_name': f"{customer.surname or ''} {customer.name or ''}".strip(),
+            'price': service_price
+        })
+
+    services_supplies = session.query(ServicesSupplies, Services, Supplies). \
+        join(Services, ServicesSupplies.id_services == Services.ID). \
+        join(Supplies, ServicesSupplies.id_supplies == Supplies.ID). \
+        all()
+
+    total_expenses = 0
+    for service_supply, service, supply in services_supplies:
+        service_count = service_stats.get(service.ID, {}).get('count', 0)
+        total_expenses += (supply.price or 0) * (service_supply.material_consumption or 0) * service_count
+
+    return {'revenue': total_revenue, 'expenses': total_expenses, 'records': len(records_data)}
+
+
+def _timed(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение старого и SQL-агрегированного финансового отчета')
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--date', default='2025-06-15')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-seed', action='store_true', help='Использовать уже заполненную базу')
+    parser.add_argument('--force', action='store_true', help='Заполнить базу, даже если в ней уже есть данные')
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if not args.no_seed:
+        try:
+            seed_database(engine, records=args.records, force=args.force)
+        except SeedError as e:
+            raise SystemExit(str(e))
+
+    base_date = datetime.datetime.strptime(args.date, '%Y-%m-%d')
+    results = []
+    for period in ('day', 'month', 'year'):
+        with Session(engine) as session:
+            legacy_time, legacy = _timed(lambda: legacy_report_totals(session, base_date, period), args.repeat)
+            session.expunge_all()
+            sql_time, report = _timed(lambda: build_finance_report(session, base_date, period, 'revenue'), args.repeat)
+
+        results.append({
+            'period': period,
+            'records': legacy['records'],
+            'legacy_seconds': round(legacy_time, 4),
+            'sql_seconds': round(sql_time, 4),
+            'speedup': round(legacy_time / sql_time, 2) if sql_time else None,
+            'totals_match': (legacy['revenue'] == report['summary']['revenue'] and
+                             abs(legacy['expenses'] - report['summary']['expenses']) < 0.01)
+        })
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+
+# Сериализация страницы записей: ORM-объекты + isoformat + стандартный jsonify против
+# выборки колонок + JSON-провайдера (стандартный json с ISO-датами и orjson)
+def main():
+    parser = argparse.ArgumentParser(description='Микробенчмарк сериализации списков')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    from flask.json.provider import DefaultJSONProvider
+    from app import RECORD_COLUMNS, app, db, row_to_dict
+    from jsonprovider import IsoJSONProvider, OrjsonProvider
+    from models_auto import Record
+
+    def legacy(provider):
+        rows = db.session.query(Record).order_by(Record.ID).limit(args.rows).all()
+        return provider.response([{
+            'ID': r.ID,
+            'id_customers': r.id_customers,
+            'id_services': r.id_services,
+            'date': r.date.isoformat() if r.date else None,
+            'name': r.name
+        } for r in rows]).get_data()
+
+    def columns(provider):
+        rows = db.session.query(*RECORD_COLUMNS).order_by(Record.ID).limit(args.rows).all()
+        return provider.response([row_to_dict(row) for row in rows]).get_data()
+
+    variants = [('orm_entities+json', legacy, DefaultJSONProvider), ('columns+json', columns, IsoJSONProvider)]
+    try:
+        import orjson  # noqa: F401
+        variants.append(('columns+orjson', columns, OrjsonProvider))
+    except ImportError:
+        pass
+
+    results = []
+    with app.test_request_context():
+        for name, build, provider_class in variants:
+            provider = provider_class(app)
+            timings = []
+            for _ in range(args.repeat):
+                db.session.expunge_all()
+                started = time.perf_counter()
+                body = build(provider)
+                timings.append(time.perf_counter() - started)
+
+            db.session.expunge_all()
+            tracemalloc.start()
+            build(provider)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results.append({'variant': name, 'rows': args.rows, 'seconds': round(min(timings), 4),
+                            'us_per_row': round(min(timings) / args.rows * 1e6, 2),
+                            'peak_alloc_mb': round(peak / 2 ** 20, 2), 'bytes': len(body)})
+
+    base = results[0]['seconds']
+    for result in results:
+        result['speedup'] = round(base / result['seconds'], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
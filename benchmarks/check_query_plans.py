@@ -0,0 +1,77 @@
+import argparse
+import datetime
+import json
+import sys
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from models_auto import Record, Services, ServicesSupplies
+from schema import upgrade_schema
+from benchmarks.seed import SeedError, seed_database
+
+
+# Запросы из горячих путей и индекс, который должен использоваться для каждого из них
+def hot_queries():
+    day_start = datetime.datetime(2025, 6, 15)
+    return [
+        ('finance_period_filter', 'record_schedule_idx',
+         select(func.count(Record.ID)).where(Record.date >= day_start,
+                                             Record.date <= day_start + datetime.timedelta(days=1))),
+        ('customer_delete_guard', 'record_customer_visits_idx',
+         select(Record.ID).where(Record.id_customers == 1).limit(1)),
+        ('service_delete_guard', 'record_id_services_idx',
+         select(Record.ID).where(Record.id_services == 1).limit(1)),
+        ('service_materials', 'services_supplies_id_services_idx',
+         select(ServicesSupplies.ID).where(ServicesSupplies.id_services == 1)),
+        ('supply_delete_guard', 'services_supplies_id_supplies_idx',
+         select(ServicesSupplies.ID).where(ServicesSupplies.id_supplies == 1).limit(1)),
+        ('customer_analytics_group', 'record_customer_visits_idx',
+         select(Record.id_customers, func.count(Record.ID), func.sum(Services.price), func.max(Record.date)).
+         join(Services, Record.id_services == Services.ID).group_by(Record.id_customers)),
+    ]
+
+
+def explain(conn, statement):
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True})
+    # План с настройками планировщика по умолчанию: индекс должен выбираться сам, а не принудительно
+    if conn.dialect.name == 'postgresql':
+        plan = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}').scalar()
+        return json.dumps(plan)
+    return '\n'.join(row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка использования индексов в горячих запросах')
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--no-seed', action='store_true', help='Использовать уже заполненную базу')
+    parser.add_argument('--force', action='store_true', help='Заполнить базу, даже если в ней уже есть данные')
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if not args.no_seed:
+        try:
+            seed_database(engine, records=args.records, force=args.force)
+        except SeedError as e:
+            raise SystemExit(str(e))
+    upgrade_schema(engine)
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+
+    failures = []
+    with Session(engine) as session, session.connection() as conn:
+        for name, index_name, statement in hot_queries():
+            plan = explain(conn, statement)
+            used = index_name in plan
+            print(f"{'OK  ' if used else 'FAIL'} {name}: {index_name}")
+            if not used:
+                failures.append(name)
+                print(plan)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
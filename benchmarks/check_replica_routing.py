@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import urllib.parse
+from http.cookies import SimpleCookie
+
+from sqlalchemy import create_engine, insert, select
+
+
+class AsgiResponse:
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.json = json.loads(body) if body and headers.get('Content-Type', '').startswith('application/json') else None
+
+
+# Клиент ASGI-входа (asgi.application) с cookie, как у app.test_client().
+# Пулы асинхронных движков привязаны к циклу событий, поэтому все клиенты работают в одном цикле.
+class AsgiClient:
+    loop = None
+
+    def __init__(self, application):
+        self.application = application
+        self.cookies = {}
+        if AsgiClient.loop is None:
+            AsgiClient.loop = asyncio.new_event_loop()
+
+    def open(self, method, path, query_string=None, json_body=None):
+        body = json.dumps(json_body).encode() if json_body is not None else b''
+        headers = [(b'content-type', b'application/json')]
+        if self.cookies:
+            headers.append((b'cookie', '; '.join(f'{k}={v}' for k, v in self.cookies.items()).encode()))
+        path, _, query = path.partition('?')
+        if query_string:
+            query = urllib.parse.urlencode(query_string)
+        scope = {'type': 'http', 'method': method, 'path': path, 'root_path': '', 'http_version': '1.1',
+                 'query_string': query.encode(), 'headers': headers}
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        self.loop.run_until_complete(self.application(scope, receive, send))
+        start = sent[0]
+        response_headers = {k.decode('latin-1').title(): v.decode('latin-1') for k, v in start['headers']}
+        if 'Set-Cookie' in response_headers:
+            for name, morsel in SimpleCookie(response_headers['Set-Cookie']).items():
+                self.cookies[name] = morsel.value
+        return AsgiResponse(start['status'], response_headers, b''.join(m.get('body', b'') for m in sent[1:]))
+
+    # Закрыть движки asgi.py (lifespan.shutdown), иначе потоки aiosqlite не дают процессу завершиться
+    def close(self):
+        messages = [{'type': 'lifespan.shutdown'}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            pass
+
+        self.loop.run_until_complete(self.application({'type': 'lifespan'}, receive, send))
+
+    def get(self, path, query_string=None):
+        return self.open('GET', path, query_string)
+
+    def post(self, path, json=None):
+        return self.open('POST', path, json_body=json)
+
+
+# Проверка чтения с реплик на двух базах SQLite: основная база и ее копия в роли реплики.
+# Копия "отстает" - изменения после копирования есть только в основной базе, а клиент-метка есть
+# только в копии, поэтому по ответу видно, с какой базы он прочитан.
+def main():
+    parser = argparse.ArgumentParser(description='Проверка маршрутизации запросов между основной базой и репликой')
+    parser.add_argument('--workdir', help='Каталог для файлов баз (по умолчанию временный)')
+    parser.add_argument('--records', type=int, default=2000)
+    parser.add_argument('--asgi', action='store_true', help='Проверить ASGI-вход (asgi.py) вместо WSGI')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='replica-check-')
+    primary_path = os.path.join(workdir, 'primary.db')
+    replica_path = os.path.join(workdir, 'replica.db')
+    for path in (primary_path, replica_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    # Config читает переменные окружения при импорте, поэтому модули проекта импортируются после их установки
+    os.environ['DATABASE_URL'] = f'sqlite:///{primary_path}'
+    os.environ['DB_REPLICA_URLS'] = f'sqlite:///{replica_path}'
+    os.environ['DB_REPLICA_LAG'] = '30'
+    from models_auto import Customers
+    from schema import upgrade_schema
+    from benchmarks.seed import seed_database
+
+    engine = create_engine(f'sqlite:///{primary_path}')
+    seed_database(engine, customers=100, services=5, supplies=10, records=args.records)
+    upgrade_schema(engine)
+    engine.dispose()
+    shutil.copyfile(primary_path, replica_path)
+
+    replica_engine = create_engine(f'sqlite:///{replica_path}')
+    with replica_engine.begin() as conn:
+        marker_id = conn.execute(insert(Customers).values(surname='ТолькоРеплика', phone='replica-marker')).inserted_primary_key[0]
+
+    if args.asgi:
+        from asgi import application
+        make_client = lambda: AsgiClient(application)
+    else:
+        from app import app
+        make_client = app.test_client
+
+    checks = []
+
+    def check(name, ok, detail=None):
+        checks.append({'check': name, 'ok': bool(ok), 'detail': detail})
+
+    def surnames(client, search):
+        return [c['surname'] for c in client.get('/customers', query_string={'q': search}).json]
+
+    reader = make_client()
+    writer = make_client()
+
+    check('list_reads_replica', surnames(reader, 'ТолькоРеплика') == ['ТолькоРеплика'])
+    check('single_object_reads_primary', reader.get(f'/customers/{marker_id}').status_code == 404)
+
+    response = writer.post('/customers', json={'surname': 'НовыйКлиент', 'phone': 'replica-check-new'})
+    check('write_accepted', response.status_code == 201, response.json)
+    check('write_sets_primary_cookie', 'db_primary_until' in response.headers.get('Set-Cookie', ''))
+    check('writer_reads_own_write', surnames(writer, 'НовыйКлиент') == ['НовыйКлиент'])
+    check('writer_sticks_to_primary', surnames(writer, 'ТолькоРеплика') == [])
+    check('other_client_reads_replica', surnames(reader, 'НовыйКлиент') == [])
+    with replica_engine.connect() as conn:
+        check('write_not_on_replica', conn.scalar(select(Customers.ID).where(Customers.surname == 'НовыйКлиент')) is None)
+
+    report = reader.get('/finance/report?date=2025-06-15&period=month')
+    check('report_from_replica', report.status_code == 200, report.status_code)
+    stats = reader.get('/health/replicas').json
+    check('replica_stats', stats['replica_reads'] >= 3 and stats['sticky_reads'] >= 2, stats)
+
+    if args.asgi:
+        reader.close()
+
+    failed = [c for c in checks if not c['ok']]
+    print(json.dumps({'workdir': workdir, 'checks': checks}, ensure_ascii=False, indent=2, default=str))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
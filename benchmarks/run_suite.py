@@ -0,0 +1,305 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, func, select
+
+FINANCE_PERIODS = ('day', 'month', 'year')
+
+
+# Клиент поверх работающего сервера (gunicorn и т.п.) с тем же интерфейсом, что у app.test_client()
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def open(self, method, path, json_body=None):
+        data = json.dumps(json_body).encode() if json_body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with urllib.request.urlopen(req) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+class TestClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def open(self, method, path, json_body=None):
+        response = self.client.open(path, method=method, json=json_body)
+        return response.status_code, response.get_json(silent=True)
+
+
+# Сценарий: функция (client, номер итерации) -> HTTP-статус; before - подготовка перед каждым вызовом (вне замера)
+class Scenario:
+    def __init__(self, name, call, before=None):
+        self.name = name
+        self.call = call
+        self.before = before
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(scenario, make_client, requests, concurrency, warmup):
+    local = threading.local()
+    lock = threading.Lock()
+    timings = []
+    errors = []
+
+    def one(iteration):
+        if not hasattr(local, 'client'):
+            local.client = make_client()
+        if scenario.before:
+            scenario.before()
+        started = time.perf_counter()
+        status = scenario.call(local.client, iteration)
+        elapsed = time.perf_counter() - started
+        with lock:
+            timings.append(elapsed)
+            if status >= 400:
+                errors.append(status)
+
+    for iteration in range(warmup):
+        one(-iteration - 1)
+    timings.clear()
+    errors.clear()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    wall = time.perf_counter() - started
+
+    return {
+        'scenario': scenario.name,
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'throughput_rps': round(requests / wall, 1),
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'max_ms': round(max(timings) * 1000, 3)
+    }
+
+
+def build_scenarios(args, dialect, clear_report_cache=None, schedule_start=None):
+    customers, services, year = args.customers, args.services, args.year
+    run_id = int(time.time() * 1000)
+    report_date = f'{year}-06-15'
+    created_records = []
+    created_lock = threading.Lock()
+
+    def get(path):
+        return lambda client, i: client.open('GET', path)[0]
+
+    def record_payload(i):
+        payload = {'id_customers': i % customers + 1, 'id_services': i % services + 1, 'name': 'bench'}
+        # SQLite не принимает дату строкой в одиночном POST /records, поэтому там запись без даты.
+        # Пересекающиеся записи отклоняются, поэтому каждая запись - в свой час после всех уже занятых
+        if dialect != 'sqlite':
+            payload['date'] = (schedule_start + datetime.timedelta(hours=i + args.warmup)).isoformat()
+        return payload
+
+    def post_record(client, i):
+        status, body = client.open('POST', '/records', record_payload(i))
+        if body and 'ID' in body:
+            with created_lock:
+                created_records.append(body['ID'])
+        return status
+
+    def put_record(client, i):
+        with created_lock:
+            record_id = created_records[i % len(created_records)] if created_records else 1
+        return client.open('PUT', f'/records/{record_id}', {'name': f'bench {i}'})[0]
+
+    def delete_record(client, i):
+        with created_lock:
+            record_id = created_records.pop() if created_records else None
+        if record_id is None:
+            return 404
+        return client.open('DELETE', f'/records/{record_id}')[0]
+
+    def bulk_records(client, i):
+        items = [record_payload(i * args.bulk_size + n) for n in range(args.bulk_size)]
+        for item in items:
+            item.pop('date', None)
+        status, body = client.open('POST', '/records/bulk', {'create': items})
+        if body and body.get('created'):
+            with created_lock:
+                created_records.extend(body['created'])
+        return status
+
+    scenarios = [
+        Scenario('records_page', get('/records?limit=100')),
+        Scenario('records_page_by_date', get(f'/records?limit=100&sort=-date&date_from={year}-03-01&date_to={year}-03-31')),
+        Scenario('records_details_page', get('/records/details?limit=100&sort=date')),
+        Scenario('schedule_free_slots', get('/schedule/free?service_id=1&days=7&limit=5')),
+        Scenario('customers_page', get('/customers?limit=100')),
+        Scenario('customers_search', get('/customers?limit=100&q=' + urllib.parse.quote('Фамилия12'))),
+        Scenario('customers_search_api', get('/customers/search?q=' + urllib.parse.quote('фамилия12'))),
+        Scenario('customers_search_partial', get('/customers/search?q=' + urllib.parse.quote('имя12'))),
+        Scenario('customers_phone_lookup', get('/customers/search?q=' + urllib.parse.quote('8 (900) 000-12'))),
+        Scenario('customers_summary_page', get('/customers/summary?limit=100')),
+        Scenario('customer_analytics_top', get('/analytics/customers?limit=50')),
+        Scenario('customer_analytics_churn', get('/analytics/customers?sort=-days_since_last_visit&inactive_days=90&limit=100')),
+        Scenario('customer_analytics_year', get(f'/analytics/customers?sort=-visits&date_from={year}-01-01&date_to={year}-12-31')),
+    ]
+
+    for period in FINANCE_PERIODS:
+        path = f'/finance/report?date={report_date}&period={period}&type=revenue'
+        scenarios.append(Scenario(f'finance_report_{period}_cached', get(path)))
+        if clear_report_cache:
+            scenarios.append(Scenario(f'finance_report_{period}', get(path), before=clear_report_cache))
+
+    scenarios += [
+        Scenario('customer_create', lambda client, i: client.open(
+            'POST', '/customers', {'surname': 'Bench', 'name': str(i), 'phone': f'bench-{run_id}-{i}'})[0]),
+        Scenario('customer_update', lambda client, i: client.open(
+            'PUT', f'/customers/{i % customers + 1}', {'patronymic': f'Отчество{i % customers + 1}'})[0]),
+        Scenario('record_create', post_record),
+        Scenario('record_update', put_record),
+        Scenario('record_delete', delete_record),
+        Scenario(f'records_bulk_create_{args.bulk_size}', bulk_records),
+    ]
+    return scenarios
+
+
+# Сравнение с прошлым прогоном: сценарии, у которых p95 вырос больше допустимого
+# (и больше чем на min_delta_ms - чтобы шум на быстрых запросах не считался регрессией)
+def find_regressions(results, baseline, max_regression, min_delta_ms=1.0):
+    previous = {r['scenario']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result['scenario'])
+        if (before and before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + max_regression)
+                and result['p95_ms'] - before['p95_ms'] > min_delta_ms):
+            regressions.append({'scenario': result['scenario'], 'baseline_p95_ms': before['p95_ms'],
+                                'p95_ms': result['p95_ms'],
+                                'change': round(result['p95_ms'] / before['p95_ms'] - 1, 3)})
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Задержка и пропускная способность основных эндпоинтов на синтетических данных')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--base-url', help='Гонять запросы по HTTP к запущенному серверу вместо app.test_client()')
+    parser.add_argument('--no-seed', action='store_true', help='Использовать уже заполненную базу')
+    parser.add_argument('--force', action='store_true', help='Заполнить базу, даже если в ней уже есть данные')
+    parser.add_argument('--customers', type=int, default=10000)
+    parser.add_argument('--services', type=int, default=50)
+    parser.add_argument('--supplies', type=int, default=200)
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--year', type=int, default=2025)
+    parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--bulk-size', type=int, default=100)
+    parser.add_argument('--only', help='Сценарии через запятую')
+    parser.add_argument('--output', help='Файл для результатов (JSON), по умолчанию stdout')
+    parser.add_argument('--baseline', help='Результаты прошлого прогона для сравнения')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='Допустимый рост p95 (0.2 = 20%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Рост p95 меньше этого не считается регрессией')
+    args = parser.parse_args()
+    # Заполнение удаляет все данные базы - ее адрес должен быть указан явно, без DATABASE_URL и Config
+    if not args.no_seed and not args.database_url:
+        parser.error('для заполнения базы укажите --database-url (или --no-seed)')
+
+    # Config читает DATABASE_URL при импорте, поэтому модули проекта импортируются после его установки
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    from configdb import Config
+    from benchmarks.seed import SeedError, seed_database
+    from models_auto import Record
+    database_url = os.environ.get('DATABASE_URL') or Config.SQLALCHEMY_DATABASE_URI
+    engine = create_engine(database_url)
+    dialect = engine.dialect.name
+
+    if not args.no_seed:
+        started = time.perf_counter()
+        try:
+            seed_database(engine, args.customers, args.services, args.supplies, args.records, args.year,
+                          force=args.force)
+        except SeedError as e:
+            raise SystemExit(str(e))
+        print(f'База заполнена за {time.perf_counter() - started:.1f} с', file=sys.stderr)
+    with engine.connect() as conn:
+        last_booked = conn.scalar(select(func.max(Record.end_date)))
+    engine.dispose()
+    schedule_start = datetime.datetime(args.year + 1, 1, 1)
+    if last_booked and last_booked >= schedule_start:
+        schedule_start = datetime.datetime.combine(last_booked.date() + datetime.timedelta(days=1), datetime.time())
+
+    if args.base_url:
+        make_client = lambda: HttpClient(args.base_url)
+        clear_report_cache = None
+    else:
+        from app import app, report_cache
+        make_client = lambda: TestClient(app)
+        clear_report_cache = report_cache.clear
+
+    scenarios = build_scenarios(args, dialect, clear_report_cache, schedule_start)
+    if args.only:
+        wanted = set(args.only.split(','))
+        scenarios = [s for s in scenarios if s.name in wanted]
+
+    results = []
+    for scenario in scenarios:
+        result = run_scenario(scenario, make_client, args.requests, args.concurrency, args.warmup)
+        print(f"{result['scenario']}: p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, "
+              f"{result['throughput_rps']} rps, ошибок {result['errors']}", file=sys.stderr)
+        results.append(result)
+
+    report = {
+        'started_at': datetime.datetime.now().isoformat(),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'dialect': dialect,
+        'target': args.base_url or 'test_client',
+        'dataset': {'customers': args.customers, 'services': args.services, 'supplies': args.supplies,
+                    'records': args.records, 'seeded': not args.no_seed},
+        'results': results
+    }
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['regressions'] = find_regressions(results, json.load(f), args.max_regression,
+                                                     args.min_delta_ms)
+
+    body = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(body + '\n')
+    else:
+        print(body)
+
+    if report.get('regressions') or any(r['errors'] for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import datetime
+import random
+
+from sqlalchemy import create_engine, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from configdb import Config
+from customer_search import search_columns
+from inventory import backfill_ledger
+from schedule import refresh_schedule
+from models_auto import (Base, Customers, FinanceSnapshot, Services, Supplies, Record, ServicesSupplies,
+                         SupplyDailyUsage, SupplyLedger, SupplyStock)
+from rollup import rebuild_rollup
+
+CHUNK_SIZE = 10000
+
+
+# База уже содержит данные: seed_database удалил бы их без force
+class SeedError(Exception):
+    pass
+
+
+def _insert_chunked(conn, table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            conn.execute(insert(table), chunk)
+            chunk = []
+    if chunk:
+        conn.execute(insert(table), chunk)
+
+
+# Синтетические данные для бенчмарков (детерминированные при одинаковом seed).
+# Все прежние данные удаляются, поэтому непустая база заполняется только с force=True.
+def seed_database(engine, customers=10000, services=50, supplies=200, records=1000000,
+                  year=2025, materials_per_service=4, seed=42, force=False):
+    rnd = random.Random(seed)
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as conn:
+        if not force:
+            for model in (Record, Customers, Services, Supplies):
+                if conn.scalar(select(func.count()).select_from(model)):
+                    raise SeedError(f'В базе {engine.url.render_as_string()} уже есть данные ({model.__tablename__}); '
+                                    'для перезаписи укажите --force')
+        for model in (FinanceSnapshot, SupplyLedger, SupplyDailyUsage, SupplyStock, Record, ServicesSupplies, Customers,
+                      Services, Supplies):
+            conn.execute(delete(model))
+
+        _insert_chunked(conn, Customers, ({
+            'ID': i,
+            'surname': f'Фамилия{i}',
+            'name': f'Имя{i}',
+            'patronymic': f'Отчество{i}',
+            'phone': f'+79{i:09d}',
+            **search_columns(f'Фамилия{i}', f'Имя{i}', f'Отчество{i}', f'+79{i:09d}')
+        } for i in range(1, customers + 1)))
+
+        _insert_chunked(conn, Services, ({
+            'ID': i,
+            'name': f'Услуга {i}',
+            'price': rnd.randrange(1000, 30000, 500)
+        } for i in range(1, services + 1)))
+
+        _insert_chunked(conn, Supplies, ({
+            'ID': i,
+            'name': f'Материал {i}',
+            'price': rnd.randrange(10, 2000, 10)
+        } for i in range(1, supplies + 1)))
+
+        _insert_chunked(conn, ServicesSupplies, ({
+            'ID': service_id * materials_per_service + n,
+            'id_services': service_id,
+            'id_supplies': rnd.randint(1, supplies),
+            'material_consumption': round(rnd.uniform(0.1, 5), 2),
+            'units_measurement': rnd.choice(['шт', 'мл', 'г'])
+        } for service_id in range(1, services + 1) for n in range(materials_per_service)))
+
+        start = datetime.datetime(year, 1, 1, 9)
+        _insert_chunked(conn, Record, ({
+            'ID': i,
+            'id_customers': rnd.randint(1, customers),
+            'id_services': rnd.randint(1, services),
+            'date': start + datetime.timedelta(days=rnd.randrange(365), hours=rnd.randrange(12)),
+            'name': None
+        } for i in range(1, records + 1)))
+
+    # В Postgres после вставки с явными ID нужно сдвинуть последовательности
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            for table in ('customers', 'services', 'supplies', 'record', 'services_supplies'):
+                conn.exec_driver_sql(
+                    f'SELECT setval(pg_get_serial_sequence(\'"{table}"\', \'ID\'), '
+                    f'COALESCE((SELECT MAX("ID") FROM "{table}"), 1))'
+                )
+
+    # Месячные и годовые отчеты читают свертку, склад - журнал списаний: оба должны соответствовать новым записям
+    with Session(engine) as session:
+        rebuild_rollup(session)
+        backfill_ledger(session)
+        refresh_schedule(session, Config.SCHEDULE_DEFAULT_DURATION)
+        session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Заполнение базы синтетическими данными')
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--force', action='store_true', help='Удалить данные, если база не пустая')
+    parser.add_argument('--customers', type=int, default=10000)
+    parser.add_argument('--services', type=int, default=50)
+    parser.add_argument('--supplies', type=int, default=200)
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--year', type=int, default=2025)
+    args = parser.parse_args()
+
+    try:
+        seed_database(create_engine(args.database_url), args.customers, args.services,
+                      args.supplies, args.records, args.year, force=args.force)
+    except SeedError as e:
+        raise SystemExit(str(e))
+
+
+if __name__ == '__main__':
+    main()
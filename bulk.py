@@ -0,0 +1,252 @@
+import datetime
+
+from sqlalchemy import delete, insert, select, update
+
+from models_auto import Customers, Services, Supplies, Record, ServicesSupplies
+
+# Максимальное число объектов в одном пакетном запросе
+MAX_BULK_ITEMS = 5000
+
+
+class BulkValidationError(ValueError):
+    pass
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _integer(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise BulkValidationError('Ожидается целое число')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BulkValidationError('Ожидается целое число')
+
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise BulkValidationError('Ожидается число')
+
+
+def _timestamp(value):
+    if value is None or value == '':
+        return None
+    try:
+        return datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        raise BulkValidationError('Неверный формат даты')
+
+
+# Описание сущности для пакетных операций: поля с преобразованием, обязательные поля,
+# внешние ключи и проверки перед удалением
+class BulkEntity:
+    def __init__(self, model, fields, required=(), foreign_keys=None, unique=(), delete_guards=()):
+        self.model = model
+        self.fields = fields
+        self.required = required
+        self.foreign_keys = foreign_keys or {}
+        self.unique = unique
+        self.delete_guards = delete_guards
+
+
+BULK_ENTITIES = {
+    'customers': BulkEntity(
+        Customers,
+        {'surname': _text, 'name': _text, 'patronymic': _text, 'phone': _text},
+        unique=('phone',),
+        delete_guards=[(Record.id_customers, 'Нельзя удалить клиента, у которого есть записи')]
+    ),
+    'services': BulkEntity(
+        Services,
+        {'name': _text, 'price': _integer, 'duration': _integer},
+        delete_guards=[(Record.id_services, 'Нельзя удалить услугу, у которой есть связанные записи'),
+                       (ServicesSupplies.id_services, 'Нельзя удалить услугу, у которой есть материалы')]
+    ),
+    'supplies': BulkEntity(
+        Supplies,
+        {'name': _text, 'price': _integer},
+        delete_guards=[(ServicesSupplies.id_supplies, 'Нельзя удалить материал, который используется в услугах')]
+    ),
+    'records': BulkEntity(
+        Record,
+        {'id_customers': _integer, 'id_services': _integer, 'date': _timestamp, 'name': _text},
+        required=('id_customers', 'id_services'),
+        foreign_keys={'id_customers': Customers, 'id_services': Services}
+    ),
+    'services_supplies': BulkEntity(
+        ServicesSupplies,
+        {'id_services': _integer, 'id_supplies': _integer, 'material_consumption': _number,
+         'units_measurement': _text},
+        required=('id_services', 'id_supplies'),
+        foreign_keys={'id_services': Services, 'id_supplies': Supplies}
+    ),
+}
+
+
+class BulkResult:
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.deleted = []
+        # Значения строк до изменения (для пересчета сверток и сброса кэшей)
+        self.before = {}
+        self.errors = []
+
+    def error(self, operation, index, message):
+        self.errors.append({'operation': operation, 'index': index, 'error': message})
+
+    def to_dict(self):
+        return {'created': self.created, 'updated': self.updated, 'deleted': self.deleted}
+
+
+def _existing_ids(session, model, ids):
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return set()
+    return set(session.scalars(select(model.ID).where(model.ID.in_(ids))))
+
+
+def _clean(entity, item, partial):
+    values = {}
+    for field, convert in entity.fields.items():
+        if field in item:
+            values[field] = convert(item[field])
+        elif not partial:
+            values[field] = None
+
+    for field in entity.required:
+        if field in values and values[field] is None:
+            raise BulkValidationError(f'Не указано поле {field}')
+    return values
+
+
+# Проверка всего пакета до записи: формат полей, существование ссылок, уникальность, связи при удалении
+def validate_bulk(session, entity, payload):
+    result = BulkResult()
+    creates = payload.get('create') or []
+    updates = payload.get('update') or []
+    deletes = payload.get('delete') or []
+
+    if not all(isinstance(part, list) for part in (creates, updates, deletes)):
+        result.error('request', None, 'Ожидаются списки create, update и delete')
+        return result, [], [], []
+    if len(creates) + len(updates) + len(deletes) > MAX_BULK_ITEMS:
+        result.error('request', None, f'Не больше {MAX_BULK_ITEMS} объектов за запрос')
+        return result, [], [], []
+
+    clean_creates = []
+    for index, item in enumerate(creates):
+        try:
+            if not isinstance(item, dict):
+                raise BulkValidationError('Ожидается объект')
+            clean_creates.append((index, _clean(entity, item, partial=False)))
+        except BulkValidationError as e:
+            result.error('create', index, str(e))
+
+    clean_updates = []
+    for index, item in enumerate(updates):
+        try:
+            if not isinstance(item, dict):
+                raise BulkValidationError('Ожидается объект')
+            object_id = _integer(item.get('ID'))
+            if object_id is None:
+                raise BulkValidationError('Не указан ID')
+            clean_updates.append((index, dict(_clean(entity, item, partial=True), ID=object_id)))
+        except BulkValidationError as e:
+            result.error('update', index, str(e))
+
+    clean_deletes = []
+    for index, item in enumerate(deletes):
+        try:
+            clean_deletes.append((index, _integer(item.get('ID') if isinstance(item, dict) else item)))
+        except BulkValidationError as e:
+            result.error('delete', index, str(e))
+
+    # Один объект - не больше одной операции за пакет (иначе результат зависит от порядка)
+    seen = set()
+    for operation, items, get_id in (('update', clean_updates, lambda v: v['ID']),
+                                     ('delete', clean_deletes, lambda v: v)):
+        for index, value in items:
+            if get_id(value) in seen:
+                result.error(operation, index, f'ID={get_id(value)} повторяется в пакете')
+            seen.add(get_id(value))
+
+    # Существование изменяемых и удаляемых объектов - одним запросом
+    existing = _existing_ids(session, entity.model,
+                             [v['ID'] for _, v in clean_updates] + [i for _, i in clean_deletes])
+    for operation, items, get_id in (('update', clean_updates, lambda v: v['ID']),
+                                     ('delete', clean_deletes, lambda v: v)):
+        for index, value in items:
+            if get_id(value) not in existing:
+                result.error(operation, index, 'Объект не найден')
+
+    # Внешние ключи - одним запросом на каждую связанную таблицу
+    for field, target in entity.foreign_keys.items():
+        wanted = [v.get(field) for _, v in clean_creates + clean_updates]
+        found = _existing_ids(session, target, wanted)
+        for operation, items in (('create', clean_creates), ('update', clean_updates)):
+            for index, values in items:
+                if field in values and values[field] not in found:
+                    result.error(operation, index, f'Связанный объект {field}={values[field]} не найден')
+
+    # Уникальные поля: повторы внутри пакета и среди уже сохраненных строк
+    for field in entity.unique:
+        column = getattr(entity.model, field)
+        changed = [(operation, index, values) for operation, items in (('create', clean_creates),
+                                                                     ('update', clean_updates))
+                   for index, values in items if values.get(field) is not None]
+        taken = dict(session.execute(
+            select(column, entity.model.ID).where(column.in_({values[field] for _, _, values in changed}))
+        ).all()) if changed else {}
+        seen = set()
+        for operation, index, values in changed:
+            value = values[field]
+            owner = taken.get(value)
+            if value in seen or (owner is not None and owner != values.get('ID')):
+                result.error(operation, index, f'Значение {field}={value} уже занято')
+            seen.add(value)
+
+    # Проверки связей перед удалением
+    delete_ids = [object_id for _, object_id in clean_deletes]
+    for column, message in entity.delete_guards:
+        if not delete_ids:
+            break
+        referenced = set(session.scalars(select(column).where(column.in_(delete_ids)).distinct()))
+        for index, object_id in clean_deletes:
+            if object_id in referenced:
+                result.error('delete', index, message)
+
+    return result, [v for _, v in clean_creates], [v for _, v in clean_updates], [i for _, i in clean_deletes]
+
+
+# Выполнение пакета в текущей транзакции: многострочная вставка, обновление по ключу, удаление по списку
+def apply_bulk(session, entity, payload):
+    result, creates, updates, deletes = validate_bulk(session, entity, payload)
+    if result.errors:
+        return result
+
+    model = entity.model
+    touched = [v['ID'] for v in updates] + deletes
+    if touched:
+        columns = [model.ID] + [getattr(model, field) for field in entity.fields]
+        for row in session.execute(select(*columns).where(model.ID.in_(touched))):
+            result.before[row[0]] = dict(zip(entity.fields, row[1:]))
+
+    if creates:
+        result.created = list(session.scalars(insert(model).returning(model.ID, sort_by_parameter_order=True), creates))
+    if updates:
+        session.execute(update(model), updates)
+        result.updated = [v['ID'] for v in updates]
+    if deletes:
+        session.execute(delete(model).where(model.ID.in_(deletes)))
+        result.deleted = deletes
+
+    return result
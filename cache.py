@@ -0,0 +1,144 @@
+import datetime
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheBackendError(RuntimeError):
+    pass
+
+
+# Сколько последних событий хранится в журнале ключа
+EVENT_LOG_SIZE = 1000
+
+# Номер события и запись в журнал меняются атомарно - порядок журнала совпадает с номерами
+PUBLISH_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('RPUSH', KEYS[2], seq .. ' ' .. ARGV[1])
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1)
+return seq
+"""
+
+
+# Загруженные данные вместе с ETag (по содержимому) и временем загрузки - для условных GET-запросов
+class Snapshot:
+    def __init__(self, items):
+        self.items = items
+        body = json.dumps(items, sort_keys=True, ensure_ascii=False, default=str)
+        self.etag = hashlib.sha1(body.encode()).hexdigest()
+        self.last_modified = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+
+# Общие версии ключей в Redis: данные лежат в памяти процесса, а сброс виден всем воркерам
+class RedisVersionBackend:
+    def __init__(self, url, prefix='crmtattoo:cache:'):
+        try:
+            import redis
+        except ImportError:
+            raise CacheBackendError('Для общего кэша нужен пакет redis (pip install redis)')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._publish = None
+
+    def version(self, key):
+        value = self.client.get(self.prefix + key)
+        return int(value) if value else 0
+
+    def bump(self, key):
+        self.client.incr(self.prefix + key)
+
+    # Событие в журнал ключа; номер события - новая версия ключа
+    def publish(self, key, event):
+        if self._publish is None:
+            self._publish = self.client.register_script(PUBLISH_SCRIPT)
+        return int(self._publish(keys=[self.prefix + key, self.prefix + key + ':log'],
+                                 args=[json.dumps(event), EVENT_LOG_SIZE]))
+
+    # События с номерами больше since; None - часть из них уже вытеснена из журнала
+    def events(self, key, since):
+        events = []
+        for item in self.client.lrange(self.prefix + key + ':log', 0, -1):
+            seq, body = item.split(b' ', 1)
+            if int(seq) > since:
+                events.append((int(seq), json.loads(body)))
+        if not events or events[0][0] != since + 1:
+            return None
+        return events
+
+
+# Кэш с чтением через загрузчик, сроком жизни записей и вытеснением давно неиспользуемых (LRU)
+class ReadThroughCache:
+    def __init__(self, ttl=300, max_entries=128, backend=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, key, field):
+        stats = self._stats.setdefault(key, {'hits': 0, 'misses': 0, 'invalidations': 0})
+        stats[field] += 1
+
+    # Версия ключа: локальный счетчик сбросов + общий счетчик в backend
+    def _version(self, key):
+        return self._generations.get(key, 0), self.backend.version(key) if self.backend else 0
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        version = self._version(key)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now and entry[2] == version:
+                self._entries.move_to_end(key)
+                self._count(key, 'hits')
+                return entry[0]
+            self._count(key, 'misses')
+
+        value = loader()
+
+        with self._lock:
+            # Ключ сбросили во время загрузки - значение могло устареть, не сохраняем его
+            if self._generations.get(key, 0) != version[0]:
+                return value
+            self._entries[key] = (value, now + self.ttl, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._count(key, 'invalidations')
+        if self.backend:
+            for key in keys:
+                self.backend.bump(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            keys = {key: dict(stats) for key, stats in self._stats.items()}
+            return {
+                'entries': len(self._entries),
+                'hits': sum(s['hits'] for s in keys.values()),
+                'misses': sum(s['misses'] for s in keys.values()),
+                'keys': keys
+            }
+
+
+def create_cache(config):
+    backend = None
+    if config.get('CACHE_REDIS_URL'):
+        backend = RedisVersionBackend(config['CACHE_REDIS_URL'])
+    return ReadThroughCache(ttl=config['CATALOG_CACHE_TTL'], max_entries=config['CATALOG_CACHE_SIZE'], backend=backend)
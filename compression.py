@@ -0,0 +1,63 @@
+import gzip
+
+from flask import request
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml')
+
+# Файлы (static) сжимаются, только если целиком помещаются в память
+MAX_PASSTHROUGH_SIZE = 10 * 2 ** 20
+
+
+# Сжатие ответов gzip/brotli (brotli - если установлен пакет brotli) начиная с порога размера.
+# Потоковые ответы (выгрузки) не трогаются.
+class Compressor:
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+        self._brotli = brotli
+        self.encodings = ['br', 'gzip'] if brotli else ['gzip']
+
+    def init_app(self, app):
+        app.after_request(self.compress)
+
+    @staticmethod
+    def _compressible(response):
+        mimetype = response.mimetype or ''
+        return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+    def _encode(self, data, encoding):
+        if encoding == 'br':
+            return self._brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def compress(self, response):
+        if (response.status_code != 200 or 'Content-Encoding' in response.headers
+                or not self._compressible(response)):
+            return response
+        if response.direct_passthrough:
+            if response.content_length is None or response.content_length > MAX_PASSTHROUGH_SIZE:
+                return response
+        elif response.is_streamed:
+            return response
+        if response.content_length is not None and response.content_length < self.min_size:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if not encoding:
+            return response
+
+        response.direct_passthrough = False
+        response.set_data(self._encode(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+
+        # Сжатое тело отличается побайтно - ETag становится слабым (сравнение в If-None-Match остается)
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
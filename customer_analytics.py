@@ -0,0 +1,215 @@
+import datetime
+
+from sqlalchemy import func, literal, select
+
+from models_auto import Customers, Record, Services
+
+# Аналитика клиентов для владельцев: траты (по текущим ценам услуг, как в финансовом отчете), число визитов,
+# средний чек, первый и последний визит, давность последнего визита, средний интервал между визитами
+# и любимые услуги. Учитываются только состоявшиеся визиты - записи на будущее (date > now) не считаются.
+# Метрики считаются в базе одним проходом GROUP BY по записям с ценой услуги, сортировка и top-K - тоже
+# в базе, в ответ попадают только limit клиентов. Любимые услуги выбранных клиентов - оконной функцией
+# ROW_NUMBER(); индекс record_customer_visits_idx сужает этот запрос до записей выбранных клиентов.
+
+DEFAULT_ANALYTICS_LIMIT = 50
+MAX_ANALYTICS_LIMIT = 1000
+DEFAULT_TOP_SERVICES = 3
+MAX_TOP_SERVICES = 10
+DEFAULT_ANALYTICS_SORT = '-total_spent'
+# days_since_last_visit - это last_visit в обратном порядке
+ANALYTICS_SORTS = ('total_spent', 'visits', 'avg_check', 'first_visit', 'last_visit', 'days_since_last_visit')
+
+
+class AnalyticsError(ValueError):
+    pass
+
+
+def _int_param(args, name, default, low, high):
+    value = args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise AnalyticsError(f'{name} должен быть целым числом')
+    if number < low or number > high:
+        raise AnalyticsError(f'{name} должен быть от {low} до {high}')
+    return number
+
+
+# Параметры запроса: sort ("-total_spent", "visits", ...), limit (top-K), top_services,
+# min_visits и inactive_days (только клиенты, не приходившие столько дней - отток)
+def parse_analytics_params(args):
+    sort = args.get('sort') or DEFAULT_ANALYTICS_SORT
+    if sort.lstrip('-') not in ANALYTICS_SORTS:
+        raise AnalyticsError('Неверная сортировка')
+    return {
+        'sort': sort,
+        'limit': _int_param(args, 'limit', DEFAULT_ANALYTICS_LIMIT, 1, MAX_ANALYTICS_LIMIT),
+        'top_services': _int_param(args, 'top_services', DEFAULT_TOP_SERVICES, 0, MAX_TOP_SERVICES),
+        'min_visits': _int_param(args, 'min_visits', 1, 1, 1000000),
+        'inactive_days': _int_param(args, 'inactive_days', None, 0, 100000),
+    }
+
+
+def _period(query, date_from, date_to):
+    if date_from:
+        query = query.where(Record.date >= date_from)
+    if date_to:
+        query = query.where(Record.date <= date_to)
+    return query
+
+
+def _spent():
+    return func.sum(func.coalesce(Services.price, 0))
+
+
+# Метрики top-K клиентов; customers_total - сколько клиентов прошло фильтры (окно до LIMIT)
+def _top_customers(session, date_from, date_to, sort, limit, min_visits, inactive_before):
+    stats = _period(
+        select(
+            Record.id_customers.label('customer_id'),
+            func.count(Record.ID).label('visits'),
+            _spent().label('total_spent'),
+            func.min(Record.date).label('first_visit'),
+            func.max(Record.date).label('last_visit')
+        ).select_from(Record).join(Services, Record.id_services == Services.ID),
+        date_from, date_to
+    ).group_by(Record.id_customers)
+    if min_visits > 1:
+        stats = stats.having(func.count(Record.ID) >= min_visits)
+    if inactive_before is not None:
+        stats = stats.having(func.max(Record.date) < inactive_before)
+    stats = stats.subquery()
+
+    avg_check = stats.c.total_spent * literal(1.0) / stats.c.visits
+    columns = {
+        'total_spent': stats.c.total_spent,
+        'visits': stats.c.visits,
+        'avg_check': avg_check,
+        'first_visit': stats.c.first_visit,
+        'last_visit': stats.c.last_visit,
+        'days_since_last_visit': stats.c.last_visit,
+    }
+    name = sort.lstrip('-')
+    descending = sort.startswith('-') != (name == 'days_since_last_visit')
+    order = columns[name].desc() if descending else columns[name].asc()
+
+    return session.execute(
+        select(
+            stats.c.customer_id, Customers.surname, Customers.name, Customers.patronymic, Customers.phone,
+            stats.c.visits, stats.c.total_spent, stats.c.first_visit, stats.c.last_visit,
+            func.count().over().label('customers_total')
+        ).
+        join(Customers, Customers.ID == stats.c.customer_id).
+        order_by(order.nulls_last(), stats.c.customer_id).
+        limit(limit)
+    ).all()
+
+
+# Любимые услуги клиентов: до top услуг на клиента по числу визитов, затем по тратам
+def _favorite_services(session, customer_ids, date_from, date_to, top):
+    if not customer_ids or not top:
+        return {}
+    visits = func.count(Record.ID)
+    ranked = _period(
+        select(
+            Record.id_customers.label('customer_id'),
+            Record.id_services.label('service_id'),
+            visits.label('visits'),
+            _spent().label('spent'),
+            func.row_number().over(
+                partition_by=Record.id_customers,
+                order_by=(visits.desc(), _spent().desc(), Record.id_services)
+            ).label('place')
+        ).
+        select_from(Record).
+        join(Services, Record.id_services == Services.ID).
+        where(Record.id_customers.in_(customer_ids)),
+        date_from, date_to
+    ).group_by(Record.id_customers, Record.id_services).subquery()
+
+    favorites = {}
+    for row in session.execute(
+        select(ranked.c.customer_id, ranked.c.service_id, Services.name, ranked.c.visits, ranked.c.spent).
+        join(Services, Services.ID == ranked.c.service_id).
+        where(ranked.c.place <= top).
+        order_by(ranked.c.customer_id, ranked.c.place)
+    ):
+        favorites.setdefault(row.customer_id, []).append({
+            'service_id': row.service_id, 'name': row.name, 'visits': row.visits, 'spent': row.spent
+        })
+    return favorites
+
+
+# Структура выручки по услугам за период: доли считаются от итога окна SUM() OVER () в том же запросе
+def service_mix(session, date_from=None, date_to=None):
+    visits = func.count(Record.ID)
+    rows = session.execute(
+        _period(
+            select(
+                Services.ID, Services.name, visits.label('visits'), _spent().label('revenue'),
+                func.count(func.distinct(Record.id_customers)).label('customers'),
+                func.sum(visits).over().label('visits_total'),
+                func.sum(_spent()).over().label('revenue_total')
+            ).select_from(Record).join(Services, Record.id_services == Services.ID),
+            date_from, date_to
+        ).group_by(Services.ID, Services.name).order_by(_spent().desc(), visits.desc(), Services.ID)
+    ).all()
+    return [{
+        'service_id': row.ID,
+        'name': row.name,
+        'visits': row.visits,
+        'revenue': row.revenue,
+        'customers': row.customers,
+        # На Postgres SUM() OVER () возвращает numeric (Decimal) - доли отдаются числами, а не строками
+        'visits_share': round(float(row.visits) / float(row.visits_total), 4) if row.visits_total else 0,
+        'revenue_share': round(float(row.revenue) / float(row.revenue_total), 4) if row.revenue_total else 0,
+    } for row in rows]
+
+
+def _days(delta):
+    return round(delta.total_seconds() / 86400, 1)
+
+
+def customer_analytics(session, params, date_from=None, date_to=None, now=None):
+    now = now or datetime.datetime.now()
+    date_to = min(date_to, now) if date_to else now
+    inactive_before = None
+    if params['inactive_days'] is not None:
+        inactive_before = now - datetime.timedelta(days=params['inactive_days'])
+
+    rows = _top_customers(session, date_from, date_to, params['sort'], params['limit'],
+                          params['min_visits'], inactive_before)
+    favorites = _favorite_services(session, [row.customer_id for row in rows], date_from, date_to,
+                                   params['top_services'])
+
+    customers = []
+    for row in rows:
+        first_visit, last_visit = row.first_visit, row.last_visit
+        customers.append({
+            'ID': row.customer_id,
+            'surname': row.surname,
+            'name': row.name,
+            'patronymic': row.patronymic,
+            'phone': row.phone,
+            'visits': row.visits,
+            'total_spent': row.total_spent,
+            'avg_check': round(row.total_spent / row.visits, 2),
+            'first_visit': first_visit,
+            'last_visit': last_visit,
+            'days_since_last_visit': _days(now - last_visit) if last_visit else None,
+            # Частота визитов: средний интервал между первым и последним визитом
+            'avg_interval_days': _days((last_visit - first_visit) / (row.visits - 1))
+            if row.visits > 1 and first_visit and last_visit else None,
+            'top_services': favorites.get(row.customer_id, []),
+        })
+
+    return {
+        'customers': customers,
+        'customers_total': rows[0].customers_total if rows else 0,
+        'services': service_mix(session, date_from, date_to),
+        'sort': params['sort'],
+        'limit': params['limit'],
+        'generated_at': now,
+    }
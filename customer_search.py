@@ -0,0 +1,153 @@
+import re
+
+from sqlalchemy import and_, bindparam, or_, select, update
+
+from models_auto import Customers
+
+# Поиск клиентов для ресепшена: по началу фамилии (и имени, отчества следом) и по цифрам телефона.
+# Нормализованные ключи хранятся в customers.search_name и customers.phone_digits и индексируются,
+# поэтому совпадения по началу находятся по индексу, без перебора всех клиентов.
+# Поиск по середине строки (например, по имени без фамилии) - второй уровень: на Postgres его ускоряют
+# триграммные индексы из migrations/002_customer_search.sql, без них это последовательный просмотр.
+
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+MIN_PHONE_DIGITS = 3
+
+NON_SEARCH_CHARS = re.compile(r'[^0-9a-zа-я\- ]+')
+SPACES = re.compile(r'\s+')
+BATCH_SIZE = 5000
+
+
+class SearchError(ValueError):
+    pass
+
+
+# Телефон без кода страны: 10 последних цифр российского номера (+7/8 отбрасываются)
+def normalize_phone(phone):
+    if not phone:
+        return None
+    digits = re.sub(r'\D', '', phone)
+    if len(digits) == 11 and digits[0] in '78':
+        digits = digits[1:]
+    return digits or None
+
+
+# Ключ поиска по ФИО: нижний регистр, ё -> е, только буквы, цифры, дефис и одиночные пробелы
+def normalize_text(value):
+    value = (value or '').lower().replace('ё', 'е')
+    return SPACES.sub(' ', NON_SEARCH_CHARS.sub(' ', value)).strip()
+
+
+def search_name(surname, name, patronymic):
+    return normalize_text(' '.join(part for part in (surname, name, patronymic) if part))
+
+
+def search_columns(surname, name, patronymic, phone):
+    return {'search_name': search_name(surname, name, patronymic), 'phone_digits': normalize_phone(phone)}
+
+
+def apply_search_columns(customer):
+    for field, value in search_columns(customer.surname, customer.name, customer.patronymic, customer.phone).items():
+        setattr(customer, field, value)
+
+
+# Пересчет ключей поиска для клиентов, записанных мимо обработчиков (пакеты, импорт, старые строки).
+# Без customer_ids - только строки, у которых ключа еще нет.
+def refresh_search_columns(session, customer_ids=None):
+    table = Customers.__table__
+    query = select(Customers.ID, Customers.surname, Customers.name, Customers.patronymic, Customers.phone). \
+        order_by(Customers.ID)
+    if customer_ids is not None:
+        customer_ids = list(customer_ids)
+        if not customer_ids:
+            return 0
+        query = query.where(Customers.ID.in_(customer_ids))
+    else:
+        query = query.where(Customers.search_name.is_(None))
+
+    statement = update(table).where(table.c.ID == bindparam('b_id')). \
+        values(search_name=bindparam('b_search_name'), phone_digits=bindparam('b_phone_digits'))
+
+    rows = session.execute(query).all()
+    for start in range(0, len(rows), BATCH_SIZE):
+        session.connection().execute(statement, [
+            {'b_id': customer_id, 'b_search_name': search_name(surname, name, patronymic),
+             'b_phone_digits': normalize_phone(phone)}
+            for customer_id, surname, name, patronymic, phone in rows[start:start + BATCH_SIZE]
+        ])
+    return len(rows)
+
+
+# Начало номера, набранное с кодом страны ("8 (912...", "+7 912..."), ищется и без него
+def _phone_prefixes(phone):
+    prefixes = [phone]
+    if len(phone) < 10 and phone[0] in '78' and len(phone) > MIN_PHONE_DIGITS:
+        prefixes.append(phone[1:])
+    return prefixes
+
+
+# Совпадение по началу строки, которое использует обычный btree-индекс:
+# в SQLite - GLOB (LIKE там индекс не использует), в Postgres - LIKE с индексом text_pattern_ops.
+# Спецсимволы шаблонов в prefix не попадают - их убирает нормализация.
+def _starts_with(session, column, prefix):
+    if session.get_bind().dialect.name == 'sqlite':
+        return column.op('GLOB')(prefix + '*')
+    return column.like(prefix + '%')
+
+
+def parse_search_limit(value):
+    if value is None or value == '':
+        return DEFAULT_SEARCH_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise SearchError('limit должен быть целым числом')
+    if limit < 1 or limit > MAX_SEARCH_LIMIT:
+        raise SearchError(f'limit должен быть от 1 до {MAX_SEARCH_LIMIT}')
+    return limit
+
+
+# Лучшие совпадения: точный телефон, начало телефона, начало ФИО, затем совпадение внутри строки.
+# Каждый следующий уровень запрашивается, только если предыдущие не набрали limit строк.
+def search_customers(session, query, limit=DEFAULT_SEARCH_LIMIT):
+    text = normalize_text(query)
+    digits = re.sub(r'\D', '', query or '')
+    if not text:
+        return []
+
+    columns = (Customers.ID, Customers.surname, Customers.name, Customers.patronymic, Customers.phone)
+    # Запрос из одних цифр (и разделителей телефона) - это телефон
+    phone = normalize_phone(digits) if digits and not re.search(r'[^\d\s()+\-]', query) else None
+
+    tiers = []
+    if phone and len(phone) >= MIN_PHONE_DIGITS:
+        tiers.append(('phone', Customers.phone_digits == phone, Customers.ID))
+        prefixes = _phone_prefixes(phone)
+        tiers.append(('phone_prefix', or_(*[_starts_with(session, Customers.phone_digits, prefix) for prefix in prefixes]),
+                      Customers.phone_digits))
+        tiers.append(('partial', or_(*[Customers.phone_digits.like(f'%{prefix}%') for prefix in prefixes]),
+                      Customers.phone_digits))
+    elif not phone:
+        tiers.append(('name_prefix', _starts_with(session, Customers.search_name, text), Customers.search_name))
+        # Слова запроса в любом порядке и в любом месте ФИО; слова из цифр - в телефоне
+        tiers.append(('partial', and_(*[
+            Customers.phone_digits.like(f'%{word}%') if word.isdigit() else Customers.search_name.like(f'%{word}%')
+            for word in text.split(' ')
+        ]), Customers.search_name))
+
+    results = []
+    seen = set()
+    for match, condition, order in tiers:
+        if len(results) >= limit:
+            break
+        rows = session.execute(
+            select(*columns).where(condition).order_by(order, Customers.ID).limit(limit + len(seen))
+        ).all()
+        for row in rows:
+            if row.ID in seen or len(results) >= limit:
+                continue
+            seen.add(row.ID)
+            results.append(dict(row._asdict(), match=match))
+    return results
+
@@ -0,0 +1,83 @@
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+# Счетчики выдачи соединений: сколько раз брали, сколько ждали, сколько раз не дождались.
+# Статистика своя у каждого процесса (воркера gunicorn), как и сам пул.
+class MonitoredPoolMixin:
+    # Ожидание соединения дольше этого порога (в секундах) попадает в лог
+    slow_checkout = 0.5
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._checkout_stats = {'checkouts': 0, 'timeouts': 0, 'slow_checkouts': 0,
+                                'wait_total': 0.0, 'wait_max': 0.0}
+
+    def _record_checkout(self, waited, timed_out=False):
+        with self._stats_lock:
+            stats = self._checkout_stats
+            stats['checkouts'] += 1
+            stats['wait_total'] += waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+            if timed_out:
+                stats['timeouts'] += 1
+            elif waited >= self.slow_checkout:
+                stats['slow_checkouts'] += 1
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self._record_checkout(time.perf_counter() - started, timed_out=True)
+            logger.error('Пул соединений исчерпан (pid %s): %s', os.getpid(), self.status())
+            raise
+
+        waited = time.perf_counter() - started
+        self._record_checkout(waited)
+        if waited >= self.slow_checkout:
+            logger.warning('Соединение с базой выдано через %.0f мс (pid %s): %s',
+                           waited * 1000, os.getpid(), self.status())
+        return connection
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._checkout_stats)
+        checkouts = stats.pop('checkouts')
+        wait_total = stats.pop('wait_total')
+        wait_max = stats.pop('wait_max')
+
+        result = {'pid': os.getpid(), 'pool': type(self).__name__, 'checkouts': checkouts,
+                  'wait_ms_avg': round(wait_total * 1000 / checkouts, 3) if checkouts else 0,
+                  'wait_ms_max': round(wait_max * 1000, 3), **stats}
+        # У NullPool (режим PgBouncer) нет собственной очереди соединений
+        if isinstance(self, QueuePool):
+            result.update({'size': self.size(), 'checked_in': self.checkedin(),
+                           'checked_out': self.checkedout(), 'overflow': self.overflow(),
+                           'max_overflow': self._max_overflow})
+        return result
+
+
+class MonitoredQueuePool(MonitoredPoolMixin, QueuePool):
+    pass
+
+
+class MonitoredNullPool(MonitoredPoolMixin, NullPool):
+    pass
+
+
+# В режиме PgBouncer (пул транзакций) параметры сессии не переживают транзакцию,
+# поэтому лимит времени запроса выставляется в начале каждой транзакции
+def install_statement_timeout(engine, timeout_ms):
+    @event.listens_for(engine, 'begin')
+    def set_statement_timeout(conn):
+        conn.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout_ms)}')
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Поток событий для открытых страниц (Server-Sent Events): обработчики записи публикуют короткие
+# события после commit, страницы правят загруженные списки вместо повторной загрузки таблиц.
+
+
+class EventBackendError(RuntimeError):
+    pass
+
+
+# Кадр SSE; data - уже сериализованный JSON (сериализуется один раз на всех подписчиков)
+def sse_frame(event_id, data):
+    return f'id: {event_id}\ndata: {data}\n\n'
+
+
+PING_FRAME = ': ping\n\n'
+RESET_FRAME = 'data: {"type": "reset"}\n\n'
+
+
+# Очередь кадров одного подключения. Ждать можно из потока (WSGI) или из цикла событий (ASGI).
+# Отставший клиент не копит память: при переполнении он получает reset и перезагружает данные.
+class Subscription:
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self.closed = False
+        self._frames = deque()
+        self._condition = threading.Condition()
+        self._waiters = []
+
+    def push(self, frame):
+        with self._condition:
+            if self.closed:
+                return
+            if len(self._frames) >= self.max_pending:
+                self._frames.clear()
+                self._frames.append(RESET_FRAME)
+                self.closed = True
+            else:
+                self._frames.append(frame)
+            self._condition.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, ready in waiters:
+            loop.call_soon_threadsafe(ready.set)
+
+    # Закрыта и все кадры (включая reset) отданы
+    @property
+    def finished(self):
+        return self.closed and not self._frames
+
+    def _drain(self):
+        frames = list(self._frames)
+        self._frames.clear()
+        return frames
+
+    # Накопившиеся кадры; пустой список - за timeout ничего не пришло
+    def get(self, timeout):
+        with self._condition:
+            if not self._frames:
+                self._condition.wait(timeout)
+            return self._drain()
+
+    async def get_async(self, timeout):
+        with self._condition:
+            if self._frames:
+                return self._drain()
+            waiter = (asyncio.get_running_loop(), asyncio.Event())
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        with self._condition:
+            return self._drain()
+
+
+# Рассылка через Redis pub/sub: событие видят подписчики всех воркеров, номера событий общие
+class RedisEventBackend:
+    def __init__(self, url, channel='crmtattoo:events'):
+        try:
+            import redis
+        except ImportError:
+            raise EventBackendError('Для общего потока событий нужен пакет redis (pip install redis)')
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, data):
+        event_id = self.client.incr(self.channel + ':id')
+        self.client.publish(self.channel, f'{event_id}\n{data}')
+
+    # Слушатель запускается при первой подписке в процессе (после fork воркера gunicorn)
+    def start(self, dispatch):
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen, args=(dispatch,), daemon=True)
+            self._listener.start()
+
+    # Обрыв связи с Redis не останавливает слушателя: переподключение через секунду
+    def _listen(self, dispatch):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    event_id, data = message['data'].decode().split('\n', 1)
+                    dispatch(int(event_id), data)
+            except Exception:
+                logger.exception('Поток событий Redis прерван, переподключение')
+                time.sleep(1)
+
+
+# Подписчики текущего процесса и последние события для продолжения после переподключения (Last-Event-ID)
+class EventBroker:
+    def __init__(self, dumps, history=500, max_pending=1000, backend=None):
+        self.dumps = dumps
+        self.max_pending = max_pending
+        self.backend = backend
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        # Номера растут и между перезапусками: старый Last-Event-ID не совпадет с новыми событиями
+        self._last_id = int(time.time() * 1000)
+        self._published = 0
+
+    def publish(self, event):
+        data = self.dumps(event)
+        if self.backend is not None:
+            self.backend.publish(data)
+            return
+        with self._lock:
+            self._last_id += 1
+            event_id = self._last_id
+        self._dispatch(event_id, data)
+
+    def _dispatch(self, event_id, data):
+        frame = sse_frame(event_id, data)
+        with self._lock:
+            self._history.append((event_id, frame))
+            self._published += 1
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(frame)
+            if subscription.closed:
+                self.unsubscribe(subscription)
+
+    # Новая подписка; с last_event_id сначала отдаются пропущенные события,
+    # а если их уже нет в истории - reset (страница загружает данные заново)
+    def subscribe(self, last_event_id=None):
+        if self.backend is not None:
+            self.backend.start(self._dispatch)
+        subscription = Subscription(self.max_pending)
+        with self._lock:
+            if last_event_id is not None and not (self._history and last_event_id >= self._history[-1][0]):
+                if self._history and self._history[0][0] <= last_event_id + 1:
+                    for event_id, frame in self._history:
+                        if event_id > last_event_id:
+                            subscription.push(frame)
+                else:
+                    subscription.push(RESET_FRAME)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    # Событие кто-то получит: подписчики этого процесса или, через Redis, других воркеров
+    def has_listeners(self):
+        with self._lock:
+            return self.backend is not None or bool(self._subscribers)
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': len(self._subscribers), 'published': self._published,
+                    'history': len(self._history)}
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+# Поток SSE для WSGI: кадры событий, а в тишине - комментарий-пинг (держит соединение и прокси)
+def event_stream(broker, last_event_id, heartbeat, retry_ms=3000):
+    subscription = broker.subscribe(last_event_id)
+    try:
+        yield f'retry: {retry_ms}\n\n'
+        while not subscription.finished:
+            frames = subscription.get(heartbeat)
+            yield ''.join(frames) or PING_FRAME
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def create_event_broker(config, dumps):
+    backend = None
+    if config.get('EVENTS_REDIS_URL'):
+        backend = RedisEventBackend(config['EVENTS_REDIS_URL'])
+    return EventBroker(dumps, history=config['EVENTS_HISTORY'], max_pending=config['EVENTS_QUEUE_SIZE'],
+                       backend=backend)
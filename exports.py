@@ -0,0 +1,86 @@
+import csv
+import datetime
+import io
+import json
+
+from sqlalchemy import select
+
+from models_auto import Customers, Services, Record
+
+# Сколько строк забирать из серверного курсора за раз
+EXPORT_BATCH_SIZE = 1000
+
+RECORD_EXPORT_COLUMNS = [
+    'ID', 'date', 'customer_id', 'customer_surname', 'customer_name', 'customer_patronymic',
+    'customer_phone', 'service_id', 'service_name', 'price', 'name'
+]
+
+EXPENSE_EXPORT_COLUMNS = [
+    'service_name', 'material_name', 'consumption_per_service', 'total_consumption', 'unit',
+    'cost_per_service', 'total_cost', 'services_count'
+]
+
+
+# Записи с клиентом и услугой потоком: строки читаются пачками через серверный курсор,
+# поэтому память не зависит от размера таблицы
+def iter_record_rows(session, start_date=None, end_date=None):
+    query = select(
+        Record.ID,
+        Record.date,
+        Record.id_customers,
+        Customers.surname,
+        Customers.name,
+        Customers.patronymic,
+        Customers.phone,
+        Record.id_services,
+        Services.name,
+        Services.price,
+        Record.name
+    ). \
+        outerjoin(Customers, Record.id_customers == Customers.ID). \
+        outerjoin(Services, Record.id_services == Services.ID). \
+        order_by(Record.date, Record.ID)
+
+    if start_date:
+        query = query.where(Record.date >= start_date)
+    if end_date:
+        query = query.where(Record.date <= end_date)
+
+    result = session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for row in result:
+        yield dict(zip(RECORD_EXPORT_COLUMNS, row))
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f'Нельзя сериализовать {type(value).__name__}')
+
+
+def ndjson_stream(rows):
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(row, ensure_ascii=False, default=_json_default))
+        if len(buffer) >= EXPORT_BATCH_SIZE:
+            yield '\n'.join(buffer) + '\n'
+            buffer = []
+    if buffer:
+        yield '\n'.join(buffer) + '\n'
+
+
+def csv_stream(columns, rows):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=columns, extrasaction='ignore')
+
+    # BOM - чтобы Excel открыл кириллицу в UTF-8 без настройки импорта
+    output.write('\ufeff')
+    writer.writeheader()
+
+    for count, row in enumerate(rows, 1):
+        writer.writerow({k: v.isoformat() if isinstance(v, datetime.datetime) else v for k, v in row.items()})
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+
+    yield output.getvalue()
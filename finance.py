@@ -0,0 +1,283 @@
+import datetime
+
+from sqlalchemy import func, select
+
+from models_auto import Customers, Services, Supplies, Record, ServicesSupplies
+from rollup import query_rollup_daily_revenue, query_rollup_service_stats
+
+CHART_BUCKET_UNITS = {'day': 'hour', 'month': 'day', 'year': 'month'}
+
+# Периоды, которые можно считать по дневной свертке (для дня нужна разбивка по часам)
+ROLLUP_PERIODS = ('month', 'year')
+
+SQLITE_BUCKET_FORMATS = {
+    'hour': '%Y-%m-%d %H:00:00',
+    'day': '%Y-%m-%d 00:00:00',
+    'month': '%Y-%m-01 00:00:00'
+}
+
+
+# Границы периода для фильтрации
+def get_period_bounds(base_date, period):
+    if period == 'month':
+        start_date = base_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        next_month = base_date.replace(day=28) + datetime.timedelta(days=4)
+        end_date = next_month - datetime.timedelta(days=next_month.day)
+        end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+    elif period == 'year':
+        start_date = base_date.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        end_date = base_date.replace(month=12, day=31, hour=23, minute=59, second=59, microsecond=999999)
+    else:
+        start_date = base_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        end_date = base_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+    return start_date, end_date
+
+
+# Количество и выручка по каждой услуге за период (GROUP BY в базе)
+def query_service_stats(session, start_date, end_date):
+    rows = session.execute(
+        select(
+            Services.ID,
+            func.count(Record.ID),
+            func.coalesce(func.sum(func.coalesce(Services.price, 0)), 0)
+        ).
+        select_from(Record).
+        join(Services, Record.id_services == Services.ID).
+        join(Customers, Record.id_customers == Customers.ID).
+        where(Record.date >= start_date, Record.date <= end_date).
+        group_by(Services.ID)
+    ).all()
+
+    return {service_id: {'count': count, 'total_revenue': revenue} for service_id, count, revenue in rows}
+
+
+# Записи за период - только нужные колонки, без создания ORM-объектов
+def query_period_records(session, start_date, end_date):
+    rows = session.execute(
+        select(Record.ID, Record.date, Services.name, Services.ID, Customers.surname, Customers.name, Services.price).
+        select_from(Record).
+        join(Services, Record.id_services == Services.ID).
+        join(Customers, Record.id_customers == Customers.ID).
+        where(Record.date >= start_date, Record.date <= end_date).
+        order_by(Record.date, Record.ID)
+    ).all()
+
+    return [{
+        'ID': record_id,
+        'date': date.isoformat() if date else None,
+        'service_name': service_name,
+        'service_id': service_id,
+        'client_name': f"{surname or ''} {name or ''}".strip(),
+        'price': price or 0
+    } for record_id, date, service_name, service_id, surname, name, price in rows]
+
+
+def _expense_rows(rows, service_stats):
+    expenses_data = []
+    for service_id, service_name, supply_name, supply_price, consumption, unit in rows:
+        service_count = service_stats[service_id]['count']
+        material_cost_per_service = (supply_price or 0) * (consumption or 0)
+
+        expenses_data.append({
+            'service_id': service_id,
+            'service_name': service_name,
+            'material_name': supply_name,
+            'consumption_per_service': consumption or 0,
+            'total_consumption': (consumption or 0) * service_count,
+            'unit': unit or 'шт',
+            'cost_per_service': material_cost_per_service,
+            'total_cost': material_cost_per_service * service_count,
+            'services_count': service_count
+        })
+
+    return expenses_data
+
+
+# Расход материалов только по услугам, выполненным за период
+def query_material_expenses(session, service_stats):
+    service_ids = list(service_stats)
+    if not service_ids:
+        return []
+
+    rows = session.execute(
+        select(
+            Services.ID,
+            Services.name,
+            Supplies.name,
+            Supplies.price,
+            ServicesSupplies.material_consumption,
+            ServicesSupplies.units_measurement
+        ).
+        select_from(ServicesSupplies).
+        join(Services, ServicesSupplies.id_services == Services.ID).
+        join(Supplies, ServicesSupplies.id_supplies == Supplies.ID).
+        where(ServicesSupplies.id_services.in_(service_ids)).
+        order_by(ServicesSupplies.ID)
+    ).all()
+
+    return _expense_rows(rows, service_stats)
+
+
+# То же по закэшированным справочникам услуг, материалов и норм расхода
+def catalog_material_expenses(catalog, service_stats):
+    if not service_stats:
+        return []
+
+    services = {s['ID']: s for s in catalog.services()}
+    supplies = {s['ID']: s for s in catalog.supplies()}
+
+    rows = []
+    for ss in sorted(catalog.services_supplies(), key=lambda ss: ss['ID']):
+        service = services.get(ss['id_services'])
+        supply = supplies.get(ss['id_supplies'])
+        if service is None or supply is None or service['ID'] not in service_stats:
+            continue
+        rows.append((service['ID'], service['name'], supply['name'], supply['price'],
+                     ss['material_consumption'], ss['units_measurement']))
+
+    return _expense_rows(rows, service_stats)
+
+
+# Группировка даты по часу/дню/месяцу на стороне базы
+def bucket_expression(session, column, unit):
+    if session.get_bind().dialect.name == 'sqlite':
+        return func.strftime(SQLITE_BUCKET_FORMATS[unit], column)
+    return func.date_trunc(unit, column)
+
+
+# Выручка по интервалам графика одним запросом
+def query_revenue_buckets(session, start_date, end_date, unit):
+    bucket = bucket_expression(session, Record.date, unit).label('bucket')
+    rows = session.execute(
+        select(bucket, func.coalesce(func.sum(func.coalesce(Services.price, 0)), 0)).
+        select_from(Record).
+        join(Services, Record.id_services == Services.ID).
+        join(Customers, Record.id_customers == Customers.ID).
+        where(Record.date >= start_date, Record.date <= end_date).
+        group_by(bucket)
+    ).all()
+
+    buckets = {}
+    for bucket_start, revenue in rows:
+        if isinstance(bucket_start, str):
+            bucket_start = datetime.datetime.fromisoformat(bucket_start)
+        buckets[bucket_start] = revenue
+    return buckets
+
+
+# Начала интервалов графика и подписи к ним
+def chart_buckets(base_date, period, start_date, end_date):
+    if period == 'day':
+        # Для дня - разбиваем по часам
+        return [(start_date.replace(hour=hour), f"{hour:02d}:00") for hour in range(0, 24)]
+
+    if period == 'month':
+        # Для месяца - разбиваем по дням
+        days = (end_date.date() - start_date.date()).days + 1
+        return [(start_date + datetime.timedelta(days=n),
+                 (start_date + datetime.timedelta(days=n)).strftime('%d.%m')) for n in range(days)]
+
+    if period == 'year':
+        # Для года - разбиваем по месяцам
+        return [(base_date.replace(month=month, day=1), base_date.replace(month=month, day=1).strftime('%B'))
+                for month in range(1, 13)]
+
+    return []
+
+
+# Выручка по интервалам графика из дневной свертки (не больше 366 строк)
+def rollup_revenue_buckets(session, start_date, end_date, unit):
+    buckets = {}
+    for day, revenue in query_rollup_daily_revenue(session, start_date, end_date).items():
+        if unit == 'month':
+            day = day.replace(day=1)
+        bucket_start = datetime.datetime.combine(day, datetime.time.min)
+        buckets[bucket_start] = buckets.get(bucket_start, 0) + revenue
+    return buckets
+
+
+def build_chart_series(base_date, period, start_date, end_date, revenue_by_bucket, total_revenue, total_expenses):
+    series = {'labels': [], 'revenue': [], 'expenses': [], 'profit': []}
+
+    for bucket_start, label in chart_buckets(base_date, period, start_date, end_date):
+        revenue = revenue_by_bucket.get(bucket_start, 0)
+
+        # Расходы распределяем пропорционально выручке
+        if total_revenue > 0:
+            expenses = total_expenses * (revenue / total_revenue)
+        else:
+            expenses = 0
+
+        series['labels'].append(label)
+        series['revenue'].append(revenue)
+        series['expenses'].append(expenses)
+        series['profit'].append(revenue - expenses)
+
+    return series
+
+
+# Данные графика для выбранного типа отчета
+def chart_data(chart_series, report_type):
+    chart_type = report_type if report_type in ('revenue', 'expenses') else 'profit'
+    return {
+        'labels': chart_series['labels'],
+        'values': chart_series[chart_type]
+    }
+
+
+# Статистика услуг и расход материалов за период
+def build_period_expenses(session, start_date, end_date, use_rollup=False, catalog=None):
+    if use_rollup:
+        service_stats = query_rollup_service_stats(session, start_date, end_date)
+    else:
+        service_stats = query_service_stats(session, start_date, end_date)
+
+    if catalog is not None:
+        expenses_data = catalog_material_expenses(catalog, service_stats)
+    else:
+        expenses_data = query_material_expenses(session, service_stats)
+
+    return service_stats, expenses_data
+
+
+def build_finance_report(session, base_date, period, report_type, use_rollup=False, catalog=None):
+    start_date, end_date = get_period_bounds(base_date, period)
+    use_rollup = use_rollup and period in ROLLUP_PERIODS
+
+    service_stats, expenses_data = build_period_expenses(session, start_date, end_date, use_rollup, catalog)
+    records_data = query_period_records(session, start_date, end_date)
+
+    total_revenue = sum(s['total_revenue'] for s in service_stats.values())
+    if use_rollup:
+        total_expenses = sum(s['material_cost'] for s in service_stats.values())
+    else:
+        total_expenses = sum(e['total_cost'] for e in expenses_data)
+
+    unit = CHART_BUCKET_UNITS.get(period)
+    if unit is None:
+        revenue_by_bucket = {}
+    elif use_rollup:
+        revenue_by_bucket = rollup_revenue_buckets(session, start_date, end_date, unit)
+    else:
+        revenue_by_bucket = query_revenue_buckets(session, start_date, end_date, unit)
+
+    response_data = {
+        'summary': {
+            'revenue': total_revenue,
+            'expenses': total_expenses,
+            'profit': total_revenue - total_expenses
+        },
+        'records': records_data,
+        'expenses': expenses_data,
+        # Границы периода - страница по ним решает, меняет ли событие о записи этот отчет
+        'period': {'start': start_date.isoformat(), 'end': end_date.isoformat()}
+    }
+
+    # Генерируем данные для графика сразу для всех типов отчета
+    chart_series = build_chart_series(base_date, period, start_date, end_date,
+                                      revenue_by_bucket, total_revenue, total_expenses)
+    response_data['chartData'] = chart_data(chart_series, report_type)
+    response_data['chartSeries'] = chart_series
+
+    return response_data
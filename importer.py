@@ -0,0 +1,393 @@
+import csv
+import datetime
+import io
+import os
+import re
+import time
+
+from sqlalchemy import Column, MetaData, Table, delete, exists, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql
+
+from bulk import BULK_ENTITIES, BulkValidationError
+from models_auto import Base, Customers, ImportCustomerMap, ImportProgress
+
+# Строк в одной транзакции: после каждой пачки сохраняется прогресс, с него импорт и продолжается
+IMPORT_CHUNK_SIZE = 50000
+
+# Порядок загрузки - сначала справочники, потом ссылающиеся на них таблицы: (таблица, сущность из bulk)
+IMPORT_TABLES = [
+    ('customers', 'customers'),
+    ('services', 'services'),
+    ('supplies', 'supplies'),
+    ('services_supplies', 'services_supplies'),
+    ('record', 'records'),
+]
+
+IMPORT_FORMATS = ('dump', 'csv', 'xlsx')
+
+# Сколько ID конфликтующих строк показывать в сообщении об ошибке
+CONFLICT_REPORT_LIMIT = 10
+
+COPY_HEADER = re.compile(r'^COPY (?:public\.)?"?(\w+)"? \((.*)\) FROM stdin;$')
+
+COPY_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '\\': '\\'}
+
+
+class DataImportError(ValueError):
+    pass
+
+
+def _identifier(value):
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BulkValidationError('Ожидается целое число')
+
+
+def _unescape_copy(value):
+    if value == '\\N':
+        return None
+    if '\\' not in value:
+        return value
+    result = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            char = next(chars, '')
+            result.append(COPY_ESCAPES.get(char, char))
+        else:
+            result.append(char)
+    return ''.join(result)
+
+
+def _copy_text(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+# Блоки "COPY ... FROM stdin" из pg_dump в текстовом формате (как tatto.txt)
+class DumpSource:
+    def __init__(self, path):
+        self.path = path
+
+    def open(self, names):
+        handle = open(self.path, encoding='utf-8')
+        for line in handle:
+            match = COPY_HEADER.match(line.rstrip('\n'))
+            if match and match.group(1) in names:
+                return [c.strip().strip('"') for c in match.group(2).split(',')], self._rows(handle)
+        handle.close()
+        return None
+
+    @staticmethod
+    def _rows(handle):
+        with handle:
+            for line in handle:
+                line = line.rstrip('\n')
+                if line == '\\.':
+                    return
+                yield [_unescape_copy(value) for value in line.split('\t')]
+
+
+# CSV: каталог с файлами <таблица>.csv или один файл с именем таблицы
+class CsvSource:
+    def __init__(self, path):
+        self.path = path
+
+    def _find(self, names):
+        if os.path.isdir(self.path):
+            for name in names:
+                candidate = os.path.join(self.path, f'{name}.csv')
+                if os.path.exists(candidate):
+                    return candidate
+            return None
+        stem = os.path.splitext(os.path.basename(self.path))[0]
+        return self.path if stem in names else None
+
+    def open(self, names):
+        path = self._find(names)
+        if path is None:
+            return None
+
+        # utf-8-sig снимает BOM, который добавляет Excel (и наш экспорт)
+        handle = open(path, encoding='utf-8-sig', newline='')
+        sample = handle.read(4096)
+        handle.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+
+        reader = csv.reader(handle, dialect)
+        header = next(reader, None)
+        if header is None:
+            handle.close()
+            return None
+        return header, self._rows(handle, reader)
+
+    @staticmethod
+    def _rows(handle, reader):
+        with handle:
+            for row in reader:
+                if row:
+                    yield [value if value != '' else None for value in row]
+
+
+# XLSX: лист на каждую таблицу, в первой строке - названия колонок
+class XlsxSource:
+    def __init__(self, path):
+        try:
+            import openpyxl
+        except ImportError:
+            raise DataImportError('Для импорта XLSX нужен пакет openpyxl (pip install openpyxl)')
+        self.workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+
+    @staticmethod
+    def _cell(value):
+        # Телефоны и ID в Excel часто хранятся как числа с плавающей точкой
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return None if value == '' else value
+
+    def open(self, names):
+        for name in names:
+            if name in self.workbook.sheetnames:
+                rows = self.workbook[name].iter_rows(values_only=True)
+                header = next(rows, None)
+                if header is None:
+                    return None
+                return ([str(c) if c is not None else '' for c in header],
+                        ([self._cell(v) for v in row] for row in rows if any(v is not None for v in row)))
+        return None
+
+
+def open_source(path, fmt=None):
+    if not os.path.exists(path):
+        raise DataImportError(f'Файл не найден: {path}')
+    if fmt is None:
+        extension = os.path.splitext(path)[1].lower()
+        fmt = 'xlsx' if extension == '.xlsx' else 'csv' if extension == '.csv' or os.path.isdir(path) else 'dump'
+    if fmt not in IMPORT_FORMATS:
+        raise DataImportError(f'Неизвестный формат: {fmt}')
+    return {'dump': DumpSource, 'csv': CsvSource, 'xlsx': XlsxSource}[fmt](path)
+
+
+# Сопоставление колонок источника с колонками таблицы (без учета регистра), лишние колонки пропускаются
+def _source_columns(table, entity, header):
+    names = {column.name.lower(): column.name for column in table.columns}
+    positions = []
+    for position, title in enumerate(header):
+        name = names.get((title or '').strip().strip('"').lower())
+        if name and name not in {p[1] for p in positions}:
+            positions.append((position, name, entity.fields.get(name, _identifier)))
+
+    found = {name for _, name, _ in positions}
+    missing = [field for field in entity.required if field not in found]
+    if missing:
+        raise DataImportError(f'{table.name}: нет колонок {", ".join(missing)}')
+    if not positions:
+        raise DataImportError(f'{table.name}: ни одна колонка не совпала с таблицей')
+    return positions
+
+
+def _chunks(table_name, rows, positions, chunk_size, skip):
+    chunk = []
+    for number, row in enumerate(rows, 1):
+        if number <= skip:
+            continue
+        try:
+            chunk.append({name: convert(row[position] if position < len(row) else None)
+                          for position, name, convert in positions})
+        except BulkValidationError as e:
+            raise DataImportError(f'{table_name}, строка {number}: {e}')
+        if len(chunk) >= chunk_size:
+            yield number, chunk
+            chunk = []
+    if chunk:
+        yield number, chunk
+
+
+def _stage_table(table, columns):
+    return Table(f'import_stage_{table.name}', MetaData(),
+                 *[Column(name, table.c[name].type) for name in columns], prefixes=['TEMPORARY'])
+
+
+# Пачка во временную таблицу: в Postgres через COPY, в остальных базах - многострочной вставкой
+def _load_stage(conn, stage, columns, rows):
+    if conn.dialect.name != 'postgresql':
+        conn.execute(insert(stage), rows)
+        return
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_text(row[name]) for name in columns))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    column_list = ', '.join(f'"{name}"' for name in columns)
+    with conn.connection.dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY {stage.name} ({column_list}) FROM STDIN', buffer)
+
+
+# Вставка без дублей: строки, конфликтующие по ключу или уникальному полю, пропускаются
+def _insert_ignore(conn, table, columns, query):
+    if conn.dialect.name == 'postgresql':
+        statement = postgresql.insert(table).from_select(columns, query).on_conflict_do_nothing()
+    else:
+        statement = insert(table).prefix_with('OR IGNORE').from_select(columns, query)
+    return conn.execute(statement).rowcount
+
+
+def _map_customers(conn, source, pairs):
+    if not pairs:
+        return
+    conn.execute(delete(ImportCustomerMap).where(ImportCustomerMap.source == source,
+                                                 ImportCustomerMap.source_id.in_([p[0] for p in pairs])))
+    conn.execute(insert(ImportCustomerMap),
+                 [{'source': source, 'source_id': source_id, 'target_id': target_id} for source_id, target_id in pairs])
+
+
+# Клиенты сливаются по телефону (ограничение mobile_phone): ссылки записей переводятся на уже существующего клиента
+def _merge_customers(conn, source, stage, columns, stats):
+    dedupe = 'ID' in columns and 'phone' in columns
+
+    if dedupe:
+        # ID занят другим клиентом, а телефон новый - клиент получает новый ID
+        moved = conn.execute(select(stage).where(
+            exists().where(Customers.ID == stage.c.ID, Customers.phone.is_distinct_from(stage.c.phone)),
+            ~exists().where(Customers.phone == stage.c.phone)
+        )).mappings().all()
+        if moved:
+            new_ids = conn.scalars(
+                insert(Customers).returning(Customers.ID, sort_by_parameter_order=True),
+                [{k: v for k, v in row.items() if k != 'ID'} for row in moved]
+            ).all()
+            _map_customers(conn, source, list(zip([row['ID'] for row in moved], new_ids)))
+            conn.execute(delete(stage).where(stage.c.ID.in_([row['ID'] for row in moved])))
+            stats['inserted'] += len(moved)
+
+    stats['inserted'] += _insert_ignore(conn, Customers.__table__, columns, select(*stage.c))
+
+    if dedupe:
+        merged = conn.execute(
+            select(stage.c.ID, Customers.ID).distinct().
+            join(Customers, Customers.phone == stage.c.phone).
+            where(Customers.ID != stage.c.ID)
+        ).all()
+        _map_customers(conn, source, [tuple(row) for row in merged])
+        stats['merged'] += len(merged)
+
+
+# ID из источника уже занят в базе другой строкой: такие строки не пропускаются молча, импорт прерывается.
+# Строки, совпадающие с уже загруженными (повторный импорт), просто пропускаются.
+def _check_conflicts(conn, table, stage, columns):
+    if 'ID' not in columns:
+        return
+    differs = or_(*[table.c[name].is_distinct_from(stage.c[name]) for name in columns if name != 'ID'])
+    conflicts = select(stage.c.ID).join(table, table.c.ID == stage.c.ID).where(differs)
+    total = conn.scalar(select(func.count()).select_from(conflicts.subquery()))
+    if total:
+        ids = conn.scalars(conflicts.order_by(stage.c.ID).limit(CONFLICT_REPORT_LIMIT)).all()
+        raise DataImportError(f'ID уже заняты в базе другими данными (строк: {total}): '
+                              f'{", ".join(map(str, ids))}{"..." if total > len(ids) else ""}')
+
+
+def _merge_table(conn, source, table, stage, columns, stats):
+    if table.name == 'customers':
+        _merge_customers(conn, source, stage, columns, stats)
+        return
+
+    if 'id_customers' in columns:
+        conn.execute(
+            update(stage).
+            where(ImportCustomerMap.source == source, ImportCustomerMap.source_id == stage.c.id_customers).
+            values(id_customers=ImportCustomerMap.target_id)
+        )
+    _check_conflicts(conn, table, stage, columns)
+    inserted = _insert_ignore(conn, table, columns, select(*stage.c))
+    stats['inserted'] += inserted
+    stats['skipped'] += conn.scalar(select(func.count()).select_from(stage)) - inserted
+
+
+def _rows_done(session, source, table_name):
+    return session.scalar(select(ImportProgress.rows_done).where(
+        ImportProgress.source == source, ImportProgress.table_name == table_name)) or 0
+
+
+def _save_progress(conn, source, table_name, rows_done):
+    values = {'rows_done': rows_done, 'updated_at': datetime.datetime.now()}
+    updated = conn.execute(update(ImportProgress).where(
+        ImportProgress.source == source, ImportProgress.table_name == table_name).values(**values))
+    if not updated.rowcount:
+        conn.execute(insert(ImportProgress).values(source=source, table_name=table_name, **values))
+
+
+# После вставки с явными ID в Postgres нужно сдвинуть последовательности
+def _reset_sequences(conn):
+    for table_name, _ in IMPORT_TABLES:
+        conn.exec_driver_sql(
+            f'SELECT setval(pg_get_serial_sequence(\'"{table_name}"\', \'ID\'), '
+            f'COALESCE((SELECT MAX("ID") FROM "{table_name}"), 1))'
+        )
+
+
+# Загрузка всех найденных в источнике таблиц. Каждая пачка - отдельная транзакция вместе с отметкой прогресса,
+# поэтому после сбоя повторный запуск продолжает с первой незагруженной строки.
+def import_data(session, path, fmt=None, source=None, chunk_size=IMPORT_CHUNK_SIZE, restart=False, log=None):
+    dialect = session.get_bind().dialect.name
+    if dialect not in ('postgresql', 'sqlite'):
+        raise DataImportError(f'Импорт не поддерживается для {dialect}')
+
+    reader = open_source(path, fmt)
+    source = source or os.path.abspath(path)
+    log = log or (lambda message: None)
+
+    if restart:
+        session.execute(delete(ImportProgress).where(ImportProgress.source == source))
+        session.execute(delete(ImportCustomerMap).where(ImportCustomerMap.source == source))
+        session.commit()
+
+    stats = {}
+    for table_name, entity_name in IMPORT_TABLES:
+        opened = reader.open((table_name, entity_name))
+        if opened is None:
+            continue
+
+        header, rows = opened
+        table = Base.metadata.tables[table_name]
+        positions = _source_columns(table, BULK_ENTITIES[entity_name], header)
+        columns = [name for _, name, _ in positions]
+        done = _rows_done(session, source, table_name)
+        table_stats = stats[table_name] = {'read': 0, 'inserted': 0, 'merged': 0, 'skipped': 0,
+                                           'resumed_from': done, 'seconds': 0.0}
+        started = time.monotonic()
+
+        for last_number, chunk in _chunks(table_name, rows, positions, chunk_size, done):
+            stage = _stage_table(table, columns)
+            try:
+                conn = session.connection()
+                conn.exec_driver_sql(f'DROP TABLE IF EXISTS {stage.name}')
+                stage.create(conn)
+                _load_stage(conn, stage, columns, chunk)
+                _merge_table(conn, source, table, stage, columns, table_stats)
+                stage.drop(conn)
+                _save_progress(conn, source, table_name, last_number)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                raise DataImportError(f'{table_name}, строки {last_number - len(chunk) + 1}-{last_number}: {e}')
+
+            table_stats['read'] += len(chunk)
+            table_stats['seconds'] = round(time.monotonic() - started, 2)
+            log(f'{table_name}: загружено строк {last_number} за {table_stats["seconds"]} с')
+
+    if dialect == 'postgresql':
+        _reset_sequences(session.connection())
+        session.commit()
+
+    return stats
@@ -0,0 +1,326 @@
+import datetime
+
+from sqlalchemy import bindparam, delete, exists, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql
+
+from models_auto import Record, ServicesSupplies, Supplies, SupplyDailyUsage, SupplyLedger, SupplyStock
+
+# Складской учет материалов. Журнал supply_ledger - источник истины: каждая запись (Record) списывает
+# материалы по нормам расхода своей услуги, правка записи сторнирует прежнее списание и пишет новое.
+# Из журнала инкрементально ведутся остатки (supply_stock) и дневной расход (supply_daily_usage),
+# поэтому остаток и расход за период читаются без обхода истории записей.
+# Количество в журнале - изменение остатка (списание отрицательное), стоимость - по цене материала на момент проводки.
+
+# Виды проводок: списание по записи и его сторно, поступление, списание вручную, инвентаризация,
+# начальная проводка (уравновешивает историю, загруженную задним числом)
+LEDGER_KINDS = ('consume', 'reverse', 'receipt', 'writeoff', 'count', 'opening')
+
+EPSILON = 1e-9
+
+
+class InventoryError(ValueError):
+    pass
+
+
+def _day(value):
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+# Вставка строк, которых еще нет (конкурентная вставка того же ключа не падает)
+def _insert_missing(session, table, rows):
+    if not rows:
+        return
+    conn = session.connection()
+    if conn.dialect.name == 'postgresql':
+        conn.execute(postgresql.insert(table).on_conflict_do_nothing(), rows)
+    else:
+        conn.execute(insert(table).prefix_with('OR IGNORE'), rows)
+
+
+# Нормы расхода: услуга -> [(материал, расход на одну услугу, цена материала)]
+def _service_norms(session, service_ids):
+    service_ids = {service_id for service_id in service_ids if service_id is not None}
+    if not service_ids:
+        return {}
+    rows = session.execute(
+        select(ServicesSupplies.id_services, ServicesSupplies.id_supplies,
+               ServicesSupplies.material_consumption, Supplies.price).
+        join(Supplies, ServicesSupplies.id_supplies == Supplies.ID).
+        where(ServicesSupplies.id_services.in_(service_ids)).
+        order_by(ServicesSupplies.ID)
+    )
+    norms = {}
+    for service_id, supply_id, consumption, price in rows:
+        if consumption:
+            norms.setdefault(service_id, []).append((supply_id, consumption, price or 0))
+    return norms
+
+
+# Что сейчас списано по записям: запись -> {(материал, день): (количество, стоимость)}
+def _record_balances(session, record_ids):
+    rows = session.execute(
+        select(SupplyLedger.id_record, SupplyLedger.id_supplies, SupplyLedger.day,
+               func.sum(SupplyLedger.quantity), func.sum(SupplyLedger.cost)).
+        where(SupplyLedger.id_record.in_(record_ids)).
+        group_by(SupplyLedger.id_record, SupplyLedger.id_supplies, SupplyLedger.day)
+    )
+    balances = {}
+    for record_id, supply_id, day, quantity, cost in rows:
+        if abs(quantity or 0) > EPSILON:
+            balances.setdefault(record_id, {})[(supply_id, _day(day))] = (quantity, cost or 0)
+    return balances
+
+
+def _same_consumption(current, wanted):
+    return current.keys() == wanted.keys() and all(
+        abs(current[key][0] - wanted[key][0]) <= EPSILON for key in current
+    )
+
+
+def _entry(supply_id, quantity, cost, kind, now, record_id=None, day=None, comment=None):
+    return {'id_supplies': supply_id, 'id_record': record_id, 'day': day, 'quantity': quantity,
+            'cost': cost, 'kind': kind, 'comment': comment, 'created_at': now}
+
+
+# Запись проводок и инкрементальное обновление остатков и дневного расхода
+def _post_entries(session, entries, now):
+    if not entries:
+        return
+    session.execute(insert(SupplyLedger), entries)
+
+    stock = {}
+    usage = {}
+    for entry in entries:
+        stock[entry['id_supplies']] = stock.get(entry['id_supplies'], 0) + entry['quantity']
+        if entry['id_record'] is not None and entry['day'] is not None:
+            key = (entry['day'], entry['id_supplies'])
+            quantity, cost = usage.get(key, (0, 0))
+            usage[key] = (quantity - entry['quantity'], cost - entry['cost'])
+
+    stock_table = SupplyStock.__table__
+    _insert_missing(session, stock_table, [{'id_supplies': supply_id, 'on_hand': 0} for supply_id in stock])
+    session.connection().execute(
+        update(stock_table).
+        where(stock_table.c.id_supplies == bindparam('b_supply')).
+        values(on_hand=stock_table.c.on_hand + bindparam('b_delta'), updated_at=bindparam('b_now')),
+        [{'b_supply': supply_id, 'b_delta': delta, 'b_now': now} for supply_id, delta in sorted(stock.items())]
+    )
+
+    if usage:
+        usage_table = SupplyDailyUsage.__table__
+        _insert_missing(session, usage_table,
+                        [{'day': day, 'id_supplies': supply_id, 'quantity': 0, 'cost': 0} for day, supply_id in usage])
+        session.connection().execute(
+            update(usage_table).
+            where(usage_table.c.day == bindparam('b_day'), usage_table.c.id_supplies == bindparam('b_supply')).
+            values(quantity=usage_table.c.quantity + bindparam('b_quantity'),
+                   cost=usage_table.c.cost + bindparam('b_cost')),
+            [{'b_day': day, 'b_supply': supply_id, 'b_quantity': quantity, 'b_cost': cost}
+             for (day, supply_id), (quantity, cost) in sorted(usage.items())]
+        )
+
+
+# Списание материалов по записям после их создания, правки или удаления (в той же транзакции).
+# Удаленная запись сторнируется целиком; у измененной сторно и новое списание пишутся, только если
+# поменялись услуга или день - правка названия журнал не трогает.
+def sync_record_consumption(session, record_ids):
+    record_ids = {record_id for record_id in record_ids if record_id is not None}
+    if not record_ids:
+        return
+
+    states = {record_id: (service_id, _day(date)) for record_id, service_id, date in session.execute(
+        select(Record.ID, Record.id_services, Record.date).where(Record.ID.in_(record_ids))
+    )}
+    norms = _service_norms(session, {service_id for service_id, _ in states.values()})
+    balances = _record_balances(session, record_ids)
+    now = datetime.datetime.now()
+
+    entries = []
+    for record_id in sorted(record_ids):
+        current = balances.get(record_id, {})
+        wanted = {}
+        if record_id in states:
+            service_id, day = states[record_id]
+            for supply_id, consumption, price in norms.get(service_id, []):
+                quantity, cost = wanted.get((supply_id, day), (0, 0))
+                wanted[(supply_id, day)] = (quantity - consumption, cost - consumption * price)
+
+        if _same_consumption(current, wanted):
+            continue
+        for (supply_id, day), (quantity, cost) in current.items():
+            entries.append(_entry(supply_id, -quantity, -cost, 'reverse', now, record_id, day))
+        for (supply_id, day), (quantity, cost) in wanted.items():
+            entries.append(_entry(supply_id, quantity, cost, 'consume', now, record_id, day))
+
+    _post_entries(session, entries, now)
+
+
+def _current_on_hand(session, supply_id):
+    on_hand = session.scalar(
+        select(SupplyStock.on_hand).where(SupplyStock.id_supplies == supply_id).with_for_update()
+    )
+    return on_hand or 0
+
+
+# Движение остатка вручную: поступление (quantity > 0), списание (quantity < 0)
+# или инвентаризация (on_hand - фактический остаток, в журнал пишется разница)
+def adjust_stock(session, supply_id, quantity=None, on_hand=None, comment=None):
+    price = session.scalar(select(Supplies.price).where(Supplies.ID == supply_id))
+    if on_hand is not None:
+        quantity = on_hand - _current_on_hand(session, supply_id)
+        kind = 'count'
+    elif quantity is None or quantity == 0:
+        raise InventoryError('Укажите количество (quantity) или фактический остаток (on_hand)')
+    else:
+        kind = 'receipt' if quantity > 0 else 'writeoff'
+
+    if abs(quantity) > EPSILON:
+        now = datetime.datetime.now()
+        _post_entries(session, [_entry(supply_id, quantity, quantity * (price or 0), kind, now, comment=comment)], now)
+
+
+# Порог остатка, ниже которого материал считается заканчивающимся (None - без порога)
+def set_min_level(session, supply_id, min_level):
+    _insert_missing(session, SupplyStock.__table__, [{'id_supplies': supply_id, 'on_hand': 0}])
+    session.execute(update(SupplyStock).where(SupplyStock.id_supplies == supply_id).values(min_level=min_level))
+
+
+# Остатки материалов; low_only - только те, что дошли до порога
+def stock_levels(session, low_only=False, supply_ids=None):
+    units = select(ServicesSupplies.id_supplies, func.min(ServicesSupplies.units_measurement).label('unit')). \
+        group_by(ServicesSupplies.id_supplies).subquery()
+    on_hand = func.coalesce(SupplyStock.on_hand, 0)
+
+    query = select(Supplies.ID, Supplies.name, on_hand, SupplyStock.min_level, units.c.unit, SupplyStock.updated_at). \
+        outerjoin(SupplyStock, SupplyStock.id_supplies == Supplies.ID). \
+        outerjoin(units, units.c.id_supplies == Supplies.ID). \
+        order_by(Supplies.ID)
+    if low_only:
+        query = query.where(SupplyStock.min_level.is_not(None), on_hand <= SupplyStock.min_level)
+    if supply_ids is not None:
+        query = query.where(Supplies.ID.in_(supply_ids))
+
+    return [{
+        'ID': supply_id,
+        'name': name,
+        'on_hand': stock,
+        'min_level': min_level,
+        'unit': unit or 'шт',
+        'low': min_level is not None and stock <= min_level,
+        'updated_at': updated_at
+    } for supply_id, name, stock, min_level, unit, updated_at in session.execute(query)]
+
+
+# Расход материалов за период по дневным итогам (не больше 366 строк на материал)
+def period_usage(session, start_date, end_date):
+    rows = session.execute(
+        select(SupplyDailyUsage.id_supplies, Supplies.name,
+               func.sum(SupplyDailyUsage.quantity), func.sum(SupplyDailyUsage.cost)).
+        join(Supplies, SupplyDailyUsage.id_supplies == Supplies.ID).
+        where(SupplyDailyUsage.day >= _day(start_date), SupplyDailyUsage.day <= _day(end_date)).
+        group_by(SupplyDailyUsage.id_supplies, Supplies.name).
+        order_by(SupplyDailyUsage.id_supplies)
+    )
+    return [{'ID': supply_id, 'name': name, 'quantity': quantity, 'cost': cost}
+            for supply_id, name, quantity, cost in rows if abs(quantity or 0) > EPSILON]
+
+
+def _expected_stock(session):
+    return dict(session.execute(
+        select(SupplyLedger.id_supplies, func.sum(SupplyLedger.quantity)).group_by(SupplyLedger.id_supplies)
+    ).all())
+
+
+def _expected_usage(session):
+    rows = session.execute(
+        select(SupplyLedger.day, SupplyLedger.id_supplies,
+               (-func.sum(SupplyLedger.quantity)).label('quantity'), (-func.sum(SupplyLedger.cost)).label('cost')).
+        where(SupplyLedger.id_record.is_not(None), SupplyLedger.day.is_not(None)).
+        group_by(SupplyLedger.day, SupplyLedger.id_supplies)
+    )
+    return {(_day(day), supply_id): (quantity, cost) for day, supply_id, quantity, cost in rows}
+
+
+# Пересчет остатков и дневного расхода по журналу (пороги остатка сохраняются)
+def rebuild_inventory(session):
+    now = datetime.datetime.now()
+    stock = _expected_stock(session)
+    stock_table = SupplyStock.__table__
+    _insert_missing(session, stock_table, [{'id_supplies': supply_id, 'on_hand': 0} for supply_id in stock])
+    session.execute(update(SupplyStock).values(on_hand=0))
+    if stock:
+        session.connection().execute(
+            update(stock_table).
+            where(stock_table.c.id_supplies == bindparam('b_supply')).
+            values(on_hand=bindparam('b_on_hand'), updated_at=bindparam('b_now')),
+            [{'b_supply': supply_id, 'b_on_hand': on_hand, 'b_now': now} for supply_id, on_hand in stock.items()]
+        )
+
+    usage = _expected_usage(session)
+    session.execute(delete(SupplyDailyUsage))
+    rows = [{'day': day, 'id_supplies': supply_id, 'quantity': quantity, 'cost': cost}
+            for (day, supply_id), (quantity, cost) in usage.items() if abs(quantity) > EPSILON]
+    if rows:
+        session.execute(insert(SupplyDailyUsage), rows)
+    return {'supplies': len(stock), 'usage_rows': len(rows)}
+
+
+# Сверка остатков и дневного расхода с журналом
+def check_inventory(session, tolerance=0.001):
+    mismatches = []
+    expected_stock = _expected_stock(session)
+    stored_stock = dict(session.execute(select(SupplyStock.id_supplies, SupplyStock.on_hand)).all())
+    for supply_id in expected_stock.keys() | stored_stock.keys():
+        want, have = expected_stock.get(supply_id, 0), stored_stock.get(supply_id, 0)
+        if abs(want - have) > tolerance:
+            mismatches.append({'id_supplies': supply_id, 'expected_on_hand': want, 'stored_on_hand': have})
+
+    expected_usage = _expected_usage(session)
+    stored_usage = {(_day(day), supply_id): (quantity, cost) for day, supply_id, quantity, cost in session.execute(
+        select(SupplyDailyUsage.day, SupplyDailyUsage.id_supplies, SupplyDailyUsage.quantity, SupplyDailyUsage.cost)
+    )}
+    for key in expected_usage.keys() | stored_usage.keys():
+        want, have = expected_usage.get(key, (0, 0)), stored_usage.get(key, (0, 0))
+        if abs(want[0] - have[0]) > tolerance or abs(want[1] - have[1]) > tolerance:
+            mismatches.append({'day': key[0].isoformat(), 'id_supplies': key[1],
+                               'expected_usage': want, 'stored_usage': have})
+    return mismatches
+
+
+# Списание для записей, у которых его еще нет (записи до включения учета, импорт).
+# История проводится задним числом: расход по дням появляется, а остаток не меняется -
+# его уравновешивает начальная проводка по каждому материалу.
+def backfill_ledger(session):
+    now = datetime.datetime.now()
+    unposted = select(Record.ID, Record.date, ServicesSupplies.id_supplies,
+                      ServicesSupplies.material_consumption, func.coalesce(Supplies.price, 0).label('price')). \
+        join(ServicesSupplies, ServicesSupplies.id_services == Record.id_services). \
+        join(Supplies, ServicesSupplies.id_supplies == Supplies.ID). \
+        where(ServicesSupplies.material_consumption.is_not(None),
+              ServicesSupplies.material_consumption != 0,
+              ~exists().where(SupplyLedger.id_record == Record.ID)).subquery()
+
+    totals = session.execute(
+        select(unposted.c.id_supplies, func.sum(unposted.c.material_consumption),
+               func.sum(unposted.c.material_consumption * unposted.c.price)).
+        group_by(unposted.c.id_supplies)
+    ).all()
+    if not totals:
+        return 0
+
+    consumed = session.execute(insert(SupplyLedger).from_select(
+        ['id_supplies', 'id_record', 'day', 'quantity', 'cost', 'kind', 'created_at'],
+        select(unposted.c.id_supplies, unposted.c.ID, func.date(unposted.c.date),
+               -unposted.c.material_consumption, -unposted.c.material_consumption * unposted.c.price,
+               literal('consume'), literal(now, SupplyLedger.created_at.type))
+    )).rowcount
+    session.execute(insert(SupplyLedger), [
+        _entry(supply_id, quantity, cost, 'opening', now, comment='Начальный остаток для истории записей')
+        for supply_id, quantity, cost in totals
+    ])
+    rebuild_inventory(session)
+    return consumed
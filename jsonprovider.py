@@ -0,0 +1,47 @@
+import datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+JSON_PROVIDERS = ('auto', 'orjson', 'default')
+
+
+# Стандартный json, но даты - в ISO 8601 (как isoformat()), а не в формате HTTP-заголовков.
+# Обработчики отдают datetime как есть, без isoformat() на каждую строку.
+class IsoJSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(o):
+        if isinstance(o, (datetime.date, datetime.datetime)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+# orjson: сериализация в C, даты ISO 8601 без вызова default; ответ собирается сразу из bytes
+class OrjsonProvider(IsoJSONProvider):
+    def __init__(self, app):
+        super().__init__(app)
+        import orjson
+        self._orjson = orjson
+        self._options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return self._orjson.dumps(obj, default=IsoJSONProvider.default, option=self._options).decode()
+
+    def loads(self, s, **kwargs):
+        return self._orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = self._orjson.dumps(obj, default=IsoJSONProvider.default, option=self._options)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def create_json_provider(app, name='auto'):
+    if name not in JSON_PROVIDERS:
+        raise ValueError(f'Неизвестный JSON_PROVIDER: {name}')
+    if name in ('auto', 'orjson'):
+        try:
+            return OrjsonProvider(app)
+        except ImportError:
+            if name == 'orjson':
+                raise ValueError('Для JSON_PROVIDER=orjson нужен пакет orjson (pip install orjson)')
+    return IsoJSONProvider(app)
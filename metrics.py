@@ -0,0 +1,196 @@
+import bisect
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, request
+from flask.json.provider import JSONProvider
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_label_value(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# Гистограмма в формате Prometheus: счетчики по корзинам, сумма и количество наблюдений для каждого набора меток
+class Histogram:
+    def __init__(self, name, description, buckets, label_names):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ['+Inf'], values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {values[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, description, label_names):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {value}')
+        return lines
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+# Время сериализации ответа (jsonify) - отдельно от времени обработчика и базы.
+# Оборачивает настроенный провайдер (стандартный json или orjson).
+class TimedJSONProvider(JSONProvider):
+    def __init__(self, app, inner):
+        super().__init__(app)
+        self.inner = inner
+
+    @staticmethod
+    def _add_time(started):
+        if has_request_context():
+            g.metrics_json_time = g.get('metrics_json_time', 0.0) + time.perf_counter() - started
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.inner.dumps(obj, **kwargs)
+        finally:
+            self._add_time(started)
+
+    def loads(self, s, **kwargs):
+        return self.inner.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.inner.response(*args, **kwargs)
+        finally:
+            self._add_time(started)
+
+
+# Метрики запросов: длительность по маршрутам, время в базе и сериализации, число SQL-запросов,
+# медленные запросы в лог. Счетчики свои у каждого процесса (воркера).
+class Instrumentation:
+    def __init__(self, slow_query_ms=200):
+        self.slow_query = slow_query_ms / 1000
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Длительность обработки запроса', LATENCY_BUCKETS,
+            ('method', 'route', 'status'))
+        self.db_duration = Histogram(
+            'http_request_db_seconds', 'Время SQL-запросов за один HTTP-запрос', LATENCY_BUCKETS,
+            ('method', 'route'))
+        self.json_duration = Histogram(
+            'http_request_json_seconds', 'Время сериализации JSON за один HTTP-запрос', LATENCY_BUCKETS,
+            ('method', 'route'))
+        self.query_count = Histogram(
+            'http_request_queries', 'Число SQL-запросов за один HTTP-запрос', QUERY_COUNT_BUCKETS,
+            ('method', 'route'))
+        self.slow_queries = Counter(
+            'db_slow_queries_total', 'SQL-запросы дольше порога', ('route',))
+
+    def init_app(self, app, engine):
+        app.json = TimedJSONProvider(app, app.json)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        self.instrument_engine(engine)
+
+    def instrument_engine(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_query)
+        event.listen(engine, 'after_cursor_execute', self._after_query)
+        event.listen(engine, 'handle_error', self._failed_query)
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_db_time = 0.0
+        g.metrics_json_time = 0.0
+        g.metrics_queries = 0
+
+    def _after_request(self, response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+
+        duration = time.perf_counter() - started
+        db_time = g.get('metrics_db_time', 0.0)
+        json_time = g.get('metrics_json_time', 0.0)
+        labels = (request.method, _route())
+        self.request_duration.observe(labels + (response.status_code,), duration)
+        self.db_duration.observe(labels, db_time)
+        self.json_duration.observe(labels, json_time)
+        self.query_count.observe(labels, g.metrics_queries)
+
+        response.headers['Server-Timing'] = (f'db;dur={db_time * 1000:.1f}, json;dur={json_time * 1000:.1f}, '
+                                             f'total;dur={duration * 1000:.1f}')
+        return response
+
+    @staticmethod
+    def _before_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+    @staticmethod
+    def _failed_query(context):
+        started = context.connection.info.get('metrics_query_started') if context.connection else None
+        if started:
+            started.pop()
+
+    def _after_query(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_query_started'].pop()
+        route = _route() if has_request_context() else 'background'
+
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_db_time += elapsed
+            g.metrics_queries += 1
+
+        if elapsed >= self.slow_query:
+            self.slow_queries.inc((route,))
+            logger.warning('Медленный запрос %.0f мс (%s): %s', elapsed * 1000, route, ' '.join(statement.split())[:1000])
+
+    def render(self):
+        lines = []
+        for metric in (self.request_duration, self.db_duration, self.json_duration, self.query_count,
+                       self.slow_queries):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
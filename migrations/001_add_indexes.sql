@@ -0,0 +1,17 @@
+--
+-- Индексы для фильтра по дате в финансовых отчетах и для проверок связей при удалении.
+-- Те же индексы объявлены в models_auto.py и создаются командой "flask init-db"
+-- (или при старте с SCHEMA_BOOTSTRAP=upgrade).
+-- Этот файл - для ручного применения на рабочей базе без блокировки записи:
+--     psql -d tattoo -f migrations/001_add_indexes.sql
+--
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS record_date_idx ON public.record USING btree (date);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS record_id_customers_idx ON public.record USING btree (id_customers);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS record_id_services_idx ON public.record USING btree (id_services);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS services_supplies_id_services_idx ON public.services_supplies USING btree (id_services);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS services_supplies_id_supplies_idx ON public.services_supplies USING btree (id_supplies);
@@ -0,0 +1,24 @@
+--
+-- Поиск клиентов (/customers/search).
+-- Колонки customers.search_name, customers.phone_digits и btree-индексы по ним (text_pattern_ops,
+-- для поиска по началу строки) объявлены в models_auto.py и создаются командой "flask init-db"
+-- (или при старте с SCHEMA_BOOTSTRAP=upgrade); там же заполняются ключи существующих клиентов.
+-- Этот файл создает те же колонки и индексы, а также триграммные индексы для поиска по середине строки
+-- (имя без фамилии, конец телефона). Применяется вручную на рабочей базе без блокировки записи:
+--     psql -d tattoo -f migrations/002_customer_search.sql
+-- После него "flask init-db" заполнит ключи поиска существующих клиентов.
+--
+
+ALTER TABLE public.customers ADD COLUMN IF NOT EXISTS search_name character varying;
+
+ALTER TABLE public.customers ADD COLUMN IF NOT EXISTS phone_digits character varying;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS customers_search_name_idx ON public.customers USING btree (search_name text_pattern_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS customers_phone_digits_idx ON public.customers USING btree (phone_digits text_pattern_ops);
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS customers_search_name_trgm_idx ON public.customers USING gin (search_name gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS customers_phone_digits_trgm_idx ON public.customers USING gin (phone_digits gin_trgm_ops);
@@ -0,0 +1,17 @@
+--
+-- Расписание записей: длительность услуги, конец записи и индекс по интервалу записи.
+-- Индекс record_schedule_idx (date, end_date) покрывает и фильтр по дате в финансовых отчетах,
+-- поэтому одноколоночный record_date_idx из 001_add_indexes.sql удаляется.
+-- Те же изменения делает команда "flask init-db" (или старт с SCHEMA_BOOTSTRAP=upgrade).
+-- Этот файл - для ручного применения на рабочей базе без блокировки записи:
+--     psql -d tattoo -f migrations/003_record_schedule.sql
+-- После него "flask init-db" рассчитает record.end_date для существующих записей.
+--
+
+ALTER TABLE public.services ADD COLUMN IF NOT EXISTS duration integer;
+
+ALTER TABLE public.record ADD COLUMN IF NOT EXISTS end_date timestamp without time zone;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS record_schedule_idx ON public.record USING btree (date, end_date);
+
+DROP INDEX CONCURRENTLY IF EXISTS public.record_date_idx;
@@ -0,0 +1,12 @@
+--
+-- Аналитика клиентов: индекс визитов клиента (id_customers, date, id_services).
+-- Он покрывает и проверку записей клиента при удалении, поэтому одноколоночный
+-- record_id_customers_idx из 001_add_indexes.sql удаляется.
+-- Те же изменения делает команда "flask init-db" (или старт с SCHEMA_BOOTSTRAP=upgrade).
+-- Этот файл - для ручного применения на рабочей базе без блокировки записи:
+--     psql -d tattoo -f migrations/004_customer_visits.sql
+--
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS record_customer_visits_idx ON public.record USING btree (id_customers, date, id_services);
+
+DROP INDEX CONCURRENTLY IF EXISTS public.record_id_customers_idx;
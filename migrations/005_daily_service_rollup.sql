@@ -0,0 +1,17 @@
+--
+-- Дневная свертка выручки и расходов по услугам для месячных и годовых отчетов.
+-- Та же таблица объявлена в models_auto.py и создается командой "flask init-db"
+-- (или при старте с SCHEMA_BOOTSTRAP=upgrade) - тогда она сразу заполняется по существующим записям.
+-- Этот файл - для ручного применения на рабочей базе:
+--     psql -d tattoo -f migrations/005_daily_service_rollup.sql
+-- После него свертку нужно заполнить командой "flask rollup-rebuild".
+--
+
+CREATE TABLE IF NOT EXISTS public.daily_service_rollup (
+    day date NOT NULL,
+    id_services integer NOT NULL,
+    records_count integer NOT NULL,
+    revenue integer NOT NULL,
+    material_cost double precision NOT NULL,
+    CONSTRAINT daily_service_rollup_pkey PRIMARY KEY (day, id_services)
+);
@@ -0,0 +1,23 @@
+--
+-- Служебные таблицы команды "flask import-data": прогресс загрузки по источникам и таблицам
+-- и соответствие ID клиентов источника клиентам в базе (после слияния по телефону).
+-- Те же таблицы объявлены в models_auto.py и создаются командой "flask init-db"
+-- (или при старте с SCHEMA_BOOTSTRAP=upgrade).
+-- Этот файл - для ручного применения на рабочей базе:
+--     psql -d tattoo -f migrations/006_import_progress.sql
+--
+
+CREATE TABLE IF NOT EXISTS public.import_progress (
+    source character varying NOT NULL,
+    table_name character varying NOT NULL,
+    rows_done integer NOT NULL,
+    updated_at timestamp without time zone,
+    CONSTRAINT import_progress_pkey PRIMARY KEY (source, table_name)
+);
+
+CREATE TABLE IF NOT EXISTS public.import_customer_map (
+    source character varying NOT NULL,
+    source_id integer NOT NULL,
+    target_id integer NOT NULL,
+    CONSTRAINT import_customer_map_pkey PRIMARY KEY (source, source_id)
+);
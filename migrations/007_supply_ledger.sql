@@ -0,0 +1,41 @@
+--
+-- Складской учет материалов: журнал движений (источник истины), остатки и дневной расход.
+-- Те же таблицы и индексы объявлены в models_auto.py и создаются командой "flask init-db"
+-- (или при старте с SCHEMA_BOOTSTRAP=upgrade) - тогда списание по существующим записям проводится сразу.
+-- Этот файл - для ручного применения на рабочей базе:
+--     psql -d tattoo -f migrations/007_supply_ledger.sql
+-- После него списание по существующим записям проводит команда "flask inventory-rebuild".
+--
+
+CREATE TABLE IF NOT EXISTS public.supply_ledger (
+    "ID" serial NOT NULL,
+    id_supplies integer NOT NULL,
+    id_record integer,
+    day date,
+    quantity double precision NOT NULL,
+    cost double precision NOT NULL,
+    kind character varying NOT NULL,
+    comment character varying,
+    created_at timestamp without time zone,
+    CONSTRAINT supply_ledger_pkey PRIMARY KEY ("ID")
+);
+
+CREATE INDEX IF NOT EXISTS supply_ledger_id_record_idx ON public.supply_ledger USING btree (id_record);
+
+CREATE INDEX IF NOT EXISTS supply_ledger_supply_day_idx ON public.supply_ledger USING btree (id_supplies, day);
+
+CREATE TABLE IF NOT EXISTS public.supply_stock (
+    id_supplies integer NOT NULL,
+    on_hand double precision NOT NULL,
+    min_level double precision,
+    updated_at timestamp without time zone,
+    CONSTRAINT supply_stock_pkey PRIMARY KEY (id_supplies)
+);
+
+CREATE TABLE IF NOT EXISTS public.supply_daily_usage (
+    day date NOT NULL,
+    id_supplies integer NOT NULL,
+    quantity double precision NOT NULL,
+    cost double precision NOT NULL,
+    CONSTRAINT supply_daily_usage_pkey PRIMARY KEY (day, id_supplies)
+);
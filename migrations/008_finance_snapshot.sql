@@ -0,0 +1,19 @@
+--
+-- Снимки финансовых отчетов за текущие и прошлые день, месяц и год.
+-- Та же таблица объявлена в models_auto.py и создается командой "flask init-db"
+-- (или при старте с SCHEMA_BOOTSTRAP=upgrade).
+-- Этот файл - для ручного применения на рабочей базе:
+--     psql -d tattoo -f migrations/008_finance_snapshot.sql
+-- Снимки строит процесс "flask finance-snapshots --loop".
+--
+
+CREATE TABLE IF NOT EXISTS public.finance_snapshot (
+    period character varying NOT NULL,
+    start_date timestamp without time zone NOT NULL,
+    end_date timestamp without time zone NOT NULL,
+    payload text,
+    version integer NOT NULL,
+    built_version integer,
+    built_at timestamp without time zone,
+    CONSTRAINT finance_snapshot_pkey PRIMARY KEY (period, start_date)
+);
@@ -1,7 +1,7 @@
 from typing import Optional
 import datetime
 
-from sqlalchemy import DateTime, ForeignKeyConstraint, Integer, PrimaryKeyConstraint, REAL, String, UniqueConstraint
+from sqlalchemy import Date, DateTime, Float, ForeignKeyConstraint, Index, Integer, PrimaryKeyConstraint, REAL, String, Text, UniqueConstraint
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 class Base(DeclarativeBase):
@@ -12,7 +12,9 @@ class Customers(Base):
     __tablename__ = 'customers'
     __table_args__ = (
         PrimaryKeyConstraint('ID', name='customers_pkey'),
-        UniqueConstraint('phone', name='mobile_phone')
+        UniqueConstraint('phone', name='mobile_phone'),
+        Index('customers_search_name_idx', 'search_name', postgresql_ops={'search_name': 'text_pattern_ops'}),
+        Index('customers_phone_digits_idx', 'phone_digits', postgresql_ops={'phone_digits': 'text_pattern_ops'})
     )
 
     ID: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -20,6 +22,8 @@ class Customers(Base):
     name: Mapped[Optional[str]] = mapped_column(String)
     patronymic: Mapped[Optional[str]] = mapped_column(String)
     phone: Mapped[Optional[str]] = mapped_column(String)
+    search_name: Mapped[Optional[str]] = mapped_column(String)
+    phone_digits: Mapped[Optional[str]] = mapped_column(String)
 
     record: Mapped[list['Record']] = relationship('Record', back_populates='customers')
 
@@ -33,6 +37,7 @@ class Services(Base):
     ID: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[Optional[str]] = mapped_column(String)
     price: Mapped[Optional[int]] = mapped_column(Integer)
+    duration: Mapped[Optional[int]] = mapped_column(Integer)
 
     record: Mapped[list['Record']] = relationship('Record', back_populates='services')
     services_supplies: Mapped[list['ServicesSupplies']] = relationship('ServicesSupplies', back_populates='services')
@@ -56,7 +61,10 @@ class Record(Base):
     __table_args__ = (
         ForeignKeyConstraint(['id_customers'], ['customers.ID'], name='customer_fkey'),
         ForeignKeyConstraint(['id_services'], ['services.ID'], name='services_fkey'),
-        PrimaryKeyConstraint('ID', name='record_pkey')
+        PrimaryKeyConstraint('ID', name='record_pkey'),
+        Index('record_id_services_idx', 'id_services'),
+        Index('record_schedule_idx', 'date', 'end_date'),
+        Index('record_customer_visits_idx', 'id_customers', 'date', 'id_services')
     )
 
     ID: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -64,6 +72,7 @@ class Record(Base):
     id_services: Mapped[int] = mapped_column(Integer, nullable=False)
     date: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
     name: Mapped[Optional[str]] = mapped_column(String)
+    end_date: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
 
     customers: Mapped['Customers'] = relationship('Customers', back_populates='record')
     services: Mapped['Services'] = relationship('Services', back_populates='record')
@@ -74,7 +83,9 @@ class ServicesSupplies(Base):
     __table_args__ = (
         ForeignKeyConstraint(['id_services'], ['services.ID'], name='servis_fkey'),
         ForeignKeyConstraint(['id_supplies'], ['supplies.ID'], name='supplies_fkey'),
-        PrimaryKeyConstraint('ID', name='services_supplies_pkey')
+        PrimaryKeyConstraint('ID', name='services_supplies_pkey'),
+        Index('services_supplies_id_services_idx', 'id_services'),
+        Index('services_supplies_id_supplies_idx', 'id_supplies')
     )
 
     ID: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -85,3 +96,97 @@ class ServicesSupplies(Base):
 
     services: Mapped['Services'] = relationship('Services', back_populates='services_supplies')
     supplies: Mapped['Supplies'] = relationship('Supplies', back_populates='services_supplies')
+
+
+class DailyServiceRollup(Base):
+    __tablename__ = 'daily_service_rollup'
+    __table_args__ = (
+        PrimaryKeyConstraint('day', 'id_services', name='daily_service_rollup_pkey'),
+    )
+
+    day: Mapped[datetime.date] = mapped_column(Date)
+    id_services: Mapped[int] = mapped_column(Integer)
+    records_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    revenue: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    material_cost: Mapped[float] = mapped_column(Float, nullable=False, default=0)
+
+
+class ImportProgress(Base):
+    __tablename__ = 'import_progress'
+    __table_args__ = (
+        PrimaryKeyConstraint('source', 'table_name', name='import_progress_pkey'),
+    )
+
+    source: Mapped[str] = mapped_column(String)
+    table_name: Mapped[str] = mapped_column(String)
+    rows_done: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+
+
+class ImportCustomerMap(Base):
+    __tablename__ = 'import_customer_map'
+    __table_args__ = (
+        PrimaryKeyConstraint('source', 'source_id', name='import_customer_map_pkey'),
+    )
+
+    source: Mapped[str] = mapped_column(String)
+    source_id: Mapped[int] = mapped_column(Integer)
+    target_id: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class SupplyStock(Base):
+    __tablename__ = 'supply_stock'
+    __table_args__ = (
+        PrimaryKeyConstraint('id_supplies', name='supply_stock_pkey'),
+    )
+
+    id_supplies: Mapped[int] = mapped_column(Integer)
+    on_hand: Mapped[float] = mapped_column(Float, nullable=False, default=0)
+    min_level: Mapped[Optional[float]] = mapped_column(Float)
+    updated_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+
+
+class SupplyLedger(Base):
+    __tablename__ = 'supply_ledger'
+    __table_args__ = (
+        PrimaryKeyConstraint('ID', name='supply_ledger_pkey'),
+        Index('supply_ledger_id_record_idx', 'id_record'),
+        Index('supply_ledger_supply_day_idx', 'id_supplies', 'day')
+    )
+
+    ID: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id_supplies: Mapped[int] = mapped_column(Integer, nullable=False)
+    id_record: Mapped[Optional[int]] = mapped_column(Integer)
+    day: Mapped[Optional[datetime.date]] = mapped_column(Date)
+    quantity: Mapped[float] = mapped_column(Float, nullable=False)
+    cost: Mapped[float] = mapped_column(Float, nullable=False, default=0)
+    kind: Mapped[str] = mapped_column(String, nullable=False)
+    comment: Mapped[Optional[str]] = mapped_column(String)
+    created_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+
+
+class SupplyDailyUsage(Base):
+    __tablename__ = 'supply_daily_usage'
+    __table_args__ = (
+        PrimaryKeyConstraint('day', 'id_supplies', name='supply_daily_usage_pkey'),
+    )
+
+    day: Mapped[datetime.date] = mapped_column(Date)
+    id_supplies: Mapped[int] = mapped_column(Integer)
+    quantity: Mapped[float] = mapped_column(Float, nullable=False, default=0)
+    cost: Mapped[float] = mapped_column(Float, nullable=False, default=0)
+
+
+class FinanceSnapshot(Base):
+    __tablename__ = 'finance_snapshot'
+    __table_args__ = (
+        PrimaryKeyConstraint('period', 'start_date', name='finance_snapshot_pkey'),
+    )
+
+    period: Mapped[str] = mapped_column(String)
+    start_date: Mapped[datetime.datetime] = mapped_column(DateTime)
+    end_date: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False)
+    payload: Mapped[Optional[str]] = mapped_column(Text)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    built_version: Mapped[Optional[int]] = mapped_column(Integer)
+    built_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
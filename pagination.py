@@ -0,0 +1,110 @@
+import base64
+import datetime
+import json
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    payload = json.dumps([v.isoformat() if isinstance(v, datetime.datetime) else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise PaginationError('Неверный курсор')
+
+
+def parse_limit(value):
+    if value is None:
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('Неверный размер страницы')
+    if limit < 1:
+        raise PaginationError('Неверный размер страницы')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+# Разбор параметра sort вида "date" / "-date" по разрешенным колонкам
+def parse_sort(value, columns, default):
+    value = value or default
+    descending = value.startswith('-')
+    name = value.lstrip('-')
+    if name not in columns:
+        raise PaginationError('Неверная сортировка')
+    return name, columns[name], descending
+
+
+def parse_date(value, end_of_day=False):
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise PaginationError('Неверный формат даты')
+    try:
+        if len(value) == 10:
+            date = datetime.datetime.strptime(value, '%Y-%m-%d')
+            return date.replace(hour=23, minute=59, second=59, microsecond=999999) if end_of_day else date
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise PaginationError('Неверный формат даты')
+
+
+# Значение ключа из курсора: ID - целое число, значение колонки - строка, число или null
+def _cursor_values(cursor, is_datetime):
+    values = decode_cursor(cursor)
+    if not isinstance(values, list) or len(values) != 2:
+        raise PaginationError('Неверный курсор')
+    last_value, last_id = values
+    if not isinstance(last_id, int) or isinstance(last_id, bool) or isinstance(last_value, (bool, list, dict)):
+        raise PaginationError('Неверный курсор')
+    if is_datetime and last_value is not None:
+        last_value = parse_date(last_value)
+    return last_value, last_id
+
+
+# Постраничная выборка по ключу (sort_column, ID): без OFFSET, страница всегда читается по индексу.
+# Строки без значения ключа (NULL) идут в конце при любом направлении сортировки, между собой - по ID.
+# Они читаются отдельным запросом, когда строки со значением ключа закончились: условие "или NULL"
+# в одном запросе не дает базе читать диапазон индекса.
+def keyset_page(query, sort_column, id_column, descending, limit, cursor, row_key, is_datetime=False):
+    last_value, last_id = _cursor_values(cursor, is_datetime) if cursor else (None, None)
+    id_order = id_column.desc() if descending else id_column.asc()
+
+    if sort_column is id_column:
+        if cursor:
+            query = query.filter(id_column < last_id if descending else id_column > last_id)
+        rows = query.order_by(id_order).limit(limit + 1).all()
+    else:
+        rows = []
+        if not cursor or last_value is not None:
+            values = query.filter(sort_column.is_not(None))
+            if cursor:
+                # Нестрогая граница по ключу задает диапазон индекса, равные значения отсекаются по ID
+                if descending:
+                    values = values.filter(sort_column <= last_value, or_(
+                        sort_column < last_value, and_(sort_column == last_value, id_column < last_id)))
+                else:
+                    values = values.filter(sort_column >= last_value, or_(
+                        sort_column > last_value, and_(sort_column == last_value, id_column > last_id)))
+            rows = values.order_by(sort_column.desc() if descending else sort_column.asc(), id_order). \
+                limit(limit + 1).all()
+        if len(rows) <= limit:
+            tail = query.filter(sort_column.is_(None))
+            # Курсор уже в хвосте строк без значения ключа
+            if cursor and last_value is None:
+                tail = tail.filter(id_column < last_id if descending else id_column > last_id)
+            rows += tail.order_by(id_order).limit(limit + 1 - len(rows)).all()
+
+    page = rows[:limit]
+    return page, encode_cursor(row_key(page[-1])) if len(rows) > limit else None
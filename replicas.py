@@ -0,0 +1,147 @@
+import contextlib
+import functools
+import logging
+import random
+import threading
+import time
+
+from flask import g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.sql.dml import UpdateBase
+
+from configdb import REPLICA_BIND_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# Чтение с реплик (DB_REPLICA_URLS, движки replica_N из SQLALCHEMY_BINDS): обработчики, помеченные
+# read_replica, читают с одной из них, все остальное - с основной базы. Запись всегда идет в основную базу:
+# сессия переключается на нее при первом flush или INSERT/UPDATE/DELETE. После изменения клиент еще DB_REPLICA_LAG секунд читает с основной базы
+# (cookie), чтобы сразу видеть свои изменения, пока они доходят до реплик.
+
+PRIMARY_COOKIE = 'db_primary_until'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+# Движок для запроса выбирается по g.db_replica, который ставит ReplicaRouter
+class ReplicaRoutingMixin:
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = g.get('db_replica') if bind is None and has_app_context() else None
+        if replica is not None:
+            if not self._flushing and not isinstance(clause, UpdateBase):
+                return replica
+            # Запрос начал писать - дальше и чтение идет с основной базы, где видны его изменения
+            g.db_replica = None
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# Сессия db.session
+class RoutingSession(ReplicaRoutingMixin, Session):
+    pass
+
+
+# Синхронная часть AsyncSession в ASGI-входе (asgi.py)
+class AsyncRoutingSession(ReplicaRoutingMixin, OrmSession):
+    pass
+
+
+class ReplicaRouter:
+    def __init__(self, lag, retry_after=30):
+        self.lag = lag
+        self.retry_after = retry_after
+        self.engines = {}
+        self._down_until = {}
+        self._lock = threading.Lock()
+        self._stats = {'replica_reads': 0, 'sticky_reads': 0, 'fallback_reads': 0, 'failovers': 0}
+
+    def init_app(self, app, db):
+        with app.app_context():
+            self._use_engines({key: engine for key, engine in db.engines.items()
+                               if key and key.startswith(REPLICA_BIND_PREFIX)})
+        app.after_request(self._remember_write)
+
+    def _use_engines(self, engines):
+        self.engines = engines
+        for key, engine in engines.items():
+            event.listen(engine, 'handle_error', functools.partial(self._on_error, key))
+
+    # ASGI-вход: чтение с тех же реплик через асинхронные движки ({ключ replica_N: AsyncEngine})
+    def use_async_engines(self, async_engines):
+        self._use_engines({key: engine.sync_engine for key, engine in async_engines.items()})
+
+    @property
+    def enabled(self):
+        return bool(self.engines)
+
+    def _count(self, field):
+        with self._lock:
+            self._stats[field] += 1
+
+    # Недоступная реплика выключается на retry_after секунд; запросы в это время идут на другие реплики
+    def _on_error(self, key, context):
+        if context.is_disconnect or context.connection is None:
+            with self._lock:
+                self._down_until[key] = time.monotonic() + self.retry_after
+                self._stats['failovers'] += 1
+            logger.warning('Реплика %s недоступна, чтение на %s с переключается на другие базы', key, self.retry_after)
+
+    def _available(self):
+        now = time.monotonic()
+        with self._lock:
+            return [engine for key, engine in self.engines.items() if self._down_until.get(key, 0) <= now]
+
+    def _remember_write(self, response):
+        if self.enabled and request.method in WRITE_METHODS and response.status_code < 400:
+            response.set_cookie(PRIMARY_COOKIE, str(time.time() + self.lag), max_age=max(int(self.lag), 1),
+                                httponly=True, samesite='Lax')
+        return response
+
+    def _sticky(self):
+        try:
+            return float(request.cookies.get(PRIMARY_COOKIE) or 0) > time.time()
+        except ValueError:
+            return False
+
+    # Выбор базы для текущего запроса; только GET/HEAD, до первого обращения к сессии
+    def route(self):
+        if not self.enabled or request.method not in ('GET', 'HEAD'):
+            return
+        if self._sticky():
+            self._count('sticky_reads')
+            return
+        engines = self._available()
+        if not engines:
+            self._count('fallback_reads')
+            return
+        g.db_replica = random.choice(engines)
+        self._count('replica_reads')
+
+    def read_replica(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            self.route()
+            return view(*args, **kwargs)
+        return wrapper
+
+    # Участок, который должен читать с основной базы (например, данные, которые попадут в общий кэш)
+    @contextlib.contextmanager
+    def primary(self, when=True):
+        replica = g.pop('db_replica', None) if when and has_app_context() else None
+        try:
+            yield
+        finally:
+            if replica is not None and 'db_replica' not in g:
+                g.db_replica = replica
+
+    @staticmethod
+    def on_replica():
+        return has_app_context() and g.get('db_replica') is not None
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return dict(self._stats, replicas={
+                key: {'available': self._down_until.get(key, 0) <= now, 'url': engine.url.render_as_string()}
+                for key, engine in self.engines.items()
+            })
@@ -0,0 +1,186 @@
+import datetime
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+SHARED_EVENTS_KEY = 'finance_report'
+
+
+# Событие сброса в общем журнале: даты измененных записей, услуги или сброс всего
+def _encode_event(event):
+    if 'dates' in event:
+        return {'dates': [d.isoformat() for d in event['dates']]}
+    if 'services' in event:
+        return {'services': sorted(event['services'])}
+    return {'all': True}
+
+
+def _decode_event(event):
+    if 'dates' in event:
+        return {'dates': [datetime.datetime.fromisoformat(d) for d in event['dates']]}
+    if 'services' in event:
+        return {'services': set(event['services'])}
+    return {'all': True}
+
+
+class ReportCacheEntry:
+    def __init__(self, payload, start_date, end_date, service_ids):
+        self.payload = payload
+        self.start_date = start_date
+        self.end_date = end_date
+        self.service_ids = service_ids
+        self.created_at = time.monotonic()
+        body = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        self.etag = hashlib.sha1(body.encode()).hexdigest()
+
+    def affected_by(self, event):
+        if 'dates' in event:
+            return any(self.start_date <= d <= self.end_date for d in event['dates'])
+        if 'services' in event:
+            return bool(self.service_ids & event['services'])
+        return True
+
+
+# Кэш готовых финансовых отчетов по окну периода (start_date, end_date).
+# Запись вытесняется при изменении записи внутри окна или цены/расхода услуги из отчета.
+# С общим backend сброс публикуется в журнал событий, и другие воркеры вытесняют только затронутые окна.
+# Без него другие воркеры об изменениях не узнают - тогда отчет за открытое окно (текущее или будущее)
+# живет не дольше ttl секунд, отчеты за закрытые окна не устаревают по времени.
+class ReportCache:
+    def __init__(self, max_entries=256, backend=None, ttl=None):
+        self.max_entries = max_entries
+        self.backend = backend
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'expired': 0}
+        # Когда отчеты последний раз сбрасывались (здесь или, по общему журналу, в другом воркере)
+        self._changed_at = float('-inf')
+        # Номер последнего учтенного события общего журнала
+        self._shared_version = None
+        # Вызываются после сброса с датами измененных записей (None - сброшено все)
+        self._listeners = []
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, dates):
+        for callback in self._listeners:
+            callback(dates)
+
+    @staticmethod
+    def key(period, start_date, end_date):
+        return period, start_date, end_date
+
+    def _drop(self, event):
+        for key in [key for key, entry in self._entries.items() if entry.affected_by(event)]:
+            del self._entries[key]
+
+    # Применяет сбросы, опубликованные другими воркерами; возвращает номер последнего учтенного события
+    def _sync(self):
+        if not self.backend:
+            return 0
+        version = self.backend.version(SHARED_EVENTS_KEY)
+        with self._lock:
+            seen = self._shared_version
+        if seen == version:
+            return version
+        events = self.backend.events(SHARED_EVENTS_KEY, seen) if seen is not None else []
+        with self._lock:
+            if self._shared_version != seen:
+                return self._shared_version
+            # Журнал уже вытеснил часть событий - что изменилось, неизвестно
+            if events is None:
+                events = [(version, {'all': True})]
+            for _, event in events:
+                self._drop(_decode_event(event))
+            if events:
+                self._changed_at = time.monotonic()
+            self._shared_version = max([version] + [seq for seq, _ in events])
+            return self._shared_version
+
+    # Токен для put: если между begin и put был сброс, результат мог устареть
+    def begin(self):
+        shared_version = self._sync()
+        with self._lock:
+            return self._generation, shared_version
+
+    def get(self, key):
+        self._sync()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and self.ttl and entry.end_date >= datetime.datetime.now() \
+                    and time.monotonic() - entry.created_at > self.ttl:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, key, payload, start_date, end_date, token):
+        generation, shared_version = token
+        service_ids = {r['service_id'] for r in payload['records']}
+        entry = ReportCacheEntry(payload, start_date, end_date, service_ids)
+
+        # Другие воркеры успели сбросить это окно или услуги из отчета
+        if self.backend and self._sync() != shared_version:
+            events = self.backend.events(SHARED_EVENTS_KEY, shared_version)
+            if events is None or any(entry.affected_by(_decode_event(event)) for _, event in events):
+                return entry
+
+        with self._lock:
+            if generation != self._generation:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    # Отчеты сбрасывались меньше seconds назад: реплика могла еще не получить изменения
+    def changed_within(self, seconds):
+        self._sync()
+        with self._lock:
+            return time.monotonic() - self._changed_at < seconds
+
+    def _evict(self, event):
+        with self._lock:
+            self._changed_at = time.monotonic()
+            self._generation += 1
+            self._stats['invalidations'] += 1
+            self._drop(event)
+        if self.backend:
+            seq = self.backend.publish(SHARED_EVENTS_KEY, _encode_event(event))
+            # Свое событие применять повторно не нужно, если до него не было чужих
+            with self._lock:
+                if self._shared_version == seq - 1:
+                    self._shared_version = seq
+
+    # Изменились записи с этими датами
+    def invalidate_dates(self, dates):
+        dates = [d for d in dates if isinstance(d, datetime.datetime)]
+        if dates:
+            self._evict({'dates': dates})
+            self._notify(dates)
+
+    # Изменились цены, названия или нормы расхода этих услуг
+    def invalidate_services(self, service_ids):
+        service_ids = set(service_ids)
+        if service_ids:
+            self._evict({'services': service_ids})
+            self._notify(None)
+
+    def clear(self):
+        self._evict({'all': True})
+        self._notify(None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
@@ -0,0 +1,195 @@
+import datetime
+
+from sqlalchemy import delete, func, insert, select, update
+
+from models_auto import Customers, Services, Supplies, Record, ServicesSupplies, DailyServiceRollup
+
+
+def _as_date(value):
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+# Ключ свертки (день, услуга) для записи
+def record_rollup_key(record):
+    if not record.date or record.id_services is None:
+        return None
+    return _as_date(record.date), record.id_services
+
+
+# Стоимость материалов на одну услугу по текущим ценам и нормам расхода
+def service_material_costs(session, service_ids=None):
+    query = select(ServicesSupplies.id_services, Supplies.price, ServicesSupplies.material_consumption). \
+        join(Supplies, ServicesSupplies.id_supplies == Supplies.ID)
+
+    if service_ids is not None:
+        query = query.where(ServicesSupplies.id_services.in_(service_ids))
+
+    # Считаем в Python так же, как строки расходов в отчете, чтобы суммы совпадали
+    costs = {}
+    for service_id, supply_price, consumption in session.execute(query):
+        costs[service_id] = costs.get(service_id, 0) + (supply_price or 0) * (consumption or 0)
+    return costs
+
+
+def service_prices(session, service_ids=None):
+    query = select(Services.ID, Services.price)
+    if service_ids is not None:
+        query = query.where(Services.ID.in_(service_ids))
+    return {service_id: price or 0 for service_id, price in session.execute(query)}
+
+
+# Услуги, в которых используется материал
+def services_using_supply(session, supply_id):
+    return set(session.scalars(
+        select(ServicesSupplies.id_services).where(ServicesSupplies.id_supplies == supply_id)
+    ))
+
+
+def _raw_counts_query():
+    day = func.date(Record.date).label('day')
+    return select(day, Record.id_services, func.count(Record.ID)). \
+        select_from(Record). \
+        join(Services, Record.id_services == Services.ID). \
+        join(Customers, Record.id_customers == Customers.ID). \
+        where(Record.date.is_not(None)). \
+        group_by(day, Record.id_services)
+
+
+def _rollup_row(day, service_id, count, prices, costs):
+    return {
+        'day': day,
+        'id_services': service_id,
+        'records_count': count,
+        'revenue': count * prices.get(service_id, 0),
+        'material_cost': count * costs.get(service_id, 0)
+    }
+
+
+# Пересчет ячеек (день, услуга) по исходным записям после изменения записей.
+# Пересчитывается весь прямоугольник дни x услуги затронутых ключей - одним запросом, что удобно и для пачек.
+def refresh_rollup(session, keys):
+    keys = {key for key in keys if key}
+    if not keys:
+        return
+
+    days = {day for day, _ in keys}
+    service_ids = {service_id for _, service_id in keys}
+    prices = service_prices(session, service_ids)
+    costs = service_material_costs(session, service_ids)
+
+    session.execute(delete(DailyServiceRollup).where(
+        DailyServiceRollup.day.in_(days), DailyServiceRollup.id_services.in_(service_ids)
+    ))
+
+    range_start = datetime.datetime.combine(min(days), datetime.time.min)
+    range_end = datetime.datetime.combine(max(days), datetime.time.min) + datetime.timedelta(days=1)
+    counts = session.execute(
+        _raw_counts_query().where(Record.id_services.in_(service_ids),
+                                  Record.date >= range_start,
+                                  Record.date < range_end)
+    )
+
+    rows = []
+    for day, service_id, count in counts:
+        day = _as_date(day)
+        if day in days:
+            rows.append(_rollup_row(day, service_id, count, prices, costs))
+    if rows:
+        session.execute(insert(DailyServiceRollup), rows)
+
+
+# Пересчет выручки и расходов после изменения цен или норм расхода (количество не меняется)
+def reprice_rollup(session, service_ids):
+    service_ids = {service_id for service_id in service_ids if service_id is not None}
+    if not service_ids:
+        return
+
+    prices = service_prices(session, service_ids)
+    costs = service_material_costs(session, service_ids)
+
+    for service_id in service_ids:
+        session.execute(
+            update(DailyServiceRollup).
+            where(DailyServiceRollup.id_services == service_id).
+            values(revenue=DailyServiceRollup.records_count * prices.get(service_id, 0),
+                   material_cost=DailyServiceRollup.records_count * costs.get(service_id, 0))
+        )
+
+
+def _expected_rollup(session):
+    prices = service_prices(session)
+    costs = service_material_costs(session)
+    return {
+        (_as_date(day), service_id): _rollup_row(_as_date(day), service_id, count, prices, costs)
+        for day, service_id, count in session.execute(_raw_counts_query())
+    }
+
+
+# Полное перестроение свертки по исходным таблицам
+def rebuild_rollup(session):
+    rows = list(_expected_rollup(session).values())
+    session.execute(delete(DailyServiceRollup))
+    if rows:
+        session.execute(insert(DailyServiceRollup), rows)
+    return len(rows)
+
+
+# Сверка свертки с исходными таблицами, возвращает список расхождений
+def check_rollup(session, tolerance=0.01):
+    expected = _expected_rollup(session)
+    stored = {
+        (row.day, row.id_services): row
+        for row in session.scalars(select(DailyServiceRollup))
+    }
+
+    mismatches = []
+    for key in expected.keys() | stored.keys():
+        want = expected.get(key)
+        have = stored.get(key)
+        if want is None or have is None or \
+                want['records_count'] != have.records_count or \
+                want['revenue'] != have.revenue or \
+                abs(want['material_cost'] - have.material_cost) > tolerance:
+            mismatches.append({
+                'day': key[0].isoformat(),
+                'id_services': key[1],
+                'expected': want and {k: want[k] for k in ('records_count', 'revenue', 'material_cost')},
+                'stored': have and {
+                    'records_count': have.records_count,
+                    'revenue': have.revenue,
+                    'material_cost': have.material_cost
+                }
+            })
+
+    return sorted(mismatches, key=lambda m: (m['day'], m['id_services']))
+
+
+# Сводные строки свертки за период: по услугам и по дням
+def query_rollup_service_stats(session, start_date, end_date):
+    rows = session.execute(
+        select(
+            DailyServiceRollup.id_services,
+            func.sum(DailyServiceRollup.records_count),
+            func.sum(DailyServiceRollup.revenue),
+            func.sum(DailyServiceRollup.material_cost)
+        ).
+        where(DailyServiceRollup.day >= start_date.date(), DailyServiceRollup.day <= end_date.date()).
+        group_by(DailyServiceRollup.id_services)
+    ).all()
+
+    return {service_id: {'count': count, 'total_revenue': revenue, 'material_cost': cost}
+            for service_id, count, revenue, cost in rows}
+
+
+def query_rollup_daily_revenue(session, start_date, end_date):
+    rows = session.execute(
+        select(DailyServiceRollup.day, func.sum(DailyServiceRollup.revenue)).
+        where(DailyServiceRollup.day >= start_date.date(), DailyServiceRollup.day <= end_date.date()).
+        group_by(DailyServiceRollup.day)
+    ).all()
+
+    return {_as_date(day): revenue for day, revenue in rows}
@@ -0,0 +1,223 @@
+import bisect
+import datetime
+
+from sqlalchemy import bindparam, func, select, update
+
+from models_auto import Record, Services
+
+# Расписание мастерской: запись занимает интервал [date, end_date), длительность берется из услуги
+# (services.duration в минутах, без нее - длительность по умолчанию). end_date хранится в записи
+# и вместе с date входит в индекс record_schedule_idx - это индекс занятых интервалов:
+# пересечения с интервалом [start, end) ищутся диапазоном date >= start - самая длинная услуга, date < end,
+# без просмотра всей истории записей.
+
+MAX_FREE_SLOTS = 50
+MAX_SEARCH_DAYS = 62
+BATCH_SIZE = 5000
+
+# Один замок на все расписание мастерской (pg_advisory_xact_lock): проверка пересечений и запись
+# выполняются под ним, поэтому две одновременные записи на одно время не проходят обе
+SCHEDULE_LOCK_KEY = 0x7a770001
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+# Запись пересекается с другими; conflicts - [{'ID': ..., 'conflicts_with': [...]}]
+class ScheduleConflict(Exception):
+    def __init__(self, conflicts):
+        super().__init__('Время уже занято другой записью')
+        self.conflicts = conflicts
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+def service_durations(session, default_duration, service_ids=None):
+    query = select(Services.ID, Services.duration)
+    if service_ids is not None:
+        query = query.where(Services.ID.in_({service_id for service_id in service_ids if service_id is not None}))
+    return {service_id: duration or default_duration for service_id, duration in session.execute(query)}
+
+
+def max_duration(session, default_duration):
+    longest = session.scalar(select(func.max(Services.duration)))
+    return datetime.timedelta(minutes=max(longest or 0, default_duration))
+
+
+def lock_schedule(session):
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(select(func.pg_advisory_xact_lock(SCHEDULE_LOCK_KEY)))
+
+
+# Пересчет end_date по дате и длительности услуги; возвращает {ID: (start, end)} для записей с датой
+def _update_ends(session, rows, default_duration):
+    durations = service_durations(session, default_duration, [service_id for _, _, service_id in rows])
+    intervals = {}
+    for record_id, start, service_id in rows:
+        start = _timestamp(start)
+        if start is not None:
+            intervals[record_id] = (start, start + datetime.timedelta(minutes=durations.get(service_id, default_duration)))
+
+    table = Record.__table__
+    statement = update(table).where(table.c.ID == bindparam('b_id')).values(end_date=bindparam('b_end_date'))
+    values = [{'b_id': record_id, 'b_end_date': intervals[record_id][1] if record_id in intervals else None}
+              for record_id, _, _ in rows]
+    for start in range(0, len(values), BATCH_SIZE):
+        session.connection().execute(statement, values[start:start + BATCH_SIZE])
+    return intervals
+
+
+# Занятые интервалы, пересекающие окно [start, end), по индексу (date, end_date)
+def booked_intervals(session, start, end, longest):
+    return session.execute(
+        select(Record.date, Record.end_date, Record.ID).
+        where(Record.date >= start - longest, Record.date < end, Record.end_date > start).
+        order_by(Record.date, Record.ID)
+    ).all()
+
+
+# Пересечения интервалов с остальными записями. Близкие интервалы проверяются одним запросом на группу.
+def find_conflicts(session, intervals, longest):
+    conflicts = []
+    pending = sorted(intervals.items(), key=lambda item: item[1])
+    group = []
+    for item in pending + [None]:
+        if group and (item is None or item[1][0] >= max(end for _, (_, end) in group) + longest):
+            booked = booked_intervals(session, group[0][1][0], max(end for _, (_, end) in group), longest)
+            for record_id, (start, end) in group:
+                overlapping = [other_id for other_start, other_end, other_id in booked
+                               if other_id != record_id and other_start < end and other_end > start]
+                if overlapping:
+                    conflicts.append({'ID': record_id, 'date': start, 'end_date': end,
+                                      'conflicts_with': overlapping})
+            group = []
+        if item is not None:
+            group.append(item)
+    return conflicts
+
+
+# Вызывается после записи изменений в той же транзакции: пересчитывает end_date и отклоняет пересечения.
+# Проверяются только записи, у которых сменились дата или услуга (before - значения до изменения):
+# правка имени в записи из старой истории с наложениями не должна падать.
+def sync_record_schedule(session, record_ids, default_duration, before=None):
+    record_ids = list(record_ids)
+    if not record_ids:
+        return
+    before = before or {}
+    lock_schedule(session)
+    rows = session.execute(
+        select(Record.ID, Record.date, Record.id_services).where(Record.ID.in_(record_ids))
+    ).all()
+    intervals = _update_ends(session, rows, default_duration)
+
+    moved = {}
+    for record_id, start, service_id in rows:
+        old = before.get(record_id)
+        if record_id in intervals and (old is None or _timestamp(old['date']) != _timestamp(start) or
+                                       old['id_services'] != service_id):
+            moved[record_id] = intervals[record_id]
+    if moved:
+        conflicts = find_conflicts(session, moved, max_duration(session, default_duration))
+        if conflicts:
+            raise ScheduleConflict(conflicts)
+
+
+# Пересчет end_date записей услуг (после смены длительности) или всех записей без end_date.
+# Наложения, возникшие из-за новой длительности, не отклоняются - их показывает schedule-check.
+def refresh_schedule(session, default_duration, service_ids=None):
+    query = select(Record.ID, Record.date, Record.id_services).order_by(Record.ID)
+    if service_ids is not None:
+        service_ids = list(service_ids)
+        if not service_ids:
+            return 0
+        query = query.where(Record.id_services.in_(service_ids))
+    else:
+        query = query.where(Record.end_date.is_(None), Record.date.is_not(None))
+    rows = session.execute(query).all()
+    _update_ends(session, rows, default_duration)
+    return len(rows)
+
+
+# Все пересечения записей, начинающихся в окне [start, end) (для проверки старых данных после импорта)
+def check_schedule(session, start, end, default_duration):
+    longest = max_duration(session, default_duration)
+    booked = booked_intervals(session, start, end, longest)
+    overlaps = []
+    open_intervals = []
+    for other_start, other_end, other_id in booked:
+        open_intervals = [(s, e, i) for s, e, i in open_intervals if e > other_start]
+        if start <= other_start < end:
+            overlaps += [(i, other_id) for _, _, i in open_intervals]
+        open_intervals.append((other_start, other_end, other_id))
+    return overlaps
+
+
+def _merge(intervals):
+    merged = []
+    for start, end, _ in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _align(moment, day_start, step):
+    offset = (moment - day_start) % step
+    return moment if not offset else moment + step - offset
+
+
+# Ближайшие свободные окна для услуги: в рабочие часы каждого дня, с шагом сетки step (минуты),
+# начиная с from_time. Занятые интервалы читаются одним запросом по индексу за все окно поиска.
+def free_slots(session, service_id, from_time, days, limit, open_hour, close_hour, step, default_duration):
+    durations = service_durations(session, default_duration, [service_id])
+    if service_id not in durations:
+        raise ScheduleError('Услуга не найдена')
+    if not 1 <= days <= MAX_SEARCH_DAYS:
+        raise ScheduleError(f'days должен быть от 1 до {MAX_SEARCH_DAYS}')
+    if not 1 <= limit <= MAX_FREE_SLOTS:
+        raise ScheduleError(f'limit должен быть от 1 до {MAX_FREE_SLOTS}')
+
+    duration = datetime.timedelta(minutes=durations[service_id])
+    step = datetime.timedelta(minutes=step)
+    first_day = datetime.datetime.combine(from_time.date(), datetime.time())
+    window_end = first_day + datetime.timedelta(days=days)
+    busy = _merge(booked_intervals(session, from_time, window_end, max_duration(session, default_duration)))
+    busy_starts = [start for start, _ in busy]
+
+    slots = []
+    for day in range(days):
+        day_start = first_day + datetime.timedelta(days=day, hours=open_hour)
+        day_end = first_day + datetime.timedelta(days=day, hours=close_hour)
+        moment = _align(max(day_start, from_time), day_start, step)
+        # Первый занятый интервал, который может задеть этот день
+        index = max(bisect.bisect_right(busy_starts, moment) - 1, 0)
+        while moment + duration <= day_end and len(slots) < limit:
+            while index < len(busy) and busy[index][1] <= moment:
+                index += 1
+            if index < len(busy) and busy[index][0] < moment + duration:
+                moment = _align(busy[index][1], day_start, step)
+                continue
+            slots.append({'start': moment, 'end': moment + duration})
+            moment += step
+        if len(slots) >= limit:
+            break
+    return slots
+
+
+# Длительность услуги из запроса: целое число минут или пусто (длительность по умолчанию)
+def parse_duration(value):
+    if value is None or value == '':
+        return None
+    try:
+        duration = int(value)
+    except (TypeError, ValueError):
+        raise ScheduleError('Длительность должна быть целым числом минут')
+    if duration <= 0:
+        raise ScheduleError('Длительность должна быть больше нуля')
+    return duration
@@ -0,0 +1,88 @@
+import datetime
+
+from sqlalchemy import inspect, text
+
+from models_auto import Base
+
+# Индексы, которые заменены более широкими: запросы по их колонкам покрывает префикс нового индекса
+OBSOLETE_INDEXES = {
+    'record': ('record_date_idx', 'record_id_customers_idx'),
+}
+
+
+# Проверка схемы: сравниваем таблицы, колонки и индексы моделей с тем, что есть в базе
+def inspect_schema(engine):
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    missing_tables = []
+    missing_columns = []
+    missing_indexes = []
+    obsolete_indexes = []
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            missing_tables.append(table.name)
+            continue
+
+        existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                missing_columns.append(f'{table.name}.{column.name}')
+
+        existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                missing_indexes.append(index.name)
+        obsolete_indexes += [name for name in OBSOLETE_INDEXES.get(table.name, ()) if name in existing_indexes]
+
+    return {
+        'ready': not (missing_tables or missing_columns or missing_indexes),
+        'missing_tables': missing_tables,
+        'missing_columns': missing_columns,
+        'missing_indexes': missing_indexes,
+        'obsolete_indexes': obsolete_indexes,
+        'checked_at': datetime.datetime.now().isoformat()
+    }
+
+
+# Создание недостающих таблиц, колонок и индексов и удаление замененных (команда "flask init-db").
+# На Postgres индексы существующих таблиц строятся и удаляются CONCURRENTLY - без блокировки записи
+def upgrade_schema(engine):
+    status = inspect_schema(engine)
+    if status['ready'] and not status['obsolete_indexes']:
+        return dict(status, created_tables=[], added_columns=[])
+
+    tables = Base.metadata.tables
+    preparer = engine.dialect.identifier_preparer
+
+    if status['missing_tables']:
+        Base.metadata.create_all(engine, tables=[tables[name] for name in status['missing_tables']])
+
+    with engine.begin() as conn:
+        for qualified_name in status['missing_columns']:
+            table_name, column_name = qualified_name.split('.', 1)
+            column = tables[table_name].columns[column_name]
+            ddl = 'ALTER TABLE {} ADD COLUMN {} {}'.format(
+                preparer.quote(table_name),
+                preparer.quote(column_name),
+                column.type.compile(dialect=engine.dialect)
+            )
+            if column.server_default is not None:
+                default = column.server_default.arg
+                ddl += ' DEFAULT {}'.format(getattr(default, 'text', default))
+            conn.execute(text(ddl))
+
+    concurrently = engine.dialect.name == 'postgresql'
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for table in tables.values():
+            for index in table.indexes:
+                if index.name in status['missing_indexes']:
+                    if concurrently:
+                        index.dialect_kwargs['postgresql_concurrently'] = True
+                    index.create(conn)
+        for name in status['obsolete_indexes']:
+            conn.execute(text('DROP INDEX {}{}'.format('CONCURRENTLY ' if concurrently else '', preparer.quote(name))))
+
+    return dict(inspect_schema(engine), created_tables=status['missing_tables'],
+                added_columns=status['missing_columns'])
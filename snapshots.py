@@ -0,0 +1,159 @@
+import datetime
+import json
+import logging
+import threading
+import time
+
+from sqlalchemy import and_, delete, insert, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql
+
+from finance import get_period_bounds
+from models_auto import FinanceSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Готовые финансовые отчеты за текущие и прошлые день, месяц и год (таблица finance_snapshot).
+# Их заранее строит один процесс "flask finance-snapshots --loop" (или фоновый поток веб-процесса),
+# а изменения записей, цен и норм расхода сбрасывают затронутые снимки. Отчет из снимка отдается, пока
+# снимок свежий; отчеты за произвольные даты в прошлом по-прежнему считаются в запросе.
+# Сброс увеличивает version снимка; построенный отчет сохраняется, только если version за время
+# построения не изменилась (иначе он мог не увидеть изменение) - так же, как токен в ReportCache.
+
+SNAPSHOT_PERIODS = ('day', 'month', 'year')
+
+
+def _previous_start(period, start_date):
+    if period == 'day':
+        return start_date - datetime.timedelta(days=1)
+    if period == 'month':
+        return (start_date - datetime.timedelta(days=1)).replace(day=1)
+    return start_date.replace(year=start_date.year - 1)
+
+
+# Окна снимков на момент now: [(период, начало, конец)] - текущие и предыдущие
+def snapshot_windows(now):
+    windows = []
+    for period in SNAPSHOT_PERIODS:
+        start_date, end_date = get_period_bounds(now, period)
+        windows.append((period, start_date, end_date))
+        windows.append((period, *get_period_bounds(_previous_start(period, start_date), period)))
+    return windows
+
+
+def is_snapshot_window(period, start_date, now):
+    return any(period == p and start_date == s for p, s, _ in snapshot_windows(now))
+
+
+def _insert_missing(session, rows):
+    if not rows:
+        return
+    table = FinanceSnapshot.__table__
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(postgresql.insert(table).on_conflict_do_nothing(), rows)
+    else:
+        session.execute(insert(table).prefix_with('OR IGNORE'), rows)
+
+
+def _key(period, start_date):
+    return and_(FinanceSnapshot.period == period, FinanceSnapshot.start_date == start_date)
+
+
+# Снимок окна: (отчет, если снимок свежий, иначе None; текущая version или None, если снимка нет)
+def read_snapshot(session, period, start_date, max_age, now):
+    row = session.execute(
+        select(FinanceSnapshot.payload, FinanceSnapshot.version, FinanceSnapshot.built_version,
+               FinanceSnapshot.built_at).where(_key(period, start_date))
+    ).first()
+    if row is None:
+        return None, None
+    fresh = row.payload is not None and row.built_version == row.version and \
+        row.built_at is not None and now - row.built_at <= datetime.timedelta(seconds=max_age)
+    return (json.loads(row.payload) if fresh else None), row.version
+
+
+# Сохраняет отчет, построенный при version; False - снимок успели сбросить, отчет мог устареть
+def store_snapshot(session, period, start_date, end_date, payload, version, now):
+    _insert_missing(session, [{'period': period, 'start_date': start_date, 'end_date': end_date, 'version': 0}])
+    result = session.execute(
+        update(FinanceSnapshot).
+        where(_key(period, start_date), FinanceSnapshot.version == version).
+        values(payload=payload, built_version=version, built_at=now).
+        execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+# Сброс снимков, в окна которых попадают даты; без дат - всех (изменились цены или нормы расхода)
+def invalidate_snapshots(session, dates=None):
+    statement = update(FinanceSnapshot).values(version=FinanceSnapshot.version + 1). \
+        execution_options(synchronize_session=False)
+    if dates is not None:
+        dates = [d for d in dates if isinstance(d, datetime.datetime)]
+        if not dates:
+            return
+        statement = statement.where(or_(*[
+            and_(FinanceSnapshot.start_date <= d, FinanceSnapshot.end_date >= d) for d in dates
+        ]))
+    session.execute(statement)
+
+
+# Перестраивает несвежие снимки текущих окон и удаляет снимки окон, которые уже не нужны.
+# build(period, base_date) возвращает JSON отчета. Каждый снимок сохраняется в своей транзакции.
+def refresh_snapshots(session, build, max_age, now, force=False):
+    windows = snapshot_windows(now)
+    session.execute(delete(FinanceSnapshot).where(
+        tuple_(FinanceSnapshot.period, FinanceSnapshot.start_date).not_in([(p, s) for p, s, _ in windows])
+    ))
+    _insert_missing(session, [{'period': period, 'start_date': start_date, 'end_date': end_date, 'version': 0}
+                              for period, start_date, end_date in windows])
+    session.commit()
+
+    refreshed = 0
+    # Снимок перестраивается заранее, на половине срока жизни, чтобы запросы не застали его устаревшим
+    for period, start_date, end_date in windows:
+        payload, version = read_snapshot(session, period, start_date, max_age / 2, now)
+        session.rollback()
+        if payload is not None and not force:
+            continue
+        body = build(period, start_date)
+        if store_snapshot(session, period, start_date, end_date, body, version, datetime.datetime.now()):
+            refreshed += 1
+        session.commit()
+    return refreshed
+
+
+# Фоновый поток: перестраивает снимки раз в interval секунд и сразу после сброса (wake).
+# Несколько сбросов подряд (пакет записей) сливаются в одно перестроение через delay секунд.
+class SnapshotWorker:
+    def __init__(self, run, interval=60, delay=1.0):
+        self.run = run
+        self.interval = interval
+        self.delay = delay
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'runs': 0, 'refreshed': 0, 'errors': 0, 'last_run': None}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='finance-snapshots', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            if self._wake.wait(self.interval):
+                self._wake.clear()
+                time.sleep(self.delay)
+            self._wake.clear()
+            try:
+                self.stats['refreshed'] += self.run()
+            except Exception:
+                self.stats['errors'] += 1
+                logger.exception('Не удалось перестроить снимки финансовых отчетов')
+            self.stats['runs'] += 1
+            self.stats['last_run'] = datetime.datetime.now().isoformat(timespec='seconds')
@@ -0,0 +1,35 @@
+// Поток изменений записей (/events, Server-Sent Events).
+// onRecordEvent получает событие record.created / record.updated / record.deleted,
+// onReload вызывается, когда события пропущены (reset) или пришел большой пакет (records.reload) -
+// тогда страница загружает данные заново. Браузер сам переподключается и передает Last-Event-ID.
+function subscribeRecordEvents(onRecordEvent, onReload) {
+    // Поток выключен на сервере (EVENTS_ENABLED) - страница перезагружает данные после своих изменений
+    if (!window.EventSource || document.body.dataset.events !== '1') {
+        return null;
+    }
+
+    const source = new EventSource('/events');
+    source.onmessage = function(message) {
+        const event = JSON.parse(message.data);
+        if (event.type === 'reset' || event.type === 'records.reload') {
+            onReload();
+        } else {
+            onRecordEvent(event);
+        }
+    };
+    return source;
+}
+
+// Поток подключен: свои изменения придут событием, перезагружать список после сохранения не нужно
+function isLive(source) {
+    return source !== null && source.readyState === EventSource.OPEN;
+}
+
+// Несколько вызовов подряд (например, пачка событий) сливаются в один
+function debounce(callback, delay) {
+    let timer = null;
+    return function() {
+        clearTimeout(timer);
+        timer = setTimeout(callback, delay);
+    };
+}
@@ -0,0 +1,45 @@
+import hashlib
+import os
+
+from flask import request
+
+
+# Отпечатки статических файлов: url_for('static', ...) добавляет ?v=<хэш содержимого>,
+# такие адреса кэшируются браузером надолго - новый файл получит новый адрес
+class StaticFingerprints:
+    def __init__(self, max_age=31536000):
+        self.max_age = max_age
+        self._versions = {}
+        self._static_folder = None
+
+    def init_app(self, app):
+        self._static_folder = app.static_folder
+        app.url_defaults(self._add_version)
+        app.after_request(self._cache_headers)
+
+    def version(self, filename):
+        path = os.path.join(self._static_folder, filename)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._versions.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        self._versions[filename] = (mtime, digest)
+        return digest
+
+    def _add_version(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            try:
+                values['v'] = self.version(values['filename'])
+            except OSError:
+                pass
+
+    def _cache_headers(self, response):
+        if request.endpoint == 'static' and request.args.get('v') and response.status_code in (200, 304):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+            response.cache_control.immutable = True
+        return response